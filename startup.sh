@@ -10,6 +10,12 @@ if [ $status -ne 0 ]; then
   exit $status
 fi
 
+# Start the return spreadsheet uploads worker (validates the uploads in background, see returns.uploads)
+python /app/manage_wl.py process_return_uploads --workers ${WL_RETURN_UPLOAD_WORKERS:-2} 2>&1 | logger -t wl_return_uploads &
+
+# Warm the dashboard cache in background once gunicorn accepts connections (see warm_dashboard_cache)
+(until (echo > /dev/tcp/localhost/8080) 2>/dev/null; do sleep 5; done; python /app/manage_wl.py warm_dashboard_cache) 2>&1 | logger -t wl_warm_dashboard_cache &
+
 # Start the second process
 gunicorn wildlifelicensing.wsgi --bind :8080 --config /app/gunicorn.ini
 status=$?
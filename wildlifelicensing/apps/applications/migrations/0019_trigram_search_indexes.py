@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from wildlifelicensing.apps.main.operations import AddTrigramIndexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wl_applications', '0018_auto_20170612_1013'),
+        ('wl_main', '0028_trigram_search_indexes'),
+    ]
+
+    operations = [
+        AddTrigramIndexes('wl_applications', 'Application', ['lodgement_number']),
+    ]
@@ -108,6 +108,12 @@ class Application(RevisionedMixin):
 
     variants = models.ManyToManyField(Variant, blank=True, through='ApplicationVariantLink')
 
+    class Meta:
+        indexes = [
+            # default order of the officer dashboard table, used for keyset paging
+            models.Index(fields=['processing_status', 'lodgement_number', 'id'], name='wl_app_status_lodgement_idx'),
+        ]
+
     def __str__(self):
         return self.reference
 
@@ -14,7 +14,8 @@ from preserialize.serialize import serialize
 from ledger.accounts.models import EmailUser, Document
 
 from wildlifelicensing.apps.main.mixins import OfficerRequiredMixin, OfficerOrAssessorRequiredMixin
-from wildlifelicensing.apps.main.helpers import get_all_officers, render_user_name
+from wildlifelicensing.apps.main.helpers import render_user_name
+from wildlifelicensing.apps.main.reference import get_officers, get_assessor_groups
 from wildlifelicensing.apps.main.serializers import WildlifeLicensingJSONEncoder
 from wildlifelicensing.apps.applications.models import Application, AmendmentRequest, Assessment, ApplicationUserAction
 from wildlifelicensing.apps.applications.forms import IDRequestForm, ReturnsRequestForm, AmendmentRequestForm, \
@@ -36,15 +37,13 @@ class ProcessView(OfficerOrAssessorRequiredMixin, TemplateView):
     template_name = 'wl/process/process_app.html'
 
     def _build_data(self, request, application):
-        officers = [{'id': officer.id, 'text': render_user_name(officer)} for officer in get_all_officers()]
+        officers = [{'id': pk, 'text': name} for pk, name in get_officers()]
         officers.insert(0, {'id': 0, 'text': 'Unassigned'})
 
-        current_ass_groups = [ass_request.assessor_group for ass_request in
-                              Assessment.objects.filter(application=application)]
+        current_ass_group_ids = set(Assessment.objects.filter(application=application).
+                                    values_list('assessor_group_id', flat=True))
 
-        ass_groups = [{'id': ass_group.id, 'text': ass_group.name} for ass_group in
-                      AssessorGroup.objects.all().exclude(id__in=[ass_group.pk for ass_group in current_ass_groups]).
-                          order_by('name')]
+        ass_groups = [{'id': pk, 'text': name} for pk, name in get_assessor_groups() if pk not in current_ass_group_ids]
 
         # extract and format the previous lodgements of the application
         previous_lodgements = []
@@ -7,3 +7,11 @@ class DashboardConfig(AppConfig):
     name = 'wildlifelicensing.apps.dashboard'
     label = 'wl_dashboard'
     verbose_name = 'dashboard'
+
+    run_once = False
+
+    def ready(self):
+        if not self.run_once:
+            from wildlifelicensing.apps.dashboard import signals
+
+        self.run_once = True
@@ -0,0 +1,54 @@
+import timeit
+
+from django.core.urlresolvers import reverse
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.management.base import BaseCommand
+
+from wildlifelicensing.apps.dashboard.views.base import reverse_url, static_url
+
+# the urls rendered for each row of the officer dashboard tables
+ROW_URLS = [
+    'wl_applications:process',
+    'wl_applications:view_application_pdf',
+    'wl_payments:manual_payment',
+    'wl_applications:amend_licence',
+    'wl_applications:renew_licence',
+    'wl_applications:reissue_licence',
+    'wl_main:licence_renewal_pdf',
+    'wl_returns:curate_return',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the time to render the row urls of a dashboard table page with reverse() and reverse_url()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help='Number of rows per page')
+        parser.add_argument('--pages', type=int, default=20, help='Number of pages to render')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        pages = options['pages']
+
+        def render_page_reverse():
+            for pk in range(rows):
+                for name in ROW_URLS:
+                    reverse(name, args=[pk])
+                static('wl/img/pdf.png')
+
+        def render_page_templates():
+            for pk in range(rows):
+                for name in ROW_URLS:
+                    reverse_url(name, pk)
+                static_url('wl/img/pdf.png')
+
+        for pk in range(rows):
+            for name in ROW_URLS:
+                assert reverse(name, args=[pk]) == reverse_url(name, pk)
+
+        reverse_time = timeit.timeit(render_page_reverse, number=pages) / pages
+        templates_time = timeit.timeit(render_page_templates, number=pages) / pages
+        self.stdout.write('{} rows x {} urls per page'.format(rows, len(ROW_URLS) + 1))
+        self.stdout.write('reverse():     {:.2f} ms per page'.format(reverse_time * 1000))
+        self.stdout.write('reverse_url(): {:.2f} ms per page'.format(templates_time * 1000))
+        self.stdout.write('speedup: x{:.1f}'.format(reverse_time / templates_time if templates_time else 0))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from wildlifelicensing.apps.dashboard.views.officer import DashboardOfficerTreeView
+from wildlifelicensing.apps.main.helpers import get_all_officers
+
+
+class Command(BaseCommand):
+    help = 'Compute and cache the dashboard tree counts for all the officers'
+
+    def handle(self, *args, **options):
+        officers = get_all_officers()
+        for officer in officers:
+            DashboardOfficerTreeView.get_tree_counts(officer)
+        self.stdout.write('Dashboard cache warmed for {} officer(s)'.format(officers.count()))
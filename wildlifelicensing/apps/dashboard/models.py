@@ -1 +1,19 @@
 from __future__ import unicode_literals
+
+from django.contrib.postgres.fields.jsonb import JSONField
+from django.db import models
+
+from ledger.accounts.models import EmailUser
+
+
+class TablePreferences(models.Model):
+    """
+    The state (order, search, page length and filters) of a dashboard datatable for a user.
+    Used instead of the session when settings.WL_DATATABLE_PREFERENCES_STORE is 'user' (see DataTableBaseView).
+    """
+    user = models.ForeignKey(EmailUser, on_delete=models.CASCADE)
+    table = models.CharField(max_length=100)
+    data = JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('user', 'table')
@@ -0,0 +1,25 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from wildlifelicensing.apps.applications.models import Application
+from wildlifelicensing.apps.dashboard.views.base import clear_url_templates
+from wildlifelicensing.apps.main.cache import bump_generation_on_commit
+from wildlifelicensing.apps.main.models import WildlifeLicence
+from wildlifelicensing.apps.returns.models import Return
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=Return)
+@receiver(post_delete, sender=Return)
+@receiver(post_save, sender=WildlifeLicence)
+@receiver(post_delete, sender=WildlifeLicence)
+def invalidate_dashboard_cache(sender, **kwargs):
+    bump_generation_on_commit(sender)
+
+
+@receiver(setting_changed)
+def reset_url_templates(setting, **kwargs):
+    if setting in ('ROOT_URLCONF', 'STATIC_URL', 'STATICFILES_STORAGE'):
+        clear_url_templates()
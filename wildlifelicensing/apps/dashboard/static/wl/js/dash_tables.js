@@ -20,7 +20,8 @@ define(
                 processing: true,
                 deferRender: true,
                 serverSide: true,
-                autowidth: true
+                autowidth: true,
+                infoCallback: renderInfo
             },
             dateFormat = 'DD/MM/YYYY',
             applicationsTable,
@@ -29,6 +30,7 @@ define(
             $applicationsLicenceTypeFilter,
             $applicationsStatusFilter,
             $applicationsAssigneeFilter,
+            $applicationsPaymentFilter,
             $applicationsResetFilterButton,
 
             $licencesLicenceTypeFilter,
@@ -41,6 +43,36 @@ define(
             $returnsStatusFilter,
             $returnsResetFilterButton;
 
+        function renderInfo(settings, start, end, max, total, pre) {
+            // the server can estimate the total count of large tables (see DataTableBaseView.COUNT_STRATEGY)
+            var json = this.api().ajax.json();
+            if (json && json.recordsEstimated) {
+                if (json.recordsFiltered !== json.recordsTotal) {
+                    return 'Showing ' + start + ' to ' + end + ' of ' + total.toLocaleString() +
+                        ' entries (filtered from about ' + max.toLocaleString() + ' total entries)';
+                }
+                return 'Showing ' + start + ' to ' + end + ' of about ' + total.toLocaleString() + ' entries';
+            }
+            return pre;
+        }
+
+        function initExportLinks() {
+            // export all the rows of a table with its current filters, search and order.
+            $('.table-export').click(function (e) {
+                var tables = {
+                        applications: applicationsTable,
+                        licences: licencesTable,
+                        returns: returnsTable
+                    },
+                    table = tables[$(this).data('table')];
+                e.preventDefault();
+                if (table) {
+                    window.location = table.ajax.url() + '?' +
+                        $.param($.extend({}, table.ajax.params(), {'export': $(this).data('format')}));
+                }
+            });
+        }
+
         function initFilters() {
             if (options.data.applications && options.data.applications.filters) {
                 initApplicationsFilters();
@@ -116,6 +148,7 @@ define(
                 $applicationsLicenceTypeFilter.prop('selectedIndex', 0).select2();
                 $applicationsStatusFilter.prop('selectedIndex', 0).select2();
                 $applicationsAssigneeFilter.prop('selectedIndex', 0).select2();
+                $applicationsPaymentFilter.prop('selectedIndex', 0).select2();
                 if (applicationsTable) {
                     applicationsTable.search('').ajax.reload();
                 }
@@ -166,6 +199,21 @@ define(
                     }
                 });
             }
+            // payment filter
+            if ($applicationsPaymentFilter.length && data.applications.filters.payment) {
+                _.forEach(data.applications.filters.payment.values, function (value) {
+                    $node = createOptionNode(value);
+                    $applicationsPaymentFilter.append($node);
+                });
+                if (data.applications.filters.payment.selected) {
+                    $applicationsPaymentFilter.val(data.applications.filters.payment.selected);
+                }
+                $applicationsPaymentFilter.on('change', function () {
+                    if (applicationsTable) {
+                        applicationsTable.ajax.reload();
+                    }
+                });
+            }
 
             if ($applicationsResetFilterButton.length) {
                 $applicationsResetFilterButton.on('click', function () {
@@ -443,6 +491,7 @@ define(
              * @param query.application_licence_type
              * @param query.application_status
              * @param query.application_assignee
+             * @param query.application_payment
              */
             function setApplicationsFilters(query) {
                 var $collapse = $('#applications-collapse');
@@ -457,6 +506,10 @@ define(
                 if (query.application_assignee) {
                     $applicationsAssigneeFilter.val(query.application_assignee);
                 }
+                if (query.application_payment) {
+                    $collapse.collapse('show');
+                    $applicationsPaymentFilter.val(query.application_payment);
+                }
             }
 
             /**
@@ -518,6 +571,7 @@ define(
                     applicationsLicenceTypeFilter: '#applications-filter-licence-type',
                     applicationsStatusFilter: '#applications-filter-status',
                     applicationsAssigneeFilter: '#applications-filter-assignee',
+                    applicationsPaymentFilter: '#applications-filter-payment',
                     applicationsResetFilterButton: '#reset-applications-filter-button',
 
                     licencesTable: '#licences-table',
@@ -558,6 +612,7 @@ define(
                 $applicationsLicenceTypeFilter = $(options.selectors.applicationsLicenceTypeFilter);
                 $applicationsStatusFilter = $(options.selectors.applicationsStatusFilter);
                 $applicationsAssigneeFilter = $(options.selectors.applicationsAssigneeFilter);
+                $applicationsPaymentFilter = $(options.selectors.applicationsPaymentFilter);
                 $applicationsResetFilterButton = $(options.selectors.applicationsResetFilterButton);
 
                 $licencesLicenceTypeFilter = $(options.selectors.licencesLicenceTypeFilter);
@@ -580,6 +635,7 @@ define(
                     setFilters(options.data.query);
                 }
                 initTables();
+                initExportLinks();
                 $applicationsResetFilterButton.removeClass('hidden');
                 $licencesResetFilterButton.removeClass('hidden');
                 $returnsResetFilterButton.removeClass('hidden');
@@ -10,15 +10,17 @@ define(
         return function (options) {
             var defaults = {
                 treeSelector: '#applications-table',
-                treeData: []
+                treeData: [],
+                treeParts: null,
+                partsURL: ''
             };
 
             options = $.extend({}, defaults, options);
-            $(function () {
-                var $tree = $(options.treeSelector);
+
+            function renderTree($tree, data) {
                 $tree.treeview(
                     {
-                        data: options.treeData,
+                        data: data,
                         showBorder: false,
                         enableLinks: true,
                         expandIcon: 'glyphicon glyphicon-plus',
@@ -28,6 +30,28 @@ define(
                         onhoverColor: '#FFFFFF',
                         showTags: true
                     });
+            }
+
+            function getPartsNodes() {
+                return $.map(options.treeParts, function (part) {
+                    return part.nodes;
+                });
+            }
+
+            $(function () {
+                var $tree = $(options.treeSelector);
+                if (options.treeParts) {
+                    // lazy tree: render the nodes without counts then replace the nodes of each part once loaded.
+                    renderTree($tree, getPartsNodes());
+                    $.each(options.treeParts, function (index, part) {
+                        $.getJSON(options.partsURL, {part: part.part}, function (data) {
+                            part.nodes = data.nodes;
+                            renderTree($tree, getPartsNodes());
+                        });
+                    });
+                } else {
+                    renderTree($tree, options.treeData);
+                }
             });
         };
     }
@@ -1,5 +1,24 @@
+import datetime
+import json
+
+from django.core.cache import cache
 from django.shortcuts import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from ledger.accounts.models import EmailUser
+
+from wildlifelicensing.apps.applications.models import Application
+from wildlifelicensing.apps.applications.tests.helpers import create_and_lodge_application, create_application
+from wildlifelicensing.apps.dashboard.models import TablePreferences
+from wildlifelicensing.apps.dashboard.views.base import get_processing_statuses_but_draft, get_licences_applications, \
+    TrigramSearch, build_keyset_query, estimate_count, DataTableBaseView, COUNT_CACHED, COUNT_ESTIMATED, reverse_url, \
+    annotate_licence_status, LICENCE_STATUS_UNISSUED, LICENCE_STATUS_RENEWED, LICENCE_STATUS_EXPIRED, \
+    LICENCE_STATUS_DUE_FOR_RENEWAL, LICENCE_STATUS_CURRENT, plan_related_lookups
+from wildlifelicensing.apps.main.models import WildlifeLicence
 from wildlifelicensing.apps.main.tests import helpers as helpers
+from wildlifelicensing.apps.returns.models import Return
+from wildlifelicensing.apps.returns.tests.helpers import create_return
 
 
 class RoutingViewTest(helpers.BasePermissionViewTestCase):
@@ -31,6 +50,373 @@ class TreeViewTest(helpers.BasePermissionViewTestCase):
         }
 
 
+class TreeViewCountsTest(helpers.BaseUserTestCase):
+    """
+    The tree counts are computed with aggregated queries. Check that they match the per status counts.
+    """
+    view_url = reverse('wl_dashboard:tree_officer')
+
+    def _get_nodes(self):
+        self.client.login(self.officer.email)
+        nodes = []
+        for part in ['user', 'global']:
+            response = self.client.get(self.view_url, {'part': part})
+            self.assertEqual(response.status_code, 200)
+            nodes += json.loads(response.content.decode('utf-8'))['nodes']
+        return {node['text']: node for node in nodes}
+
+    def test_lazy_tree(self):
+        self.client.login(self.officer.email)
+        response = self.client.get(self.view_url)
+        parts = json.loads(response.context['partsJSON'])
+        self.assertEqual([part['part'] for part in parts], ['user', 'global'])
+        # the page is rendered without the counts
+        for part in parts:
+            for node in part['nodes']:
+                self.assertEqual(node['tags'], [])
+        self.assertEqual(self.client.get(self.view_url, {'part': 'unknown'}).status_code, 404)
+
+    @staticmethod
+    def _get_children_tags(node):
+        return {child['text']: child['tags'] for child in node['nodes'] or []}
+
+    def test_applications_counts(self):
+        create_and_lodge_application(self.customer, assigned_officer=None)
+        create_and_lodge_application(self.customer, assigned_officer=self.officer)
+        issued = create_and_lodge_application(self.customer, assigned_officer=self.officer)
+        issued.processing_status = 'issued'
+        issued.save()
+
+        nodes = self._get_nodes()
+        statuses = get_processing_statuses_but_draft()
+        all_applications = Application.objects.filter(processing_status__in=[s[0] for s in statuses])
+        assigned_applications = all_applications.filter(assigned_officer=self.officer)
+
+        self.assertEqual(nodes['All applications']['tags'], [str(all_applications.count())])
+        self.assertEqual(nodes['My assigned applications']['tags'], [str(assigned_applications.count())])
+        expected_children = {}
+        expected_assigned_children = {}
+        for s_value, s_title in statuses:
+            if all_applications.filter(processing_status=s_value).exists():
+                expected_children[s_title] = [str(all_applications.filter(processing_status=s_value).count())]
+            if assigned_applications.filter(processing_status=s_value).exists():
+                expected_assigned_children[s_title] = \
+                    [str(assigned_applications.filter(processing_status=s_value).count())]
+        self.assertEqual(self._get_children_tags(nodes['All applications']), expected_children)
+        self.assertEqual(self._get_children_tags(nodes['My assigned applications']), expected_assigned_children)
+        self.assertEqual(expected_assigned_children.get('New'), ['1'])
+        self.assertEqual(expected_assigned_children.get('Issued'), ['1'])
+
+        self.assertEqual(nodes['All licences']['tags'], [str(WildlifeLicence.objects.count())])
+        self.assertEqual(nodes['All returns']['tags'],
+                         [str(Return.objects.exclude(status__in=['draft', 'future']).count())])
+
+    def test_on_behalf_counts(self):
+        create_and_lodge_application(self.customer, proxy_applicant=self.officer)
+
+        nodes = self._get_nodes()
+        self.assertIn('My proxy page', nodes)
+        self.assertEqual(self._get_children_tags(nodes['My proxy page'])['Pending Applications'], ['1'])
+
+    def test_counts_cache_invalidation(self):
+        application = create_and_lodge_application(self.customer, assigned_officer=self.officer)
+        nodes = self._get_nodes()
+        self.assertEqual(self._get_children_tags(nodes['My assigned applications']).get('New'), ['1'])
+
+        # a change of status must be reflected in the tree straight away
+        application.processing_status = 'ready_for_action'
+        application.save()
+        nodes = self._get_nodes()
+        children = self._get_children_tags(nodes['My assigned applications'])
+        self.assertNotIn('New', children)
+        self.assertEqual(children.get('Ready for Action'), ['1'])
+
+
+class LicencesApplicationsTest(TestCase):
+    def test_get_licences_applications(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        officer = helpers.get_or_create_default_officer()
+        renewed_licence = helpers.create_licence(customer, officer)
+        licence = helpers.create_licence(customer, officer)
+        orphan_licence = helpers.create_licence(customer, officer)
+        renewed_application = create_application(customer, licence=renewed_licence)
+        renewal = create_application(customer, previous_application=renewed_application, application_type='renewal')
+        application = create_application(customer, licence=licence)
+
+        with self.assertNumQueries(2):
+            result = get_licences_applications([renewed_licence, licence, orphan_licence])
+        self.assertEqual(result[renewed_licence.pk], (renewed_application, renewal))
+        self.assertEqual(result[licence.pk], (application, None))
+        self.assertEqual(result[orphan_licence.pk], (None, None))
+
+
+class LicenceStatusTest(TestCase):
+    def test_annotate_licence_status(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        officer = helpers.get_or_create_default_officer()
+        today = datetime.date.today()
+        unissued_licence = helpers.create_licence(customer, officer)
+        renewed_licence = helpers.create_licence(customer, officer)
+        due_licence = helpers.create_licence(customer, officer)
+        current_licence = helpers.create_licence(customer, officer)
+        for number, (licence, days) in enumerate([(renewed_licence, -1), (due_licence, 10), (current_licence, 100)]):
+            licence.licence_number = str(number + 1).zfill(7)
+            licence.licence_sequence = 1
+            licence.start_date = today - datetime.timedelta(days=365)
+            licence.end_date = today + datetime.timedelta(days=days)
+            licence.is_renewable = True
+            licence.save()
+        renewed_application = create_application(customer, licence=renewed_licence)
+        # the renewal licence is not issued yet
+        create_application(customer, previous_application=renewed_application, application_type='renewal')
+
+        statuses = dict(annotate_licence_status(WildlifeLicence.objects.all()).values_list('pk', 'lifecycle_status'))
+        self.assertEqual(statuses[unissued_licence.pk], LICENCE_STATUS_UNISSUED)
+        self.assertEqual(statuses[renewed_licence.pk], LICENCE_STATUS_RENEWED)
+        self.assertEqual(statuses[due_licence.pk], LICENCE_STATUS_DUE_FOR_RENEWAL)
+        self.assertEqual(statuses[current_licence.pk], LICENCE_STATUS_CURRENT)
+
+        # only renewed once the renewal licence is issued (customer view)
+        statuses = dict(annotate_licence_status(WildlifeLicence.objects.all(), replacing_issued_only=True).
+                        values_list('pk', 'lifecycle_status'))
+        self.assertEqual(statuses[renewed_licence.pk], LICENCE_STATUS_EXPIRED)
+
+
+class TrigramSearchTest(TestCase):
+    def test_search_and_rank(self):
+        smithson = helpers.create_random_user()
+        smithson.last_name = 'Smithson'
+        smithson.save()
+        smith = helpers.create_random_user()
+        smith.last_name = 'Smith'
+        smith.save()
+        jones = helpers.create_random_user()
+        jones.last_name = 'Jones'
+        jones.save()
+
+        search = TrigramSearch(['last_name', 'first_name'])
+        qs = EmailUser.objects.filter(search(None, 'smith'))
+        self.assertEqual(set(qs), {smith, smithson})
+        ranked = list(qs.annotate(search_rank=search.similarity('smith')).order_by('-search_rank'))
+        self.assertEqual(ranked, [smith, smithson])
+
+
+class KeysetQueryTest(TestCase):
+    def test_seek_matches_offset(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        for i in range(4):
+            create_and_lodge_application(customer)
+        order_by = ['-processing_status', '-lodgement_number', '-pk']
+        ordered = list(Application.objects.order_by(*order_by))
+        for i, application in enumerate(ordered):
+            values = (application.processing_status, application.lodgement_number, application.pk)
+            seek = Application.objects.filter(build_keyset_query(order_by, values)).order_by(*order_by)
+            self.assertEqual(list(seek), ordered[i + 1:])
+
+    def test_cursor_from_row(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        application = create_and_lodge_application(customer)
+        view = DataTableBaseView()
+        view.model = Application
+        view._keyset_order = ['-processing_status', '-lodgement_number', '-pk']
+        view._keyset_next_key = 'test_keyset_cursor'
+        # the cursor values are read from the row, without query
+        with self.assertNumQueries(0):
+            view._save_keyset_cursor(application)
+        self.assertEqual(list(cache.get(view._keyset_next_key)),
+                         [application.processing_status, application.lodgement_number, application.pk])
+
+
+class CountStrategyTest(TestCase):
+    def test_estimate_count(self):
+        self.assertIsInstance(estimate_count(Application.objects.all()), int)
+        self.assertEqual(estimate_count(Application.objects.none()), 0)
+
+    def test_cached_count(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        view = DataTableBaseView()
+        view.model = Application
+        view.COUNT_STRATEGY = COUNT_CACHED
+        create_application(customer)
+        expected = Application.objects.count()
+        self.assertEqual(view.count_records(Application.objects.all()), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(view.count_records(Application.objects.all()), expected)
+        # saving an application invalidates the count
+        create_application(customer)
+        self.assertEqual(view.count_records(Application.objects.all()), expected + 1)
+
+    def test_cached_count_empty_result(self):
+        view = DataTableBaseView()
+        view.model = Application
+        view.COUNT_STRATEGY = COUNT_CACHED
+        with self.assertNumQueries(0):
+            self.assertEqual(view.count_records(Application.objects.filter(pk__in=[])), 0)
+
+    def test_estimated_count_filtered(self):
+        customer = helpers.get_or_create_default_customer(include_default_profile=True)
+        create_application(customer)
+        view = DataTableBaseView()
+        view.model = Application
+        view.COUNT_STRATEGY = COUNT_ESTIMATED
+        view.COUNT_ESTIMATE_THRESHOLD = 0
+        view.counts_estimated = False
+        qs = Application.objects.filter(pk__gt=0)
+        # the filtered count is exact
+        self.assertEqual(view.count_records(qs, filtered=True), qs.count())
+        self.assertFalse(view.counts_estimated)
+        view.count_records(Application.objects.all())
+        self.assertTrue(view.counts_estimated)
+
+
+@override_settings(WL_DATATABLE_CACHE_TTL=60)
+class PageCacheTest(helpers.BaseUserTestCase):
+    view_url = reverse('wl_dashboard:data_application_officer')
+
+    def _get_data(self):
+        response = self.client.get(self.view_url, {'draw': 1, 'start': 0, 'length': 10})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_invalidation(self):
+        create_and_lodge_application(self.customer)
+        self.client.login(self.officer.email)
+        data = self._get_data()
+        self.assertEqual(data, self._get_data())
+        create_and_lodge_application(self.customer)
+        self.assertEqual(self._get_data()['recordsTotal'], data['recordsTotal'] + 1)
+
+    def test_bulk_renewal_not_cached(self):
+        """
+        The bulk renewal pdf view is a licences table view but must not use the page cache
+        """
+        self.client.login(self.officer.email)
+        url = reverse('wl_dashboard:bulk_licence_renewal_pdf')
+        for i in range(2):
+            response = self.client.get(url, {'draw': 1, 'start': 0, 'length': 10})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+
+
+class ReverseUrlTest(TestCase):
+    def test_same_as_reverse(self):
+        for pk in [1, 42, 1234567]:
+            self.assertEqual(reverse_url('wl_applications:process', pk),
+                             reverse('wl_applications:process', args=[pk]))
+            self.assertEqual(reverse_url('wl_applications:view_assessment', pk, pk + 1),
+                             reverse('wl_applications:view_assessment', args=[pk, pk + 1]))
+        self.assertEqual(reverse_url('wl_main:identification'), reverse('wl_main:identification'))
+
+
+@override_settings(WL_DATATABLE_PREFERENCES_STORE='user')
+class TablePreferencesTest(helpers.BaseUserTestCase):
+    view_url = reverse('wl_dashboard:data_application_officer')
+
+    def test_saved_on_change(self):
+        self.client.login(self.officer.email)
+        self.client.get(self.view_url, {'draw': 1, 'start': 0, 'length': 25})
+        preferences = TablePreferences.objects.get(user=self.officer)
+        self.assertEqual(preferences.data['pageLength'], 25)
+
+        # paging doesn't change the preferences
+        self.client.get(self.view_url, {'draw': 2, 'start': 25, 'length': 25})
+        self.assertEqual(TablePreferences.objects.get(user=self.officer).data, preferences.data)
+
+        self.client.get(self.view_url, {'draw': 3, 'start': 0, 'length': 50, 'search[value]': 'test'})
+        preferences = TablePreferences.objects.get(user=self.officer)
+        self.assertEqual(preferences.data['pageLength'], 50)
+        self.assertEqual(preferences.data['search'], 'test')
+
+
+class DataTableExportTest(helpers.BaseUserTestCase):
+    view_url = reverse('wl_dashboard:data_application_officer')
+
+    def test_export_csv(self):
+        create_and_lodge_application(self.customer)
+        create_and_lodge_application(self.customer)
+        self.client.login(self.officer.email)
+        response = self.client.get(self.view_url, {'export': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'Lodgement number')
+        expected = Application.objects.exclude(processing_status='temp').count()
+        self.assertEqual(len(lines), expected + 1)
+
+    def test_export_xlsx(self):
+        create_and_lodge_application(self.customer)
+        self.client.login(self.officer.email)
+        response = self.client.get(self.view_url, {'export': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Disposition'].endswith('.xlsx'))
+
+
+class CompactModeTest(helpers.BaseUserTestCase):
+    view_url = reverse('wl_dashboard:data_returns_officer')
+
+    def _get_data(self, **params):
+        params.update({'draw': 1, 'start': 0, 'length': 10})
+        response = self.client.get(self.view_url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_compact_values(self):
+        ret = create_return(helpers.create_licence(self.customer, self.officer))
+        self.client.login(self.officer.email)
+        data = self._get_data(compact='true')
+        self.assertTrue(data['compact'])
+        self.assertEqual(data['urls']['enter_return'].replace('{0}', str(ret.pk)),
+                         reverse('wl_returns:enter_return', args=[ret.pk]))
+        row = data['data'][0]
+        self.assertEqual(row[4], ret.due_date.isoformat())
+        self.assertEqual(row[5][0], ret.status)
+        self.assertEqual(row[7], [ret.pk, 'enter'])
+
+        html = self._get_data()
+        self.assertNotIn('compact', html)
+        self.assertIn(reverse('wl_returns:enter_return', args=[ret.pk]), html['data'][0][7])
+        self.assertLess(len(json.dumps(data['data'])), len(json.dumps(html['data'])))
+
+
+class RelatedLookupsTest(TestCase):
+    def test_plan_related_lookups(self):
+        select, prefetch = plan_related_lookups(Return, [
+            'lodgement_number', 'licence.licence_type', 'licence.profile.user', 'licence.profile.user.last_name',
+            'licence_number', ['not', 'a', 'path'], ''
+        ])
+        self.assertEqual(select, ['licence__licence_type', 'licence__profile__user'])
+        self.assertEqual(prefetch, [])
+
+        select, prefetch = plan_related_lookups(Application, ['licence_type.name', 'variants', 'assigned_officer'])
+        self.assertEqual(select, ['assigned_officer', 'licence_type'])
+        self.assertEqual(prefetch, ['variants'])
+
+
+@override_settings(WL_DATATABLE_CACHE_TTL=0)
+class RelatedQueriesTest(helpers.BaseUserTestCase):
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'draw': 1, 'start': 0, 'length': 25})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_no_query_per_row(self):
+        licence = helpers.create_licence(self.customer, self.officer)
+        create_return(licence)
+        create_and_lodge_application(self.customer)
+        self.client.login(self.officer.email)
+        urls = [reverse('wl_dashboard:data_returns_officer'), reverse('wl_dashboard:data_application_officer')]
+        # first requests: session and user preferences
+        for url in urls:
+            self._count_queries(url)
+        counts = [self._count_queries(url) for url in urls]
+
+        for i in range(3):
+            create_return(helpers.create_licence(self.customer, self.officer))
+            create_and_lodge_application(self.customer)
+        self.assertEqual([self._count_queries(url) for url in urls], counts)
+
+
 class TableCustomerViewTest(helpers.BasePermissionViewTestCase):
     view_url = reverse('wl_dashboard:tables_customer')
 
@@ -1,4 +1,4 @@
-from django.core.urlresolvers import reverse, reverse_lazy
+from django.core.urlresolvers import reverse_lazy
 from django.db.models import Q
 
 from wildlifelicensing.apps.applications.models import Assessment, Application
@@ -165,11 +165,11 @@ class DataTableApplicationAssessorView(OfficerOrAssessorRequiredMixin, base.Data
     def render_action_column(obj):
         if obj.status == 'awaiting_assessment':
             return '<a href="{0}">Assess</a>'.format(
-                reverse('wl_applications:enter_conditions_assessor', args=[obj.application.pk, obj.pk])
+                base.reverse_url('wl_applications:enter_conditions_assessor', obj.application.pk, obj.pk)
             )
         else:
             return '<a href="{0}">View (read-only)</a>'.format(
-                reverse('wl_applications:view_assessment', args=[obj.application.pk, obj.pk])
+                base.reverse_url('wl_applications:view_assessment', obj.application.pk, obj.pk)
             )
 
     @staticmethod
@@ -1,32 +1,104 @@
 from __future__ import unicode_literals
 
 import datetime
+import hashlib
 import json
 import logging
 import copy
+import csv
+import itertools
 
 from dateutil.parser import parse as date_parse
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.contrib import messages
-from django.core.urlresolvers import reverse
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.core.urlresolvers import reverse, get_script_prefix, NoReverseMatch
+from django.db import connections
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Model, Q, Sum, Case, When, Value, IntegerField, CharField, Exists, OuterRef
+from django.db.models.functions import Greatest
 from django.db.models.query import EmptyQuerySet
+from django.http import StreamingHttpResponse, JsonResponse, Http404
 from django.shortcuts import redirect
+from django.utils import six
+from django.utils.html import strip_tags
+from django.utils.text import capfirst
 from django.views.generic import TemplateView
 from django_datatables_view.base_datatable_view import BaseDatatableView
 from django.utils.http import urlencode
 
-from ledger.licence.models import LicenceType
 from wildlifelicensing.apps.applications.models import Application
 from wildlifelicensing.apps.dashboard.forms import LoginForm
-from wildlifelicensing.apps.main.helpers import is_officer, is_assessor, render_user_name
+from wildlifelicensing.apps.dashboard.models import TablePreferences
+from wildlifelicensing.apps.main.cache import get_generations_key
+from wildlifelicensing.apps.main.excel import StreamingWorkbookResponse
+from wildlifelicensing.apps.main.helpers import is_officer, is_assessor, is_customer, render_user_name
+from wildlifelicensing.apps.main.reference import get_licence_types
 
 from wildlifelicensing.apps.payments.utils import get_application_payment_status, PAYMENT_STATUS_AWAITING, \
     PAYMENT_STATUSES
+from wildlifelicensing.apps.reports.views import ReportHelper
 
 logger = logging.getLogger(__name__)
 
+# datatable count strategies, see DataTableBaseView.count_records
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATED = 'estimated'
+
+# datatable export formats, see DataTableBaseView.export
+EXPORT_CSV = 'csv'
+EXPORT_XLSX = 'xlsx'
+
+
+# URL templates, see reverse_url
+_URL_TEMPLATES = {}
+_URL_ARG_PLACEHOLDER = '8642097531{}'
+_STATIC_URLS = {}
+
+
+def reverse_url(viewname, *args):
+    """
+    Same as reverse(viewname, args=args) for pk like arguments (numbers or slugs) but the url resolver is walked only
+    once per view name, the result is kept as a format string with a placeholder for each argument.
+    To be used when rendering urls for every row of a table.
+    :param viewname:
+    :param args:
+    :return:
+    """
+    key = (get_script_prefix(), viewname, len(args))
+    template = _URL_TEMPLATES.get(key)
+    if template is None:
+        placeholders = [_URL_ARG_PLACEHOLDER.format(index) for index in range(len(args))]
+        try:
+            url = reverse(viewname, args=placeholders)
+        except NoReverseMatch:
+            # the placeholder is not accepted by the url pattern
+            return reverse(viewname, args=args)
+        template = url.replace('{', '{{').replace('}', '}}')
+        for index, placeholder in enumerate(placeholders):
+            template = template.replace(placeholder, '{%d}' % index)
+        _URL_TEMPLATES[key] = template
+    return template.format(*args)
+
+
+def static_url(path):
+    """
+    Same as static(path) with the result kept for the process.
+    """
+    result = _STATIC_URLS.get(path)
+    if result is None:
+        result = _STATIC_URLS[path] = static(path)
+    return result
+
+
+def clear_url_templates():
+    _URL_TEMPLATES.clear()
+    _STATIC_URLS.clear()
+
 
 def build_url(base, query):
     return base + '?' + urlencode(query)
@@ -45,6 +117,142 @@ def render_date(date):
     return 'not a valid date object'
 
 
+def compact_date(date):
+    """
+    The value of a date column in the compact mode of the datatables (see DataTableBaseView.render_column)
+    :return: the ISO format of the date or None
+    """
+    return date.isoformat() if date else None
+
+
+def conditional_count(query):
+    """
+    An aggregate that counts only the rows matching the given query.
+    Same as Count('pk', filter=query) which is not available before Django 2.0
+    :param query: a Q instance
+    :return:
+    """
+    return Sum(Case(When(query, then=1), default=0, output_field=IntegerField()))
+
+
+def count_by(qs, field, **counts):
+    """
+    Compute several conditional counts of a queryset grouped by a field in a single query.
+    :param qs:
+    :param field: the name of the field to group by
+    :param counts: name=Q(), one conditional count for each name
+    :return: a dict {
+        field_value: {
+            name: count,
+            ....
+        }
+    }
+    """
+    result = {}
+    annotations = {name: conditional_count(query) for name, query in counts.items()}
+    for row in qs.order_by().values(field).annotate(**annotations):
+        result[row[field]] = {name: row[name] or 0 for name in counts}
+    return result
+
+
+def get_licences_applications(licences):
+    """
+    Resolve in two queries the application of each licence and the application that replaces it (renewal or
+    amendment) if any.
+    :param licences: list of WildlifeLicence
+    :return: a dict {
+        licence.pk: (application or None, replacing_application or None)
+    }
+    """
+    applications = {}
+    for application in Application.objects.filter(licence__in=licences):
+        applications[application.licence_id] = application
+    replacing_applications = {}
+    if applications:
+        for application in Application.objects.filter(previous_application__in=applications.values()).\
+                select_related('licence'):
+            replacing_applications[application.previous_application_id] = application
+    result = {}
+    for licence in licences:
+        application = applications.get(licence.pk)
+        replacing_application = replacing_applications.get(application.pk) if application is not None else None
+        result[licence.pk] = (application, replacing_application)
+    return result
+
+
+LICENCE_STATUS_UNISSUED = 'unissued'
+LICENCE_STATUS_AMENDED = 'amended'
+LICENCE_STATUS_RENEWED = 'renewed'
+LICENCE_STATUS_EXPIRED = 'expired'
+LICENCE_STATUS_DUE_FOR_RENEWAL = 'due_for_renewal'
+LICENCE_STATUS_CURRENT = 'current'
+
+LICENCE_STATUS_LABELS = {
+    LICENCE_STATUS_UNISSUED: 'Unissued',
+    LICENCE_STATUS_AMENDED: 'Amended',
+    LICENCE_STATUS_RENEWED: 'Renewed',
+    LICENCE_STATUS_EXPIRED: '<span class="label label-danger">Expired</span>',
+    LICENCE_STATUS_DUE_FOR_RENEWAL: '<span class="label label-warning">Due for renewal</span>',
+    LICENCE_STATUS_CURRENT: 'Current',
+}
+
+LICENCE_RENEWAL_DAYS = 30
+
+
+def annotate_licence_status(qs, replacing_issued_only=False, today=None):
+    """
+    Annotate the licences with their 'lifecycle_status' (one of the LICENCE_STATUS_...) computed by the database, so
+    the licences can be filtered and ordered by status. This is the database version of the _render_status of the
+    licences tables, without the applications of get_licences_applications.
+    The status is None for an issued licence without end date (should not happen).
+    :param qs: a WildlifeLicence queryset
+    :param replacing_issued_only: if True the licence is amended/renewed only when the licence of the replacing
+    application is issued (customer view).
+    :param today: the date of the comparison, default to today.
+    :return: the annotated queryset
+    """
+    today = today or datetime.date.today()
+    replacing_applications = Application.objects.filter(previous_application__licence=OuterRef('pk'))
+    if replacing_issued_only:
+        replacing_applications = replacing_applications.filter(licence__licence_number__gt='')
+    return qs.annotate(
+        replaced_by_amendment=Exists(replacing_applications.filter(application_type='amendment')),
+        replaced_by_renewal=Exists(replacing_applications.exclude(application_type='amendment')),
+    ).annotate(lifecycle_status=Case(
+        When(Q(licence_number__isnull=True) | Q(licence_number=''), then=Value(LICENCE_STATUS_UNISSUED)),
+        When(replaced_by_amendment=True, then=Value(LICENCE_STATUS_AMENDED)),
+        When(replaced_by_renewal=True, then=Value(LICENCE_STATUS_RENEWED)),
+        When(end_date__lt=today, then=Value(LICENCE_STATUS_EXPIRED)),
+        When(is_renewable=True, end_date__lte=today + datetime.timedelta(days=LICENCE_RENEWAL_DAYS),
+             then=Value(LICENCE_STATUS_DUE_FOR_RENEWAL)),
+        When(end_date__isnull=False, then=Value(LICENCE_STATUS_CURRENT)),
+        default=None,
+        output_field=CharField()
+    ))
+
+
+def render_licence_status(instance):
+    """
+    :return: the label of the status annotated by annotate_licence_status or None if not annotated.
+    """
+    return LICENCE_STATUS_LABELS.get(getattr(instance, 'lifecycle_status', None))
+
+
+# the actions of the returns tables: (url name, text). Same as the returnAction renderer of wl.dataTable.js.
+RETURN_ACTIONS = {
+    'enter': ('wl_returns:enter_return', 'Enter Return'),
+    'edit': ('wl_returns:enter_return', 'Edit Return'),
+    'amend': ('wl_returns:enter_return', 'Amend Return'),
+    'curate': ('wl_returns:curate_return', 'Curate Return'),
+    'view': ('wl_returns:view_return', 'View Return (read-only)'),
+}
+
+
+def render_return_action(pk, action):
+    url_name, text = RETURN_ACTIONS[action]
+    return '<a href="{0}">{1}</a>'.format(reverse_url(url_name, pk), text)
+
+
 def render_lodgement_number(application):
     if application is not None and application.lodgement_number and application.lodgement_sequence:
         return '%s-%d' % (application.lodgement_number, application.lodgement_sequence)
@@ -54,7 +262,7 @@ def render_lodgement_number(application):
 def render_application_document(application):
     if application is not None:
         return '<a href="{0}" target="_blank">View <img height="20" src="{1}"></img></a>'.format(
-            reverse('wl_applications:view_application_pdf', args=(application.pk,)), static('wl/img/pdf.png'))
+            reverse_url('wl_applications:view_application_pdf', application.pk), static_url('wl/img/pdf.png'))
     else:
         return ''
 
@@ -68,22 +276,29 @@ def render_licence_number(licence):
 def render_licence_document(licence):
     if licence is not None and licence.licence_document is not None:
         return '<a href="{0}" target="_blank">View PDF</a><img height="20" src="{1}"></img>'.format(
-            licence.licence_document.file.url, static('wl/img/pdf.png'))
+            licence.licence_document.file.url, static_url('wl/img/pdf.png'))
     else:
         return ''
 
 
 def render_download_return_template(ret):
-    url = reverse('wl_returns:download_return_template', args=[ret.return_type.pk])
+    url = reverse_url('wl_returns:download_return_template', ret.return_type.pk)
     return '<a href="{}">Download (XLSX)</a>'.format(url)
 
 
-def render_payment(application, redirect_url):
-    status = get_application_payment_status(application)
+def render_payment(application, redirect_url, status=None):
+    """
+    :param application:
+    :param redirect_url:
+    :param status: the payment status of the application if already known (see get_payment_statuses)
+    :return:
+    """
+    if status is None:
+        status = get_application_payment_status(application)
     result = '{}'.format(PAYMENT_STATUSES[status])
     if status == PAYMENT_STATUS_AWAITING:
         url = '{}?redirect_url={}'.format(
-            reverse('wl_payments:manual_payment', args=[application.id]),
+            reverse_url('wl_payments:manual_payment', application.id),
             redirect_url
         )
         result += ' <a href="{}">Enter payment</a>'.format(url)
@@ -111,8 +326,53 @@ class DashBoardRoutingView(TemplateView):
 
 
 class DashboardTreeViewBase(TemplateView):
+    """
+    Base view for the dashboard trees.
+    The counts displayed in the tree can be cached with get_cached_counts. The cache is invalidated every time an
+    instance of one of the counts_models is saved or deleted (see dashboard.signals) or after
+    settings.WL_DASHBOARD_CACHE_TTL seconds.
+    The tree can be split in parts (tree_parts) that have their own counts (see _get_part_counts and
+    _build_part_nodes). With lazy_tree the page is rendered with the nodes of each part without counts and the nodes
+    with counts are fetched by the page from the same url with a 'part' parameter, one request per part.
+    """
     template_name = 'wl/dash_tree.html'
 
+    # the models the tree counts depend on.
+    counts_models = []
+
+    # the names of the tree parts in display order
+    tree_parts = []
+    lazy_tree = False
+
+    @classmethod
+    def get_counts_cache_key(cls, name, user=None):
+        return 'wl_dashboard_tree_{view}_{name}_{user}_{date}_{generations}'.format(
+            view=cls.__name__,
+            name=name,
+            user=user.pk if user is not None else 'all',
+            # some counts depend on the date (ex: overdue returns)
+            date=datetime.date.today().isoformat(),
+            generations=get_generations_key(cls.counts_models)
+        )
+
+    @classmethod
+    def get_cached_counts(cls, name, func, user=None):
+        """
+        :param name: a name for this set of counts
+        :param func: a callable that compute the counts
+        :param user: if the counts are specific to a user
+        :return: the cached counts or the result of func
+        """
+        timeout = getattr(settings, 'WL_DASHBOARD_CACHE_TTL', 0)
+        if not timeout:
+            return func()
+        key = cls.get_counts_cache_key(name, user)
+        result = cache.get(key)
+        if result is None:
+            result = func()
+            cache.set(key, result, timeout)
+        return result
+
     @staticmethod
     def _create_node(title, href=None, count=None):
         node_template = {
@@ -142,10 +402,40 @@ class DashboardTreeViewBase(TemplateView):
             parent['nodes'].append(child)
         return parent
 
+    def _get_part_counts(self, part):
+        """
+        Subclass with tree_parts should return the counts of the given part.
+        """
+        return {}
+
+    def _build_part_nodes(self, part, counts):
+        """
+        Subclass with tree_parts should implement the nodes of the given part.
+        :param part: one of tree_parts
+        :param counts: the result of _get_part_counts or None to build the nodes without counts
+        """
+        return []
+
+    def get_part_nodes(self, part):
+        return self._build_part_nodes(part, self._get_part_counts(part))
+
+    def get(self, request, *args, **kwargs):
+        part = request.GET.get('part')
+        if part is not None:
+            if part not in self.tree_parts:
+                raise Http404
+            return JsonResponse({
+                'part': part,
+                'nodes': self.get_part_nodes(part)
+            })
+        return super(DashboardTreeViewBase, self).get(request, *args, **kwargs)
+
     def _build_tree_nodes(self):
         """
-        Subclass should implement the nodes with the help of _create_node and _build_node
+        Subclass should implement the nodes with the help of _create_node and _build_node or define tree_parts.
         """
+        if self.tree_parts:
+            return [node for part in self.tree_parts for node in self.get_part_nodes(part)]
         parent_node = self._create_node('Parent node', href='#', count=2)
         child1 = self._create_node('Child#1', href='#', count=1)
         self._add_node(parent_node, child1)
@@ -154,7 +444,16 @@ class DashboardTreeViewBase(TemplateView):
         return [parent_node]
 
     def get_context_data(self, **kwargs):
-        if 'dataJSON' not in kwargs:
+        if self.lazy_tree and self.tree_parts:
+            if 'partsJSON' not in kwargs:
+                kwargs['partsJSON'] = json.dumps([
+                    {
+                        'part': part,
+                        'nodes': self._build_part_nodes(part, None)
+                    } for part in self.tree_parts
+                ])
+                kwargs['partsURL'] = self.request.path
+        elif 'dataJSON' not in kwargs:
             kwargs['dataJSON'] = json.dumps(self._build_tree_nodes())
         if 'title' not in kwargs and hasattr(self, 'title'):
             kwargs['title'] = self.title
@@ -360,7 +659,7 @@ class TablesBaseView(TemplateView):
 
     @staticmethod
     def get_licence_types_values():
-        return [('all', 'All')] + [(lt.pk, lt.display_name) for lt in LicenceType.objects.all()]
+        return [('all', 'All')] + get_licence_types()
 
     @staticmethod
     def set_licence_type_filter(table_config):
@@ -473,6 +772,142 @@ def build_field_query(fields_to_search, search):
     return query
 
 
+def _get_relation_lookups(model, path):
+    """
+    :param model:
+    :param path: a column or order lookup, ex: 'licence.profile.user.last_name'
+    :return: (select, prefetch) the longest prefix of the path made of relations, split in the select_related part
+    (foreign keys and one to one) and the prefetch_related part (from the first many relation), ex:
+    ('licence__profile__user', '')
+    """
+    select = []
+    prefetch = []
+    for name in path.replace('.', '__').split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation or field.related_model is None:
+            break
+        if prefetch or field.many_to_many or field.one_to_many:
+            prefetch.append(name)
+        else:
+            select.append(name)
+        model = field.related_model
+    return '__'.join(select), '__'.join(select + prefetch) if prefetch else ''
+
+
+def plan_related_lookups(model, paths):
+    """
+    Plan the select_related and prefetch_related lookups needed to access the relations of the given paths without a
+    query per row.
+    :param model: the model of the queryset
+    :param paths: list of lookups with '.' or '__' separators, ex: ['licence.profile.user', 'licence_type.name']
+    :return: (select_related lookups, prefetch_related lookups), sorted, without the lookups included in another one.
+    """
+    select = set()
+    prefetch = set()
+    for path in paths:
+        if not path or not hasattr(path, 'split'):
+            continue
+        select_lookup, prefetch_lookup = _get_relation_lookups(model, path)
+        if select_lookup:
+            select.add(select_lookup)
+        if prefetch_lookup:
+            prefetch.add(prefetch_lookup)
+
+    def _reduce(lookups):
+        return sorted(lookup for lookup in lookups
+                      if not any(other.startswith(lookup + '__') for other in lookups))
+
+    return _reduce(select), _reduce(prefetch)
+
+
+def get_queryset_signature(qs):
+    """
+    :return: a hash of the SQL query of a queryset, to be used in a cache key.
+    :raise EmptyResultSet: if the queryset can't return any row (ex: a filter on an empty list), there's no SQL query.
+    """
+    sql, params = qs.query.sql_with_params()
+    return hashlib.md5('{} {}'.format(sql, params).encode('utf-8')).hexdigest()
+
+
+def _is_same_query(qs, other_qs):
+    try:
+        return get_queryset_signature(qs) == get_queryset_signature(other_qs)
+    except EmptyResultSet:
+        return False
+
+
+def estimate_count(qs):
+    """
+    The number of rows of a queryset as estimated by the Postgres planner (EXPLAIN). Much cheaper than a count() on a
+    large table but can be far off for complex filters.
+    :param qs:
+    :return: the estimated number of rows
+    """
+    try:
+        sql, params = qs.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def build_keyset_query(order_by, values):
+    """
+    Build the 'seek' query that returns the rows after a given row for an ordering, ex:
+    order_by=['-lodgement_date', 'pk'], values=[date, 12]
+    => lodgement_date < date OR (lodgement_date = date AND pk > 12)
+    :param order_by: list of order_by lookups, with a '-' prefix for a descending order.
+    :param values: the values of the lookups for the row to seek after.
+    :return: a Q instance
+    """
+    query = Q()
+    equal = Q()
+    for field, value in zip(order_by, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        query |= equal & Q(**{'{0}__{1}'.format(name, lookup): value})
+        equal &= Q(**{name: value})
+    return query
+
+
+class _Echo(object):
+    """
+    A file-like object for csv.writer that returns the written line instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+class TrigramSearch(object):
+    """
+    A column search that can use the pg_trgm indexes (see main.operations.AddTrigramIndexes) and rank the results by
+    similarity with the search term. To be used as the 'search' of a column helper:
+    'applicant': {
+        'render': ...,
+        'search': TrigramSearch(['applicant_profile__user__last_name', 'applicant_profile__user__first_name'])
+    }
+    The filtering is the same __icontains query as build_field_query, which the trigram indexes accelerate, the
+    similarity is used by DataTableBaseView to order the searched results.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __call__(self, view, search):
+        return build_field_query(self.fields, search)
+
+    def similarity(self, search):
+        similarities = [TrigramSimilarity(field, search) for field in self.fields]
+        return Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+
 class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
     """
     View to handle datatable server-side processing
@@ -486,6 +921,33 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
        }
     }
     17/10/2016: Added support for saving column_order/search/page_length in session
+    The settings are only written when they change, in the session or, if settings.WL_DATATABLE_PREFERENCES_STORE is
+    'user', in the TablePreferences of the user.
+    When a search is entered and some searchable columns use a TrigramSearch, the results are ordered by similarity
+    first (see SEARCH_RANK_RESULTS).
+    Keyset paging: when the table is ordered only by some of the KEYSET_PAGING_COLUMNS, the next page is fetched by
+    seeking after the last row of the current one (see build_keyset_query) instead of using an OFFSET, so paging
+    through a large table doesn't get slower with the page number. The last row of each page is cached for the
+    same query parameters and invalidated when the model changes (see dashboard.signals). A page requested without
+    the previous one (ex: jump to the last page) or any other ordering falls back to the OFFSET paging.
+    Counts: the total and filtered counts can be exact, cached or estimated (see COUNT_STRATEGY). Only the total count
+    (and the filtered count when nothing is filtered) is estimated. The response has a 'recordsEstimated' flag so the
+    table can show 'about N entries'.
+    Page cache: if PAGE_CACHE is set the response is cached for settings.WL_DATATABLE_CACHE_TTL seconds, keyed on the
+    filters, order, search and page of the request and on the user role (or the user, see PAGE_CACHE_PER_USER).
+    It is invalidated when an instance of one of the PAGE_CACHE_MODELS is saved or deleted (see dashboard.signals).
+    The columns that shouldn't be cached (ex: data from another system or specific to the user) can set
+    'cache': False in their column helper, they are rendered again on every request.
+    Export: the same url with the parameter export=csv or export=xlsx returns all the rows matching the current
+    filters, search and order as a file (see export). The rows are streamed so the memory stays flat whatever the
+    number of rows.
+    Compact mode: when the request has compact=true, the columns with a 'compact' function in their column helper
+    return a typed value (ids, enums, ISO dates, ...) instead of the rendered html, and the response includes the
+    url templates of COMPACT_URLS. The html is rendered by the table (see the compact renderers of wl.dataTable.js).
+    Related objects: the relations of the columns, of their order columns and the ones declared in the 'related' list
+    of their column helper are fetched with the rows (select_related/prefetch_related, see plan_related_lookups) so
+    the renders don't query them for every row. Data that can't be reached by a lookup should be fetched in
+    prefetch_page_data.
     """
     model = None
     columns = [
@@ -506,17 +968,66 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
 
     SESSION_SAVE_SETTINGS = True  # Set to True if you want to save order/search in the session
     SESSION_KEY = None  # if you don't specify a session_key one will be generated based on the class name
+    SEARCH_RANK_RESULTS = True  # Set to False to keep the column ordering when searching with TrigramSearch columns
+    # The order lookups (ex: 'lodgement_number') that can be used for keyset paging. They should be non nullable and
+    # indexed with the primary key. Empty to disable keyset paging.
+    KEYSET_PAGING_COLUMNS = ()
+    KEYSET_CURSOR_TIMEOUT = 3600
+
+    _keyset_next_key = None
+
+    # How the recordsTotal/recordsFiltered counts are computed:
+    # COUNT_EXACT: a count() query.
+    # COUNT_CACHED: a count() query cached for COUNT_CACHE_TIMEOUT seconds or until the model changes.
+    # COUNT_ESTIMATED: for the total count, the planner estimate when it is at least COUNT_ESTIMATE_THRESHOLD, else a
+    # count() query. The filtered count is a count() query.
+    COUNT_STRATEGY = COUNT_EXACT
+    COUNT_CACHE_TIMEOUT = 300
+    COUNT_ESTIMATE_THRESHOLD = 10000
+
+    PAGE_CACHE = False
+    # set to False if the results of the table are the same for all the users of the same role.
+    PAGE_CACHE_PER_USER = True
+    # the models the rendered rows depend on. Default to [model]
+    PAGE_CACHE_MODELS = None
+
+    # the columns that are not exported and the headers of the exported columns if not derived from their name.
+    EXPORT_EXCLUDED_COLUMNS = ('action',)
+    EXPORT_HEADERS = {}
+    EXPORT_BATCH_SIZE = 500
+
+    # name: url name with one pk argument, sent as a url template in the compact responses (see get_compact_urls)
+    COMPACT_URLS = {}
+
+    # set to False to not fetch the related objects of the columns with the rows (see get_related_lookups)
+    AUTO_RELATED = True
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('export')
+        if export_format in (EXPORT_CSV, EXPORT_XLSX):
+            self.request = request
+            return self.export(export_format)
+        return super(DataTableBaseView, self).get(request, *args, **kwargs)
 
     @classmethod
     def get_session_key(cls):
         result = cls.SESSION_KEY or 'dt_{}'.format(cls.__name__)
         return result
 
+    @staticmethod
+    def _use_user_preferences(request):
+        return getattr(settings, 'WL_DATATABLE_PREFERENCES_STORE', 'session') == 'user' and \
+            request.user.is_authenticated()
+
     @classmethod
     def get_session_data(cls, request):
         result = {}
         if request:
-            result = request.session.get(cls.get_session_key(), {})
+            if cls._use_user_preferences(request):
+                result = TablePreferences.objects.filter(user=request.user, table=cls.get_session_key()). \
+                    values_list('data', flat=True).first() or {}
+            else:
+                result = request.session.get(cls.get_session_key(), {})
         return result
 
     @classmethod
@@ -559,6 +1070,23 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
                     query |= Q(**{'{0}__icontains'.format(self.columns[col_no].replace('.', '__')): search})
         return query
 
+    def _get_search_similarity(self, search):
+        """
+        :param search:
+        :return: the best trigram similarity between the search and the searchable TrigramSearch columns or None if
+        there is no such column.
+        """
+        similarities = []
+        col_data = super(DataTableBaseView, self).extract_datatables_column_data()
+        for col_no, col in enumerate(col_data):
+            if col['searchable']:
+                func = self.columns_helpers.get(self.columns[col_no], {}).get('search')
+                if isinstance(func, TrigramSearch):
+                    similarities.append(func.similarity(search))
+        if not similarities:
+            return None
+        return Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
     def _get_filters(self):
         """
         The additional filters are sent in the query param with the following form (example):
@@ -623,16 +1151,174 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
             'pageLength': self._get_page_length(),
             'filters': self._get_filters()
         }
-        self.request.session[self.get_session_key()] = data
+        # don't write the same settings again (ex: when paging)
+        if data == self.get_session_data(self.request):
+            return
+        if self._use_user_preferences(self.request):
+            TablePreferences.objects.update_or_create(user=self.request.user, table=self.get_session_key(),
+                                                      defaults={'data': data})
+        else:
+            self.request.session[self.get_session_key()] = data
+
+    def count_records(self, qs, filtered=False):
+        """
+        Count the records of the table according to the COUNT_STRATEGY.
+        :param qs:
+        :param filtered: True for the count after filtering. It is never estimated: the estimate of a filtered query can
+        be far off.
+        :return:
+        """
+        if self.COUNT_STRATEGY == COUNT_CACHED:
+            try:
+                signature = get_queryset_signature(qs)
+            except EmptyResultSet:
+                return 0
+            key = 'wl_dt_count_{signature}_{generations}'.format(
+                signature=signature,
+                # the filters and search can be on the related models
+                generations=get_generations_key(self.PAGE_CACHE_MODELS or [self.model])
+            )
+            result = cache.get(key)
+            if result is None:
+                result = qs.count()
+                cache.set(key, result, self.COUNT_CACHE_TIMEOUT)
+            return result
+        if self.COUNT_STRATEGY == COUNT_ESTIMATED and not filtered:
+            result = estimate_count(qs)
+            if result >= self.COUNT_ESTIMATE_THRESHOLD:
+                self.counts_estimated = True
+                return result
+        return qs.count()
+
+    def _get_table_data(self, *args, **kwargs):
+        """
+        Same as BaseDatatableView.get_context_data (datatables 1.10+ notation) but with the counts computed by
+        count_records.
+        """
+        self.counts_estimated = False
+        try:
+            self.initialize(*args, **kwargs)
+            qs = self.get_initial_queryset()
+            # number of records before filtering
+            total_records = self.count_records(qs)
+            filtered_qs = self.filter_queryset(qs)
+            # number of records after filtering
+            if self.counts_estimated and _is_same_query(qs, filtered_qs):
+                # nothing filtered, the estimate is also the filtered count
+                total_display_records = total_records
+            else:
+                total_display_records = self.count_records(filtered_qs, filtered=True)
+            qs = filtered_qs
+            qs = self.ordering(qs)
+            qs = self.paging(qs)
+            result = {
+                'draw': int(self._querydict.get('draw', 0)),
+                'recordsTotal': total_records,
+                'recordsFiltered': total_display_records,
+                'recordsEstimated': self.counts_estimated,
+                'data': self.prepare_results(qs)
+            }
+            if self.is_compact():
+                result['compact'] = True
+                result['urls'] = self.get_compact_urls()
+            return result
+        except Exception as e:
+            logger.exception(str(e))
+            return {
+                'error': '\nAn error occured while processing an AJAX request.',
+                'data': [],
+                'recordsTotal': 0,
+                'recordsFiltered': 0,
+                'draw': int(self._querydict.get('draw', 0))
+            }
+
+    def _get_user_role(self):
+        user = self.request.user
+        if is_officer(user):
+            return 'officer'
+        if is_assessor(user):
+            return 'assessor'
+        return 'customer' if is_customer(user) else 'none'
+
+    def get_page_cache_key(self):
+        params = {
+            'filters': sorted(self._get_filters().items()),
+            'order': self._get_order_config_array(),
+            'search': self._get_search_value(),
+            'start': self._querydict.get('start', 0),
+            'length': self._get_page_length(),
+            'compact': self.is_compact(),
+            # some columns depend on the date (ex: return urgency)
+            'date': str(datetime.date.today()),
+        }
+        signature = hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        return 'wl_dt_page_{path}_{user}_{signature}_{generations}'.format(
+            path=self.request.path,
+            user=self.request.user.pk if self.PAGE_CACHE_PER_USER else self._get_user_role(),
+            signature=signature,
+            generations=get_generations_key(self.PAGE_CACHE_MODELS or [self.model])
+        )
+
+    def _get_uncached_columns(self):
+        return [(index, column) for index, column in enumerate(self.get_columns())
+                if not self.columns_helpers.get(column, {}).get('cache', True)]
+
+    def _get_cached_table_data(self, *args, **kwargs):
+        """
+        Get the table data from the page cache or compute and cache it. See PAGE_CACHE
+        """
+        timeout = getattr(settings, 'WL_DATATABLE_CACHE_TTL', 0)
+        if not self.PAGE_CACHE or not timeout:
+            return self._get_table_data(*args, **kwargs)
+        key = self.get_page_cache_key()
+        cached = cache.get(key)
+        if cached is not None:
+            result = self._render_uncached_columns(cached)
+            if result is not None:
+                result['draw'] = int(self._querydict.get('draw', 0))
+                return result
+        result = self._get_table_data(*args, **kwargs)
+        if 'error' not in result:
+            cached = dict(result, pks=self.page_pks)
+            cache.set(key, cached, timeout)
+        return result
+
+    def _render_uncached_columns(self, cached):
+        """
+        :param cached: the cached table data
+        :return: the table data with the uncached columns rendered or None if a row of the page doesn't exist anymore.
+        """
+        result = dict(cached)
+        pks = result.pop('pks')
+        uncached_columns = self._get_uncached_columns()
+        if uncached_columns and pks:
+            instances = self.apply_related_lookups(self.model.objects.all()).in_bulk(pks)
+            if len(instances) != len(pks):
+                return None
+            rows = [instances[pk] for pk in pks]
+            self.page_data = self.prefetch_page_data(rows)
+            data = []
+            for rendered, row in zip(result['data'], rows):
+                rendered = list(rendered)
+                for index, column in uncached_columns:
+                    rendered[index] = self.render_column(row, column)
+                data.append(rendered)
+            result['data'] = data
+        return result
 
     def get_context_data(self, *args, **kwargs):
         """
-        Override this method just to add a call to save_session_data if set-up.
+        Override this method to compute the counts with count_records, to use the page cache and to add a call to
+        save_session_data if set-up.
         :param args:
         :param kwargs:
         :return:
         """
-        result = super(DataTableBaseView, self).get_context_data(*args, **kwargs)
+        if 'iSortingCols' in self._querydict:
+            # legacy datatables notation
+            result = super(DataTableBaseView, self).get_context_data(*args, **kwargs)
+        else:
+            result = self._get_cached_table_data(*args, **kwargs)
         try:
             if self.SESSION_SAVE_SETTINGS:
                 self.save_session_data()
@@ -666,7 +1352,146 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
             query &= self._build_global_search_query(search)
         return qs.filter(query)
 
+    def ordering(self, qs):
+        """
+        Order by search similarity before the column ordering if the results are searched with TrigramSearch columns.
+        The similarity is annotated here rather than in filter_queryset so it is not part of the count queries.
+        """
+        qs = super(DataTableBaseView, self).ordering(qs)
+        search = self._get_search_value()
+        if self.SEARCH_RANK_RESULTS and search:
+            similarity = self._get_search_similarity(search)
+            if similarity is not None:
+                qs = qs.annotate(search_rank=similarity).order_by('-search_rank', *qs.query.order_by)
+        order_by = list(qs.query.order_by)
+        if self._is_keyset_ordering(order_by):
+            # the pk makes the order total, in the same direction as the last column so a single index can be used.
+            qs = qs.order_by(*(order_by + ['-pk' if order_by[-1].startswith('-') else 'pk']))
+        # after the counts, the joins are only for the rendered rows.
+        return self.apply_related_lookups(qs)
+
+    def get_related_lookups(self):
+        """
+        :return: (select_related lookups, prefetch_related lookups) planned from the columns, the order columns and
+        the 'related' of the column helpers.
+        """
+        paths = []
+        order_columns = self.get_order_columns()
+        for index, column in enumerate(self.get_columns()):
+            paths.append(column)
+            order_column = order_columns[index] if index < len(order_columns) else None
+            if isinstance(order_column, list):
+                paths.extend(order_column)
+            elif order_column:
+                paths.append(order_column)
+            paths.extend(self.columns_helpers.get(column, {}).get('related', []))
+        return plan_related_lookups(self.model, paths)
+
+    def apply_related_lookups(self, qs):
+        if not self.AUTO_RELATED or self.model is None:
+            return qs
+        select, prefetch = self.get_related_lookups()
+        if select:
+            qs = qs.select_related(*select)
+        if prefetch:
+            qs = qs.prefetch_related(*prefetch)
+        return qs
+
+    def _is_not_null_lookup(self, lookup):
+        model = self.model
+        for name in lookup.split('__'):
+            field = model._meta.get_field(name)
+            if field.null:
+                return False
+            model = field.related_model
+        return True
+
+    def _is_keyset_ordering(self, order_by):
+        return bool(order_by) and all(
+            hasattr(field, 'lstrip') and field.lstrip('-') in self.KEYSET_PAGING_COLUMNS and
+            self._is_not_null_lookup(field.lstrip('-')) for field in order_by
+        )
+
+    def _get_keyset_order(self, qs):
+        """
+        :return: the order_by of the queryset if it can be used for keyset paging (see ordering) else None
+        """
+        order_by = list(qs.query.order_by)
+        if len(order_by) > 1 and order_by[-1] in ('pk', '-pk') and self._is_keyset_ordering(order_by[:-1]):
+            return order_by
+        return None
+
+    def _get_keyset_cache_key(self, start):
+        params = sorted((k, v) for k, v in self._querydict.items() if k not in ('start', 'draw', '_'))
+        signature = hashlib.md5(json.dumps([self.request.path, params]).encode('utf-8')).hexdigest()
+        return 'wl_dt_keyset_{user}_{signature}_{generations}_{start}'.format(
+            user=self.request.user.pk,
+            signature=signature,
+            generations=get_generations_key([self.model]),
+            start=start
+        )
+
+    def paging(self, qs):
+        self._keyset_next_key = None
+        order_by = self._get_keyset_order(qs)
+        limit = min(self._get_page_length(), self.max_display_length)
+        if order_by is None or limit < 0:
+            return super(DataTableBaseView, self).paging(qs)
+        start = int(self._querydict.get('start', 0))
+        cursor = cache.get(self._get_keyset_cache_key(start)) if start else None
+        if start and cursor is None:
+            # we haven't seen the previous page.
+            page = super(DataTableBaseView, self).paging(qs)
+        else:
+            if cursor is not None:
+                qs = qs.filter(build_keyset_query(order_by, cursor))
+            page = qs[:limit]
+        self._keyset_order = order_by
+        self._keyset_limit = limit
+        self._keyset_next_key = self._get_keyset_cache_key(start + limit)
+        return page
+
+    def _save_keyset_cursor(self, last_row):
+        # the values are read from the row, the relations of the order columns are fetched with it (see
+        # apply_related_lookups)
+        values = []
+        for field in self._keyset_order:
+            value = last_row
+            for name in field.lstrip('-').split('__'):
+                value = getattr(value, name)
+            values.append(value.pk if isinstance(value, Model) else value)
+        cache.set(self._keyset_next_key, values, self.KEYSET_CURSOR_TIMEOUT)
+
+    def prefetch_page_data(self, rows):
+        """
+        Called with the rows of the current page (after filtering, ordering and paging) before they are rendered.
+        Override this method to fetch in bulk the related data needed by the column renders instead of querying it
+        for every row. The result is available to the renders as self.page_data.
+        :param rows: list of model instances
+        :return: anything the renders need, usually lookup dictionaries.
+        """
+        return {}
+
+    def prepare_results(self, qs):
+        rows = list(qs)
+        self.page_pks = [row.pk for row in rows]
+        if self._keyset_next_key is not None and len(rows) == self._keyset_limit:
+            self._save_keyset_cursor(rows[-1])
+        self.page_data = self.prefetch_page_data(rows)
+        return super(DataTableBaseView, self).prepare_results(rows)
+
+    def is_compact(self):
+        return self._querydict.get('compact') == 'true' and not self._querydict.get('export')
+
+    def get_compact_urls(self):
+        """
+        :return: {name: url} with '{0}' in place of the pk in the url, for each of the COMPACT_URLS.
+        """
+        return {name: reverse_url(viewname, '{0}') for name, viewname in self.COMPACT_URLS.items()}
+
     def render_column(self, instance, column):
+        if 'compact' in self.columns_helpers.get(column, {}) and self.is_compact():
+            return self.columns_helpers[column]['compact'](self, instance)
         if column in self.columns_helpers and 'render' in self.columns_helpers[column]:
             func = self.columns_helpers[column]['render']
             if callable(func):
@@ -683,6 +1508,66 @@ class DataTableBaseView(LoginRequiredMixin, BaseDatatableView):
         else:
             return EmptyQuerySet()
 
+    def get_export_queryset(self):
+        self.initialize()
+        return self.ordering(self.filter_queryset(self.get_initial_queryset()))
+
+    def get_export_columns(self):
+        return [column for column in self.get_columns() if column not in self.EXPORT_EXCLUDED_COLUMNS]
+
+    def get_export_header(self, column):
+        if column in self.EXPORT_HEADERS:
+            return self.EXPORT_HEADERS[column]
+        return capfirst(column.split('.')[-1].replace('_', ' '))
+
+    @staticmethod
+    def _to_export_value(value):
+        # the renders can return html (ex: links)
+        if isinstance(value, six.string_types):
+            return strip_tags(value).strip()
+        return value
+
+    def _render_export_batch(self, instances, columns):
+        if not instances:
+            return []
+        self.page_data = self.prefetch_page_data(instances)
+        return [[self._to_export_value(self.render_column(instance, column)) for column in columns]
+                for instance in instances]
+
+    def iter_export_rows(self, qs, columns):
+        """
+        Render the rows of the queryset in batches of EXPORT_BATCH_SIZE. The queryset is iterated without being
+        cached and the data of the renders is fetched per batch (see prefetch_page_data).
+        """
+        batch = []
+        for instance in qs.iterator():
+            batch.append(instance)
+            if len(batch) >= self.EXPORT_BATCH_SIZE:
+                for row in self._render_export_batch(batch, columns):
+                    yield row
+                batch = []
+        for row in self._render_export_batch(batch, columns):
+            yield row
+
+    def export(self, export_format):
+        """
+        :param export_format: EXPORT_CSV or EXPORT_XLSX
+        :return: a response with all the rows of the table for the current filters, search and order.
+        """
+        columns = self.get_export_columns()
+        headers = [self.get_export_header(column) for column in columns]
+        rows = self.iter_export_rows(self.get_export_queryset(), columns)
+        file_name = '{}_{}'.format(self.model._meta.verbose_name_plural,
+                                   datetime.date.today().isoformat()).replace(' ', '_')
+        if export_format == EXPORT_XLSX:
+            wb = ReportHelper.to_workbook(capfirst(self.model._meta.verbose_name_plural), headers, rows)
+            return StreamingWorkbookResponse(wb, file_name)
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse((writer.writerow(row) for row in itertools.chain([headers], rows)),
+                                         content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename={}.csv'.format(file_name)
+        return response
+
 
 class DataTableApplicationBaseView(DataTableBaseView):
     model = Application
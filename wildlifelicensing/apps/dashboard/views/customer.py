@@ -2,14 +2,15 @@ import datetime
 import logging
 
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.urlresolvers import reverse, reverse_lazy
+from django.core.urlresolvers import reverse_lazy
 from django.db.models import Q
 
 from wildlifelicensing.apps.applications.models import Application
 from wildlifelicensing.apps.dashboard.views import base
 from wildlifelicensing.apps.main.models import WildlifeLicence
 from wildlifelicensing.apps.returns.models import Return
-from wildlifelicensing.apps.returns.utils import is_return_overdue, is_return_due_soon
+from wildlifelicensing.apps.returns.utils import get_return_urgency, annotate_urgency, URGENCY_OVERDUE, \
+    URGENCY_DUE_SOON
 
 logger = logging.getLogger(__name__)
 
@@ -151,13 +152,17 @@ class TableCustomerView(LoginRequiredMixin, base.TablesBaseView):
                 'title': 'Licence Type'
             },
             {
-                'title': 'Lodged On'
+                'title': 'Lodged On',
+                'compact': 'date'
             },
             {
-                'title': 'Due On'
+                'title': 'Due On',
+                'compact': 'date'
             },
             {
-                'title': 'Status'
+                'title': 'Status',
+                'compact': 'returnStatus',
+                'compactLabels': dict(Return.STATUS_CHOICES)
             },
             {
                 'title': 'Licence',
@@ -165,6 +170,7 @@ class TableCustomerView(LoginRequiredMixin, base.TablesBaseView):
             },
             {
                 'title': 'Action',
+                'compact': 'returnAction',
                 'searchable': False,
                 'orderable': False
             }
@@ -240,27 +246,27 @@ class DataTableApplicationCustomerView(base.DataTableApplicationBaseView):
         status = obj.customer_status
         if status == 'draft':
             result = '<a href="{0}">{1}</a>'.format(
-                reverse('wl_applications:edit_application', args=[obj.pk]),
+                base.reverse_url('wl_applications:edit_application', obj.pk),
                 'Continue'
             )
         elif status == 'amendment_required' or status == 'id_and_amendment_required':
             result = '<a href="{0}">{1}</a>'.format(
-                reverse('wl_applications:edit_application', args=[obj.pk]),
+                base.reverse_url('wl_applications:edit_application', obj.pk),
                 'Amend application'
             )
         elif status == 'id_required' and obj.id_check_status == 'awaiting_update':
             result = '<a href="{0}">{1}</a>'.format(
-                reverse('wl_main:identification'),
+                base.reverse_url('wl_main:identification'),
                 'Update ID')
         else:
             result = '<a href="{0}"">{1}</a>'.format(
-                reverse('wl_applications:view_application', args=[obj.pk]),
+                base.reverse_url('wl_applications:view_application', obj.pk),
                 'View application (read-only)'
             )
         # Add discard action
         if obj.is_discardable:
             result += ' / <a href="{}">{}</a>'.format(
-                reverse('wl_applications:discard_application', args=[obj.pk]),
+                base.reverse_url('wl_applications:discard_application', obj.pk),
                 'Discard'
             )
         return result
@@ -287,6 +293,7 @@ class DataTableLicencesCustomerView(base.DataTableBaseView):
         'start_date',
         'end_date',
         '',
+        'lifecycle_status',
         '']
 
     columns_helpers = dict(base.DataTableBaseView.columns_helpers.items(), **{
@@ -304,29 +311,36 @@ class DataTableLicencesCustomerView(base.DataTableBaseView):
             'render': lambda self, instance: base.render_date(instance.end_date)
         },
         'licence': {
-            'render': lambda self, instance: base.render_licence_document(instance)
+            'render': lambda self, instance: base.render_licence_document(instance),
+            'related': ['licence_document']
         },
         'status': {
-            'render': lambda self, instance: self._render_status(instance)
+            'render': lambda self, instance: self._render_status(instance,
+                                                                 *self.page_data['applications'][instance.pk])
         },
         'action': {
-            'render': lambda self, instance: self._render_action(instance)
+            'render': lambda self, instance: self._render_action(instance,
+                                                                 *self.page_data['applications'][instance.pk])
         }
     })
 
+    def prefetch_page_data(self, rows):
+        return {
+            'applications': base.get_licences_applications(rows)
+        }
+
     @staticmethod
-    def _render_status(instance):
-        try:
-            application = Application.objects.get(licence=instance)
-            replacing_application = Application.objects.get(previous_application=application)
+    def _render_status(instance, application, replacing_application):
+        status = base.render_licence_status(instance)
+        if status is not None:
+            return status
 
+        if replacing_application is not None:
             if replacing_application.licence is not None and replacing_application.licence.is_issued:
                 if replacing_application.application_type == 'amendment':
                     return 'Amended'
                 else:
                     return 'Renewed'
-        except Application.DoesNotExist:
-            pass
 
         if instance.end_date is not None:
             expiry_days = (instance.end_date - datetime.date.today()).days
@@ -346,10 +360,8 @@ class DataTableLicencesCustomerView(base.DataTableBaseView):
             return 'Current'
 
     @staticmethod
-    def _render_action(instance):
-        try:
-            application = Application.objects.get(licence=instance)
-            replacing_application = Application.objects.get(previous_application=application)
+    def _render_action(instance, application, replacing_application):
+        if replacing_application is not None:
             if replacing_application.licence is None or not replacing_application.licence.is_issued:
                 if replacing_application.application_type == 'amendment':
                     return 'Amendment Pending'
@@ -357,11 +369,9 @@ class DataTableLicencesCustomerView(base.DataTableBaseView):
                     return 'Renewal Pending'
             else:
                 return 'N/A'
-        except Application.DoesNotExist:
-            pass
 
-        renew_url = reverse('wl_applications:renew_licence', args=(instance.pk,))
-        amend_url = reverse('wl_applications:amend_licence', args=(instance.pk,))
+        renew_url = base.reverse_url('wl_applications:renew_licence', instance.pk)
+        amend_url = base.reverse_url('wl_applications:amend_licence', instance.pk)
 
         if instance.end_date is not None:
             expiry_days = (instance.end_date - datetime.date.today()).days
@@ -399,6 +409,11 @@ class DataTableLicencesCustomerView(base.DataTableBaseView):
         # should only see the issued customer's licence
         return WildlifeLicence.objects.filter(holder=self.request.user).filter(licence_number__isnull=False)
 
+    def ordering(self, qs):
+        # annotated here so the status is not part of the count queries
+        qs = base.annotate_licence_status(qs, replacing_issued_only=True)
+        return super(DataTableLicencesCustomerView, self).ordering(qs)
+
 
 class DataTableReturnsCustomerView(base.DataTableBaseView):
     model = Return
@@ -416,7 +431,7 @@ class DataTableReturnsCustomerView(base.DataTableBaseView):
         ['licence.licence_type.short_name', 'licence.licence_type.name'],
         'lodgement_date',
         'due_date',
-        'status',
+        ['urgency', 'status'],
         '',
         ''
     ]
@@ -431,45 +446,57 @@ class DataTableReturnsCustomerView(base.DataTableBaseView):
                 search)
         },
         'lodgement_date': {
-            'render': lambda self, instance: base.render_date(instance.lodgement_date)
+            'render': lambda self, instance: base.render_date(instance.lodgement_date),
+            'compact': lambda self, instance: base.compact_date(instance.lodgement_date)
         },
         'due_date': {
-            'render': lambda self, instance: base.render_date(instance.due_date)
+            'render': lambda self, instance: base.render_date(instance.due_date),
+            'compact': lambda self, instance: base.compact_date(instance.due_date)
         },
         'licence': {
             'render': lambda self, instance: base.render_licence_number(instance.licence),
             'search': lambda self, search: DataTableReturnsCustomerView._search_licence_number(search)
         },
         'action': {
-            'render': lambda self, instance: self._render_action(instance)
+            'render': lambda self, instance: self._render_action(instance),
+            'compact': lambda self, instance: [instance.pk, self._get_action(instance)]
         },
         'status': {
-            'render': lambda self, instance: self._render_status(instance)
+            'render': lambda self, instance: self._render_status(instance),
+            'compact': lambda self, instance: [instance.status, get_return_urgency(instance), instance.nil_return]
         }
     }
+    COMPACT_URLS = {
+        'enter_return': 'wl_returns:enter_return',
+        'view_return': 'wl_returns:view_return',
+    }
 
     @staticmethod
-    def _render_action(instance):
+    def _get_action(instance):
+        """
+        :return: the action of the return, one of the RETURN_ACTIONS
+        """
         if instance.status == 'current':
-            url = reverse('wl_returns:enter_return', args=(instance.pk,))
-            return '<a href="{0}">Enter Return</a>'.format(url)
+            return 'enter'
         elif instance.status == 'draft':
-            url = reverse('wl_returns:enter_return', args=(instance.pk,))
-            return '<a href="{0}">Edit Return</a>'.format(url)
+            return 'edit'
         elif instance.status == 'amendment_required':
-            url = reverse('wl_returns:enter_return', args=(instance.pk,))
-            return '<a href="{0}">Amend Return</a>'.format(url)
+            return 'amend'
         else:
-            url = reverse('wl_returns:view_return', args=(instance.pk,))
-            return '<a href="{0}">View Return (read-only)</a>'.format(url)
+            return 'view'
+
+    @classmethod
+    def _render_action(cls, instance):
+        return base.render_return_action(instance.pk, cls._get_action(instance))
 
     @staticmethod
     def _render_status(instance):
         status = instance.status
         if status == 'current':
-            if is_return_overdue(instance):
+            urgency = get_return_urgency(instance)
+            if urgency == URGENCY_OVERDUE:
                 return '<span class="label label-danger">Overdue</span>'
-            elif is_return_due_soon(instance):
+            elif urgency == URGENCY_DUE_SOON:
                 return '<span class="label label-warning">Due soon</span>'
             else:
                 return 'Current'
@@ -492,3 +519,7 @@ class DataTableReturnsCustomerView(base.DataTableBaseView):
 
     def get_initial_queryset(self):
         return Return.objects.filter(licence__holder=self.request.user).exclude(status='future')
+
+    def ordering(self, qs):
+        # the urgency is annotated here so it is not part of the count queries
+        return super(DataTableReturnsCustomerView, self).ordering(annotate_urgency(qs))
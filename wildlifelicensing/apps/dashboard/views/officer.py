@@ -2,21 +2,24 @@ import datetime
 import logging
 
 from dateutil.parser import parse as date_parse
-from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.core.urlresolvers import reverse_lazy, reverse
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.http.response import HttpResponse
 
 from wildlifelicensing.apps.applications.models import Application
 from wildlifelicensing.apps.dashboard.views import base
 from wildlifelicensing.apps.dashboard.views.customer import DataTableReturnsCustomerView, \
     DataTableApplicationCustomerView
-from wildlifelicensing.apps.main.helpers import get_all_officers
+from wildlifelicensing.apps.main.cache import bump_generation_on_commit
+from wildlifelicensing.apps.main.reference import get_officers
 from wildlifelicensing.apps.main.mixins import OfficerRequiredMixin
 from wildlifelicensing.apps.main.models import WildlifeLicence
 from wildlifelicensing.apps.main.pdf import bulk_licence_renewal_pdf_bytes
+from wildlifelicensing.apps.payments.utils import get_payment_statuses, annotate_payment_status, PAYMENT_STATUSES, \
+    PAYMENT_STATUS_AWAITING, PAYMENT_STATUS_CC_READY, PAYMENT_STATUS_PAID, PAYMENT_STATUS_NOT_REQUIRED
 from wildlifelicensing.apps.returns.models import Return
-from wildlifelicensing.apps.returns.utils import is_return_overdue, is_return_due_soon
+from wildlifelicensing.apps.returns.utils import get_return_urgency, annotate_urgency, get_urgency_query, \
+    URGENCY_OVERDUE, URGENCY_DUE_SOON
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +27,7 @@ logger = logging.getLogger(__name__)
 def _render_cover_letter_document(licence):
     if licence is not None and licence.cover_letter_document is not None:
         return '<a href="{0}" target="_blank">View PDF</a><img height="20" src="{1}"></img>'.format(
-            licence.cover_letter_document.file.url, static('wl/img/pdf.png'))
+            licence.cover_letter_document.file.url, base.static_url('wl/img/pdf.png'))
     else:
         return ''
 
@@ -33,57 +36,115 @@ class DashboardOfficerTreeView(OfficerRequiredMixin, base.DashboardTreeViewBase)
     template_name = 'wl/dash_tree.html'
     title = 'Officer Dashboard'
 
-    def _build_tree_nodes(self):
-        # Applications
-        # The draft status is excluded from the officer status list
-        url = reverse_lazy('wl_dashboard:tables_applications_officer')
-        result = []
-        statuses = base.get_processing_statuses_but_draft()
-        all_applications = Application.objects.filter(processing_status__in=[s[0] for s in statuses])
-        # the next query param is necessary to avoid loading parameters from the session.
-        query = {
-            'show': 'applications'
+    counts_models = [Application, Return, WildlifeLicence]
+
+    # the officer nodes first, then the global ones.
+    tree_parts = ['user', 'global']
+    lazy_tree = True
+
+    @staticmethod
+    def _compute_global_tree_counts():
+        """
+        The counts that are the same for every officer.
+        :return: a dict {
+            'applications': {status: count},
+            'licences': count,
+            'returns': count,
         }
-        all_applications_node = self._create_node('All applications', href=base.build_url(url, query),
-                                                  count=all_applications.count())
-        all_applications_node['state']['expanded'] = False
-        for s_value, s_title in statuses:
-            applications = all_applications.filter(processing_status=s_value)
-            if applications.count() > 0:
-                query = {
-                    'application_status': s_value,
-                }
-                href = base.build_url(url, query)
-                node = self._create_node(s_title, href=href, count=applications.count())
-                self._add_node(all_applications_node, node)
+        """
+        statuses = [s[0] for s in base.get_processing_statuses_but_draft()]
+        applications_counts = Application.objects.filter(processing_status__in=statuses).order_by().\
+            values('processing_status').annotate(count=Count('pk'))
+        return {
+            'applications': {row['processing_status']: row['count'] for row in applications_counts},
+            'licences': WildlifeLicence.objects.count(),
+            'returns': Return.objects.exclude(status__in=['draft', 'future']).count(),
+        }
+
+    @staticmethod
+    def _compute_user_tree_counts(user):
+        """
+        The counts specific to the given officer.
+        :return: a dict {
+            'assigned_applications': {status: count},
+            'on_behalf_pending_applications': count,
+            'on_behalf_overdue_returns': count,
+        }
+        """
+        statuses = [s[0] for s in base.get_processing_statuses_but_draft()]
+        assigned_query = Q(processing_status__in=statuses) & Q(assigned_officer=user)
+        on_behalf_pending_query = DataTableApplicationsOfficerOnBehalfView._get_proxy_applications_query(user) & \
+            DataTableApplicationsOfficerOnBehalfView.filter_status(TablesApplicationsOfficerView.STATUS_PENDING)
+        # one query for all the applications counts grouped by status
+        applications_counts = base.count_by(
+            Application.objects.filter(assigned_query | on_behalf_pending_query),
+            'processing_status',
+            assigned=assigned_query,
+            on_behalf_pending=on_behalf_pending_query
+        )
+        on_behalf_overdue_returns_count = DataTableReturnsOfficerOnBehalfView._get_proxy_returns(user).filter(
+            DataTableReturnsOfficerOnBehalfView.filter_status(TablesReturnsOfficerView.OVERDUE_FILTER)).count()
+        return {
+            'assigned_applications': {status: counts['assigned'] for status, counts in applications_counts.items()
+                                      if counts['assigned']},
+            'on_behalf_pending_applications': sum(counts['on_behalf_pending']
+                                                  for counts in applications_counts.values()),
+            'on_behalf_overdue_returns': on_behalf_overdue_returns_count,
+        }
+
+    @classmethod
+    def get_tree_counts(cls, user):
+        """
+        Compute (or get from the cache) all the counts displayed in the tree for the given officer.
+        """
+        result = {}
+        result.update(cls.get_cached_counts('global', cls._compute_global_tree_counts))
+        result.update(cls.get_cached_counts('user', lambda: cls._compute_user_tree_counts(user), user=user))
+        return result
 
-        assigned_applications = all_applications.filter(assigned_officer=self.request.user)
+    def _get_part_counts(self, part):
+        if part == 'global':
+            return self.get_cached_counts('global', self._compute_global_tree_counts)
+        user = self.request.user
+        return self.get_cached_counts('user', lambda: self._compute_user_tree_counts(user), user=user)
+
+    def _build_part_nodes(self, part, counts):
+        if part == 'global':
+            return self._build_global_nodes(counts)
+        return self._build_user_nodes(counts)
+
+    def _build_user_nodes(self, counts):
+        """
+        The nodes of the officer assigned applications and proxy page.
+        :param counts: see _compute_user_tree_counts or None for the nodes without counts.
+        """
+        result = []
+        url = reverse_lazy('wl_dashboard:tables_applications_officer')
+        statuses = base.get_processing_statuses_but_draft()
+        assigned_applications_counts = counts['assigned_applications'] if counts is not None else {}
         query = {
             'application_assignee': self.request.user.pk
         }
         assigned_applications_node = self._create_node('My assigned applications',
                                                        href=base.build_url(url, query),
-                                                       count=assigned_applications.count())
+                                                       count=sum(assigned_applications_counts.values())
+                                                       if counts is not None else None)
         assigned_applications_node['state']['expanded'] = True
         for s_value, s_title in statuses:
-            applications = assigned_applications.filter(processing_status=s_value)
-            if applications.count() > 0:
+            count = assigned_applications_counts.get(s_value, 0)
+            if count > 0:
                 query.update({
                     'application_status': s_value
                 })
                 href = base.build_url(url, query)
-                node = self._create_node(s_title, href=href, count=applications.count())
+                node = self._create_node(s_title, href=href, count=count)
                 self._add_node(assigned_applications_node, node)
         result.append(assigned_applications_node)
 
-        on_behalf_pending_applications_count = \
-            DataTableApplicationsOfficerOnBehalfView._get_proxy_applications(self.request.user).filter(
-                DataTableApplicationsOfficerOnBehalfView.filter_status(
-                    TablesApplicationsOfficerView.STATUS_PENDING)).count()
-
-        on_behalf_overdue_returns_count = DataTableReturnsOfficerOnBehalfView._get_proxy_returns(
-            self.request.user).filter(
-            DataTableReturnsOfficerOnBehalfView.filter_status(TablesReturnsOfficerView.OVERDUE_FILTER)).count()
+        if counts is None:
+            return result
+        on_behalf_pending_applications_count = counts['on_behalf_pending_applications']
+        on_behalf_overdue_returns_count = counts['on_behalf_overdue_returns']
 
         total_on_behalf = on_behalf_pending_applications_count + on_behalf_overdue_returns_count
         if total_on_behalf > 0:
@@ -114,7 +175,36 @@ class DashboardOfficerTreeView(OfficerRequiredMixin, base.DashboardTreeViewBase)
             self._add_node(on_behalf_node, on_behalf_returns_node)
             on_behalf_node['state']['expanded'] = False
             result.append(on_behalf_node)
+        return result
 
+    def _build_global_nodes(self, counts):
+        """
+        The nodes of all the applications, licences and returns.
+        :param counts: see _compute_global_tree_counts or None for the nodes without counts.
+        """
+        result = []
+        # Applications
+        # The draft status is excluded from the officer status list
+        url = reverse_lazy('wl_dashboard:tables_applications_officer')
+        statuses = base.get_processing_statuses_but_draft()
+        applications_counts = counts['applications'] if counts is not None else {}
+        # the next query param is necessary to avoid loading parameters from the session.
+        query = {
+            'show': 'applications'
+        }
+        all_applications_node = self._create_node('All applications', href=base.build_url(url, query),
+                                                  count=sum(applications_counts.values())
+                                                  if counts is not None else None)
+        all_applications_node['state']['expanded'] = False
+        for s_value, s_title in statuses:
+            count = applications_counts.get(s_value, 0)
+            if count > 0:
+                query = {
+                    'application_status': s_value,
+                }
+                href = base.build_url(url, query)
+                node = self._create_node(s_title, href=href, count=count)
+                self._add_node(all_applications_node, node)
         result.append(all_applications_node)
 
         # Licences
@@ -123,7 +213,8 @@ class DashboardOfficerTreeView(OfficerRequiredMixin, base.DashboardTreeViewBase)
             'show': 'licences'
         }
         url = base.build_url(url, query)
-        all_licences_node = self._create_node('All licences', href=url, count=WildlifeLicence.objects.count())
+        all_licences_node = self._create_node('All licences', href=url,
+                                              count=counts['licences'] if counts is not None else None)
         result.append(all_licences_node)
 
         # Returns
@@ -133,7 +224,7 @@ class DashboardOfficerTreeView(OfficerRequiredMixin, base.DashboardTreeViewBase)
         }
         url = base.build_url(url, query)
         all_returns_node = self._create_node('All returns', href=url,
-                                             count=Return.objects.exclude(status__in=['draft', 'future']).count())
+                                             count=counts['returns'] if counts is not None else None)
         result.append(all_returns_node)
 
         return result
@@ -172,8 +263,7 @@ class TablesApplicationsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
             },
             {
                 'title': 'Payment',
-                'searchable': False,
-                'orderable': False
+                'searchable': False
             },
             {
                 'title': 'Application PDF',
@@ -204,12 +294,15 @@ class TablesApplicationsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
             [('all', 'All')] + [(self.STATUS_PENDING, self.STATUS_PENDING.capitalize())] + \
             base.get_processing_statuses_but_draft()
 
-        assignee_filter_values = [('all', 'All')] + [(user.pk, base.render_user_name(user),) for user in
-                                                     get_all_officers()]
+        assignee_filter_values = [('all', 'All')] + get_officers()
+        payment_filter_values = [('all', 'All')] + [(status, PAYMENT_STATUSES[status]) for status in
+                                                    [PAYMENT_STATUS_AWAITING, PAYMENT_STATUS_CC_READY,
+                                                     PAYMENT_STATUS_PAID, PAYMENT_STATUS_NOT_REQUIRED]]
         return {
             'licence_type': self.get_licence_types_values(),
             'status': status_filter_values,
-            'assignee': assignee_filter_values
+            'assignee': assignee_filter_values,
+            'payment': payment_filter_values
         }
 
     @property
@@ -238,11 +331,22 @@ class DataTableApplicationsOfficerView(OfficerRequiredMixin, base.DataTableAppli
         'processing_status',
         'lodgement_date',
         ['assigned_officer.first_name', 'assigned_officer.last_name', 'assigned_officer.email'],
-        ''
+        'payment_status',
+        '',
         ''
     ]
 
+    KEYSET_PAGING_COLUMNS = ('processing_status', 'lodgement_number')
+    COUNT_STRATEGY = base.COUNT_CACHED
+    PAGE_CACHE = True
+    PAGE_CACHE_PER_USER = False
+    EXPORT_EXCLUDED_COLUMNS = ('application_pdf', 'action')
+
     columns_helpers = dict(base.DataTableApplicationBaseView.columns_helpers.items(), **{
+        'applicant': {
+            'render': lambda self, instance: base.render_user_name(instance.applicant, first_name_first=False),
+            'search': base.TrigramSearch(['applicant_profile__user__last_name', 'applicant_profile__user__first_name'])
+        },
         'lodgement_number': {
             'search': lambda self, search: DataTableApplicationsOfficerView._search_lodgement_number(search),
             'render': lambda self, instance: base.render_lodgement_number(instance),
@@ -251,26 +355,33 @@ class DataTableApplicationsOfficerView(OfficerRequiredMixin, base.DataTableAppli
             'render': lambda self, instance: base.render_date(instance.lodgement_date)
         },
         'assigned_officer': {
-            'search': lambda self, search: base.build_field_query(
-                ['assigned_officer__last_name', 'assigned_officer__first_name'],
-                search
-            ),
+            'search': base.TrigramSearch(['assigned_officer__last_name', 'assigned_officer__first_name']),
             'render': lambda self, instance: base.render_user_name(instance.assigned_officer)
         },
         'payment': {
-            'render': lambda self, instance: base.render_payment(instance, self.request.build_absolute_uri(
-                reverse('wl_dashboard:tables_applications_officer')))
+            'render': lambda self, instance: base.render_payment(instance, self.page_data['payment_redirect_url'],
+                                                                 self.page_data['payment_statuses'][instance.pk]),
+            # the payments are made in the ledger
+            'cache': False
         },
         'application_pdf': {
             'render': lambda self, instance: base.render_application_document(instance)
         },
         'action': {
             'render': lambda self, instance: DataTableApplicationsOfficerView._render_action_column(instance),
+            'related': ['licence__licence_document']
         }
     })
 
     SESSION_SAVE_SETTINGS = True
 
+    def prefetch_page_data(self, rows):
+        return {
+            'payment_statuses': get_payment_statuses(rows),
+            'payment_redirect_url': self.request.build_absolute_uri(
+                reverse('wl_dashboard:tables_applications_officer'))
+        }
+
     @staticmethod
     def _get_pending_processing_statuses():
         return [s[0] for s in Application.PROCESSING_STATUS_CHOICES
@@ -283,6 +394,30 @@ class DataTableApplicationsOfficerView(OfficerRequiredMixin, base.DataTableAppli
             return Q(processing_status__in=DataTableApplicationsOfficerView._get_pending_processing_statuses())
         return Q(processing_status=value) if value != 'all' else ~Q(customer_status='draft')
 
+    @staticmethod
+    def filter_payment(value):
+        # needs the payment_status annotation (see filter_queryset)
+        return Q(payment_status=value) if value.lower() != 'all' else None
+
+    def _is_payment_status_filtered(self):
+        return self._get_filters().get('payment', 'all').lower() != 'all'
+
+    def _is_payment_status_ordered(self):
+        payment_column = self.columns.index('payment')
+        return any(column == payment_column for column, direction in self._get_order_config_array())
+
+    def filter_queryset(self, qs):
+        # The payment status is computed by the database (subqueries on the ledger invoices). The annotation is only
+        # added when required so it doesn't slow down the other requests.
+        if self._is_payment_status_filtered():
+            qs = annotate_payment_status(qs)
+        return super(DataTableApplicationsOfficerView, self).filter_queryset(qs)
+
+    def ordering(self, qs):
+        if self._is_payment_status_ordered() and 'payment_status' not in qs.query.annotations:
+            qs = annotate_payment_status(qs)
+        return super(DataTableApplicationsOfficerView, self).ordering(qs)
+
     @staticmethod
     def _search_lodgement_number(search):
         # testing to see if search term contains no spaces and two hyphens, meaning it's a lodgement number with a sequence
@@ -303,24 +438,24 @@ class DataTableApplicationsOfficerView(OfficerRequiredMixin, base.DataTableAppli
         action = ''
         if obj.processing_status == 'ready_for_conditions':
             action += '<a href="{0}">Enter Conditions</a>'.format(
-                reverse('wl_applications:enter_conditions', args=[obj.pk]),
+                base.reverse_url('wl_applications:enter_conditions', obj.pk),
             )
         elif obj.processing_status == 'ready_to_issue':
             action += '<a href="{0}">Issue Licence</a>'.format(
-                reverse('wl_applications:issue_licence', args=[obj.pk]),
+                base.reverse_url('wl_applications:issue_licence', obj.pk),
             )
         elif any([issued, discarded, declined]):
             action += '<a href="{0}">{1}</a>'.format(
-                reverse('wl_applications:view_application_officer', args=[obj.pk]),
+                base.reverse_url('wl_applications:view_application_officer', obj.pk),
                 'View (read-only)'
             )
         else:
             action += '<a href="{0}">Process</a>'.format(
-                reverse('wl_applications:process', args=[obj.pk]),
+                base.reverse_url('wl_applications:process', obj.pk),
             )
 
         if obj.invoice_reference:
-            url = '{}?invoice={}'.format(reverse('payments:invoice-payment'),obj.invoice_reference)
+            url = '{}?invoice={}'.format(base.reverse_url('payments:invoice-payment'),obj.invoice_reference)
             action += '<br \><a target="_blank" href="{0}"> View Payment</a>'.format(
                 url
             )
@@ -415,13 +550,17 @@ class TablesOfficerOnBehalfView(OfficerRequiredMixin, base.TablesBaseView):
                 'title': 'User'
             },
             {
-                'title': 'Lodged On'
+                'title': 'Lodged On',
+                'compact': 'date'
             },
             {
-                'title': 'Due On'
+                'title': 'Due On',
+                'compact': 'date'
             },
             {
-                'title': 'Status'
+                'title': 'Status',
+                'compact': 'returnStatus',
+                'compactLabels': dict(Return.STATUS_CHOICES)
             },
             {
                 'title': 'Licence',
@@ -429,6 +568,7 @@ class TablesOfficerOnBehalfView(OfficerRequiredMixin, base.TablesBaseView):
             },
             {
                 'title': 'Action',
+                'compact': 'returnAction',
                 'searchable': False,
                 'orderable': False
             }
@@ -450,7 +590,8 @@ class TablesOfficerOnBehalfView(OfficerRequiredMixin, base.TablesBaseView):
         status_filter_values = \
             [
                 (TablesReturnsOfficerView.STATUS_FILTER_ALL_BUT_DRAFT_OR_FUTURE, 'All (but draft or future)'),
-                (TablesReturnsOfficerView.OVERDUE_FILTER, TablesReturnsOfficerView.OVERDUE_FILTER.capitalize())
+                (TablesReturnsOfficerView.OVERDUE_FILTER, TablesReturnsOfficerView.OVERDUE_FILTER.capitalize()),
+                (TablesReturnsOfficerView.DUE_SOON_FILTER, 'Due soon (or overdue)')
             ] + list(Return.STATUS_CHOICES)
         return {
             'licence_type': self.get_licence_types_values(),
@@ -503,9 +644,13 @@ class DataTableApplicationsOfficerOnBehalfView(OfficerRequiredMixin, base.DataTa
         # same as a customer
         return DataTableApplicationCustomerView.render_action_column(obj)
 
+    @staticmethod
+    def _get_proxy_applications_query(user):
+        return Q(proxy_applicant=user) & ~Q(customer_status='temp')
+
     @staticmethod
     def _get_proxy_applications(user):
-        return Application.objects.filter(proxy_applicant=user).exclude(customer_status='temp')
+        return Application.objects.filter(DataTableApplicationsOfficerOnBehalfView._get_proxy_applications_query(user))
 
     @staticmethod
     def filter_status(value):
@@ -524,6 +669,8 @@ class TablesLicencesOfficerView(OfficerRequiredMixin, base.TablesBaseView):
     STATUS_FILTER_ACTIVE = 'active'
     STATUS_FILTER_RENEWABLE = 'renewable'
     STATUS_FILTER_EXPIRED = 'expired'
+    STATUS_FILTER_RENEWED = 'renewed'
+    STATUS_FILTER_AMENDED = 'amended'
     STATUS_FILTER_ALL = 'all'
 
     licences_data_url_lazy = reverse_lazy('wl_dashboard:data_licences_officer')
@@ -563,8 +710,7 @@ class TablesLicencesOfficerView(OfficerRequiredMixin, base.TablesBaseView):
             },
             {
                 'title': 'Status',
-                'searchable': False,
-                'orderable': False
+                'searchable': False
             },
             {
                 'title': 'Action',
@@ -592,6 +738,8 @@ class TablesLicencesOfficerView(OfficerRequiredMixin, base.TablesBaseView):
             (self.STATUS_FILTER_RENEWABLE,
              self.STATUS_FILTER_RENEWABLE.capitalize() + ' (expires within 30 days)'),
             (self.STATUS_FILTER_EXPIRED, self.STATUS_FILTER_EXPIRED.capitalize()),
+            (self.STATUS_FILTER_RENEWED, self.STATUS_FILTER_RENEWED.capitalize()),
+            (self.STATUS_FILTER_AMENDED, self.STATUS_FILTER_AMENDED.capitalize()),
         ]
         return {
             'licence_type': self.get_licence_types_values(),
@@ -631,8 +779,17 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
         'issue_date',
         'end_date',
         '',
+        '',
+        '',
+        'lifecycle_status',
         '']
 
+    COUNT_STRATEGY = base.COUNT_CACHED
+    PAGE_CACHE = True
+    PAGE_CACHE_PER_USER = False
+    EXPORT_EXCLUDED_COLUMNS = ('licence', 'cover_letter', 'renewal_letter', 'action')
+    PAGE_CACHE_MODELS = [WildlifeLicence, Application]
+
     columns_helpers = dict(base.DataTableBaseView.columns_helpers.items(), **{
         'licence_number': {
             'search': lambda self, search: DataTableLicencesOfficerView._search_licence_number(search),
@@ -640,9 +797,7 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
         },
         'profile.user': {
             'render': lambda self, instance: base.render_user_name(instance.profile.user, first_name_first=False),
-            'search': lambda self, search: base.build_field_query([
-                'profile__user__last_name', 'profile__user__first_name'],
-                search),
+            'search': base.TrigramSearch(['profile__user__last_name', 'profile__user__first_name']),
         },
         'issue_date': {
             'render': lambda self, instance: base.render_date(instance.issue_date)
@@ -654,34 +809,60 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
             'render': lambda self, instance: base.render_date(instance.end_date)
         },
         'licence': {
-            'render': lambda self, instance: base.render_licence_document(instance)
+            'render': lambda self, instance: base.render_licence_document(instance),
+            'related': ['licence_document']
         },
         'cover_letter': {
-            'render': lambda self, instance: _render_cover_letter_document(instance)
+            'render': lambda self, instance: _render_cover_letter_document(instance),
+            'related': ['cover_letter_document']
         },
         'renewal_letter': {
             'render': lambda self, instance: self._render_renewal_letter(instance)
         },
         'status': {
-            'render': lambda self, instance: self._render_status(instance)
+            'render': lambda self, instance: self._render_status(instance,
+                                                                 *self.page_data['applications'][instance.pk])
         },
         'action': {
-            'render': lambda self, instance: self._render_action(instance)
+            'render': lambda self, instance: self._render_action(instance,
+                                                                 *self.page_data['applications'][instance.pk])
         }
     })
 
+    def prefetch_page_data(self, rows):
+        return {
+            'applications': base.get_licences_applications(rows)
+        }
+
+    # status filters on the annotated lifecycle_status (see filter_queryset)
+    LIFECYCLE_STATUS_FILTERS = {
+        TablesLicencesOfficerView.STATUS_FILTER_RENEWABLE: base.LICENCE_STATUS_DUE_FOR_RENEWAL,
+        TablesLicencesOfficerView.STATUS_FILTER_EXPIRED: base.LICENCE_STATUS_EXPIRED,
+        TablesLicencesOfficerView.STATUS_FILTER_RENEWED: base.LICENCE_STATUS_RENEWED,
+        TablesLicencesOfficerView.STATUS_FILTER_AMENDED: base.LICENCE_STATUS_AMENDED,
+    }
+
     @staticmethod
     def filter_status(value):
         today = datetime.date.today()
         if value == TablesLicencesOfficerView.STATUS_FILTER_ACTIVE:
             return Q(start_date__lte=today) & Q(end_date__gte=today)
-        elif value == TablesLicencesOfficerView.STATUS_FILTER_RENEWABLE:
-            return Q(is_renewable=True) & Q(end_date__gte=today) & Q(end_date__lte=today + datetime.timedelta(days=30))
-        elif value == TablesLicencesOfficerView.STATUS_FILTER_EXPIRED:
-            return Q(end_date__lt=today)
+        elif value in DataTableLicencesOfficerView.LIFECYCLE_STATUS_FILTERS:
+            return Q(lifecycle_status=DataTableLicencesOfficerView.LIFECYCLE_STATUS_FILTERS[value])
         else:
             return None
 
+    def filter_queryset(self, qs):
+        # the status is only annotated when filtered on, it would be computed for the counts otherwise.
+        if self._get_filters().get('status') in self.LIFECYCLE_STATUS_FILTERS:
+            qs = base.annotate_licence_status(qs)
+        return super(DataTableLicencesOfficerView, self).filter_queryset(qs)
+
+    def ordering(self, qs):
+        if 'lifecycle_status' not in qs.query.annotations:
+            qs = base.annotate_licence_status(qs)
+        return super(DataTableLicencesOfficerView, self).ordering(qs)
+
     @staticmethod
     def filter_licence_type(value):
         if value.lower() != 'all':
@@ -725,25 +906,24 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
     def _render_renewal_letter(instance):
         if instance.is_renewable:
             return '<a href="{0}" target="_blank">Create PDF</a><img height="20" src="{1}"></img>'. \
-                format(reverse('wl_main:licence_renewal_pdf', args=(instance.pk,)), static('wl/img/pdf.png'))
+                format(base.reverse_url('wl_main:licence_renewal_pdf', instance.pk), base.static_url('wl/img/pdf.png'))
         else:
             return 'Not renewable'
 
     @staticmethod
-    def _render_status(instance):
+    def _render_status(instance, application, replacing_application):
+        status = base.render_licence_status(instance)
+        if status is not None:
+            return status
+
         if not instance.is_issued:
             return 'Unissued'
 
-        try:
-            application = Application.objects.get(licence=instance)
-            replacing_application = Application.objects.get(previous_application=application)
-
+        if replacing_application is not None:
             if replacing_application.application_type == 'amendment':
                 return 'Amended'
             else:
                 return 'Renewed'
-        except Application.DoesNotExist:
-            pass
 
         if instance.end_date is not None:
             expiry_days = (instance.end_date - datetime.date.today()).days
@@ -763,20 +943,16 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
             return 'Unissued'
 
     @staticmethod
-    def _render_action(instance):
-        try:
-            application = Application.objects.get(licence=instance)
-            if Application.objects.filter(previous_application=application).exists():
-                return 'N/A'
-        except Application.DoesNotExist:
-            application = None
+    def _render_action(instance, application, replacing_application):
+        if replacing_application is not None:
+            return 'N/A'
 
         if not instance.is_issued:
-            return '<a href="{0}">Issue</a>'.format(reverse('wl_applications:issue_licence', args=(application.pk,)))
+            return '<a href="{0}">Issue</a>'.format(base.reverse_url('wl_applications:issue_licence', application.pk))
 
-        amend_url = reverse('wl_applications:amend_licence', args=(instance.pk,))
-        renew_url = reverse('wl_applications:renew_licence', args=(instance.pk,))
-        reissue_url = reverse('wl_applications:reissue_licence', args=(instance.pk,))
+        amend_url = base.reverse_url('wl_applications:amend_licence', instance.pk)
+        renew_url = base.reverse_url('wl_applications:renew_licence', instance.pk)
+        reissue_url = base.reverse_url('wl_applications:reissue_licence', instance.pk)
 
         if instance.end_date is not None:
             expiry_days = (instance.end_date - datetime.date.today()).days
@@ -791,7 +967,7 @@ class DataTableLicencesOfficerView(OfficerRequiredMixin, base.DataTableBaseView)
             else:
                 return 'N/A'
         else:
-            return '<a href="{0}">Issue</a>'.format(reverse('wl_applications:issue_licence', args=(application.pk,)))
+            return '<a href="{0}">Issue</a>'.format(base.reverse_url('wl_applications:issue_licence', application.pk))
 
     def get_initial_queryset(self):
         return WildlifeLicence.objects.all()
@@ -802,6 +978,7 @@ class TablesReturnsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
 
     STATUS_FILTER_ALL_BUT_DRAFT_OR_FUTURE = 'all_but_draft_or_future'
     OVERDUE_FILTER = 'overdue'
+    DUE_SOON_FILTER = 'due_soon'
 
     returns_data_url_lazy = reverse_lazy('wl_dashboard:data_returns_officer')
 
@@ -818,13 +995,17 @@ class TablesReturnsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
                 'title': 'User'
             },
             {
-                'title': 'Lodged On'
+                'title': 'Lodged On',
+                'compact': 'date'
             },
             {
-                'title': 'Due On'
+                'title': 'Due On',
+                'compact': 'date'
             },
             {
-                'title': 'Status'
+                'title': 'Status',
+                'compact': 'returnStatus',
+                'compactLabels': dict(Return.STATUS_CHOICES)
             },
             {
                 'title': 'Licence',
@@ -832,6 +1013,7 @@ class TablesReturnsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
             },
             {
                 'title': 'Action',
+                'compact': 'returnAction',
                 'searchable': False,
                 'orderable': False
             }
@@ -853,7 +1035,8 @@ class TablesReturnsOfficerView(OfficerRequiredMixin, base.TablesBaseView):
         status_filter_values = \
             [
                 (self.STATUS_FILTER_ALL_BUT_DRAFT_OR_FUTURE, 'All (but draft or future)'),
-                (self.OVERDUE_FILTER, self.OVERDUE_FILTER.capitalize())
+                (self.OVERDUE_FILTER, self.OVERDUE_FILTER.capitalize()),
+                (self.DUE_SOON_FILTER, 'Due soon (or overdue)')
             ] + list(Return.STATUS_CHOICES)
         return {
             'licence_type': self.get_licence_types_values(),
@@ -883,9 +1066,14 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
         ['licence.profile.user.last_name', 'licence.profile.user.first_name'],
         'lodgement_date',
         'due_date',
-        'status',
+        ['urgency', 'status'],
         '',
         '']
+    KEYSET_PAGING_COLUMNS = ('lodgement_number', 'due_date')
+    COUNT_STRATEGY = base.COUNT_ESTIMATED
+    PAGE_CACHE = True
+    PAGE_CACHE_PER_USER = False
+
     columns_helpers = dict(base.DataTableBaseView.columns_helpers.items(), **{
         'licence.licence_type': {
             'render': lambda self, instance: instance.licence.licence_type.display_name,
@@ -897,20 +1085,21 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
             'render': lambda self, instance: instance.lodgement_number
         },
         'lodgement_date': {
-            'render': lambda self, instance: base.render_date(instance.lodgement_date)
+            'render': lambda self, instance: base.render_date(instance.lodgement_date),
+            'compact': lambda self, instance: base.compact_date(instance.lodgement_date)
         },
         'licence.profile.user': {
             'render': lambda self, instance: base.render_user_name(instance.licence.profile.user,
                                                                    first_name_first=False),
-            'search': lambda self, search: base.build_field_query([
-                'licence__profile__user__last_name', 'licence__profile__user__first_name'],
-                search),
+            'search': base.TrigramSearch(['licence__profile__user__last_name', 'licence__profile__user__first_name']),
         },
         'due_date': {
-            'render': lambda self, instance: base.render_date(instance.due_date)
+            'render': lambda self, instance: base.render_date(instance.due_date),
+            'compact': lambda self, instance: base.compact_date(instance.due_date)
         },
         'status': {
-            'render': lambda self, instance: self._render_status(instance)
+            'render': lambda self, instance: self._render_status(instance),
+            'compact': lambda self, instance: [instance.status, get_return_urgency(instance), instance.nil_return]
         },
         'licence_number': {
             'render': lambda self, instance: base.render_licence_number(instance.licence),
@@ -918,17 +1107,24 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
 
         },
         'action': {
-            'render': lambda self, instance: self._render_action(instance)
+            'render': lambda self, instance: self._render_action(instance),
+            'compact': lambda self, instance: [instance.pk, self._get_action(instance)]
         }
     })
+    COMPACT_URLS = {
+        'enter_return': 'wl_returns:enter_return',
+        'curate_return': 'wl_returns:curate_return',
+        'view_return': 'wl_returns:view_return',
+    }
 
     @staticmethod
     def _render_status(instance):
         status = instance.status
         if status == 'current':
-            if is_return_overdue(instance):
+            urgency = get_return_urgency(instance)
+            if urgency == URGENCY_OVERDUE:
                 return '<span class="label label-danger">Overdue</span>'
-            elif is_return_due_soon(instance):
+            elif urgency == URGENCY_DUE_SOON:
                 return '<span class="label label-warning">Due soon</span>'
             else:
                 return 'Current'
@@ -937,20 +1133,22 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
             return dict(Return.STATUS_CHOICES)[status] + suffix
 
     @staticmethod
-    def _render_action(instance):
+    def _get_action(instance):
+        """
+        :return: the action of the return, one of the RETURN_ACTIONS
+        """
         if instance.status == 'current' or instance.status == 'future':
-            url = reverse('wl_returns:enter_return', args=(instance.pk,))
-            return '<a href="{0}">Enter Return</a>'.format(url)
+            return 'enter'
         elif instance.status == 'draft':
-            url = reverse('wl_returns:enter_return', args=(instance.pk,))
-            return '<a href="{0}">Edit Return</a>'.format(url)
+            return 'edit'
         elif instance.status in ['submitted', 'amended', 'amendment_required']:
-            text = 'Curate Return'
-            url = reverse('wl_returns:curate_return', args=(instance.pk,))
-            return '<a href="{0}">{1}</a>'.format(url, text)
+            return 'curate'
         else:
-            url = reverse('wl_returns:view_return', args=(instance.pk,))
-            return '<a href="{0}">View Return (read-only)</a>'.format(url)
+            return 'view'
+
+    @classmethod
+    def _render_action(cls, instance):
+        return base.render_return_action(instance.pk, cls._get_action(instance))
 
     @staticmethod
     def filter_licence_type(value):
@@ -966,6 +1164,8 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
         elif value == TablesReturnsOfficerView.OVERDUE_FILTER:
             return Q(due_date__lt=datetime.date.today()) & ~Q(
                 status__in=['future', 'submitted', 'accepted', 'declined'])
+        elif value == TablesReturnsOfficerView.DUE_SOON_FILTER:
+            return get_urgency_query(URGENCY_DUE_SOON)
         elif value == 'all':
             return None
         else:
@@ -987,35 +1187,46 @@ class DataTableReturnsOfficerView(OfficerRequiredMixin, base.DataTableBaseView):
     def get_initial_queryset(self):
         return Return.objects.all()
 
+    def ordering(self, qs):
+        # the urgency is annotated here so it is not part of the count queries
+        return super(DataTableReturnsOfficerView, self).ordering(annotate_urgency(qs))
+
 
 class DataTableReturnsOfficerOnBehalfView(DataTableReturnsOfficerView):
+    # the returns are the ones of the officer
+    PAGE_CACHE_PER_USER = True
+
     @staticmethod
-    def _render_action(instance):
+    def _get_action(instance):
         # same actions as a customer
-        return DataTableReturnsCustomerView._render_action(instance)
+        return DataTableReturnsCustomerView._get_action(instance)
+
+    @staticmethod
+    def _get_proxy_returns_query(user):
+        # proxy_user is the proxy applicant of the licence application (see Return.proxy_user)
+        return Q(proxy_user=user)
 
     @staticmethod
     def _get_proxy_returns(user):
-        return Return.objects.filter(
-            licence__in=WildlifeLicence.objects.filter(application__proxy_applicant=user))
+        return Return.objects.filter(DataTableReturnsOfficerOnBehalfView._get_proxy_returns_query(user))
 
     def get_initial_queryset(self):
         return self._get_proxy_returns(self.request.user)
 
 
 class BulkLicenceRenewalPDFView(DataTableLicencesOfficerView):
-    def filter_queryset(self, qs):
-        qs = super(BulkLicenceRenewalPDFView, self).filter_queryset(qs)
-        self.qs = qs
-        return qs
+    """
+    The renewal letters of the licences of the table for the current filters and search.
+    """
 
     def get(self, request, *args, **kwargs):
-        super(BulkLicenceRenewalPDFView, self).get(request, *args, **kwargs)
-        licences = WildlifeLicence.objects.none()
-        if self.qs:
-            licences = self.qs
+        # the licences are filtered directly, not through the ajax table pipeline (and its page cache)
+        self.initialize(*args, **kwargs)
+        licences = list(self.filter_queryset(self.get_initial_queryset()))
         response = HttpResponse(content_type='application/pdf')
         response.write(bulk_licence_renewal_pdf_bytes(licences, request.build_absolute_uri(reverse('home'))))
         if licences:
-            licences.update(renewal_sent=True)
+            WildlifeLicence.objects.filter(pk__in=[licence.pk for licence in licences]).update(renewal_sent=True)
+            # update() doesn't send the signals that invalidate the cached pages and counts
+            bump_generation_on_commit(WildlifeLicence)
         return response
@@ -7,3 +7,11 @@ class MainConfig(AppConfig):
     name = 'wildlifelicensing.apps.main'
     label = 'wl_main'
     verbose_name = 'WL Main'
+
+    run_once = False
+
+    def ready(self):
+        if not self.run_once:
+            from wildlifelicensing.apps.main import signals
+
+        self.run_once = True
@@ -0,0 +1,66 @@
+from __future__ import unicode_literals
+
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'wl_generation_{}'
+
+
+def _get_model_name(model):
+    return model._meta.label_lower
+
+
+def _new_generation():
+    # a time based value so a generation lost by the cache (eviction, restart) never goes back to a value that could
+    # still be part of a stored key, with a random part so two concurrent bumps never set the same value.
+    return '{:x}{:04x}'.format(int(time.time() * 1000), random.getrandbits(16))
+
+
+def get_generation(model):
+    """
+    Return the current generation counter of a model.
+    The generation is bumped every time an instance of the model is saved or deleted (see bump_generation), so it can
+    be part of a cache key to invalidate everything that depends on the model.
+    :param model: a model class
+    :return:
+    """
+    key = GENERATION_KEY.format(_get_model_name(model))
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_generations_key(models):
+    """
+    :param models: list of model classes
+    :return: a string that changes every time one of the models generation is bumped.
+    """
+    return '-'.join(str(get_generation(model)) for model in models)
+
+
+def bump_generation(model):
+    """
+    Set a new generation for the model.
+    The new value is not derived from the current one (no cache.incr, which is not atomic with the file based cache):
+    concurrent bumps can't end up on the same value.
+    :param model: a model class
+    """
+    cache.set(GENERATION_KEY.format(_get_model_name(model)), _new_generation(), None)
+
+
+def bump_generation_on_commit(model):
+    """
+    Bump the generation of the model for a change made in the current transaction.
+    Inside a transaction, the generation is bumped straight away (the transaction must not read what was cached before
+    its change) and again once the transaction is committed: other requests could have cached the data without the
+    change under the first new generation meanwhile.
+    :param model: a model class
+    """
+    bump_generation(model)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_generation(model))
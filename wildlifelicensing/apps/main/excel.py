@@ -1,3 +1,4 @@
+import tempfile
 from collections import defaultdict, OrderedDict
 from openpyxl import load_workbook
 from openpyxl.worksheet.datavalidation import DataValidation
@@ -5,11 +6,26 @@ from openpyxl.utils import get_column_letter
 
 from django.utils import six
 from django.utils.text import Truncator
-from django.http import HttpResponse
+from django.http import HttpResponse, FileResponse
 
 
-def load_workbook_content(filename):
-    return load_workbook(filename)
+def load_workbook_content(filename, read_only=False):
+    """
+    :param read_only: if True the workbook is opened in the openpyxl read-only mode: the worksheets are parsed while
+    they are iterated (see TableData) and never held in memory. The workbook must be closed with close_workbook.
+    """
+    return load_workbook(filename, read_only=read_only)
+
+
+def close_workbook(wb):
+    """
+    Release the file of a read-only workbook.
+    """
+    if hasattr(wb, 'close'):
+        wb.close()
+    elif getattr(wb, '_archive', None) is not None:
+        # openpyxl < 2.5
+        wb._archive.close()
 
 
 def get_named_ranges(wb):
@@ -86,6 +102,30 @@ def get_value_for_key(ws, key, direction='down'):
     return result
 
 
+def reset_read_only_dimensions(ws):
+    """
+    The dimensions of a read-only worksheet come from the <dimension> tag of the file, which can be wrong (ex: 'A1'
+    written by some tools) and would cut the rows and columns iterated by iter_rows. Without them the whole sheet is
+    read.
+    """
+    if getattr(ws.parent, 'read_only', False):
+        ws.max_row = ws.max_column = None
+
+
+def iter_row_values(ws, min_row, min_col, max_row=None, max_col=None):
+    """
+    Iterate through the values of the rows of a worksheet (normal or read-only). Each row is a tuple of max_col -
+    min_col + 1 values if max_col is given.
+    """
+    reset_read_only_dimensions(ws)
+    for row in ws.iter_rows(min_row=min_row, min_col=min_col, max_row=max_row, max_col=max_col):
+        values = tuple(cell.value for cell in row)
+        if max_col is not None and len(values) < max_col - min_col + 1:
+            # the read-only worksheets can return short rows
+            values += (None,) * (max_col - min_col + 1 - len(values))
+        yield values
+
+
 def write_values(ws, top_left_row, top_left_column, values, direction='right', font=None):
     top_cell = ws.cell(row=top_left_row, column=top_left_column)
     write_values_from_cell(top_cell, values, direction, font)
@@ -156,24 +196,45 @@ class TableData:
     The first row represent the column_headers
     The column header parsing stop at the first empty cell on the first row
     The row parsing stops at the first blank row.
+    The worksheet is read sequentially (iter_rows) so it works with the read-only worksheets and the rows are
+    streamed by the iterators (rows_by_col_header_it...). The rows attribute holds all the rows in memory.
     :param transpose: if true the the table is a transposed one. Columns are rows and rows are columns
     """
 
     def __init__(self, worksheet, top_left_row=1, top_left_column=1, nb_cols=None, nb_rows=None, transpose=False):
+        reset_read_only_dimensions(worksheet)
         self.worksheet = worksheet
         self.top_left_row = top_left_row
         self.top_left_column = top_left_column
         self.transpose = transpose
-        self.top_left_cell = worksheet.cell(row=top_left_row, column=top_left_column)
         self.column_headers = self._parse_column_headers()
-        self.rows = self._parse_rows()
+        self._rows = None
+
+    @property
+    def top_left_cell(self):
+        return self.worksheet.cell(row=self.top_left_row, column=self.top_left_column)
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = list(self._parse_rows())
+        return self._rows
+
+    def iter_rows(self):
+        """
+        A row iterator. The worksheet is parsed while iterating unless the rows have already been loaded.
+        :return: [row_n_col1, row_n_col2, ...]
+        """
+        if self._rows is not None:
+            return iter(self._rows)
+        return self._parse_rows()
 
     def by_columns(self):
         """
         :return: [(col_header1, [row1, row2,..]), (col_header2, [row1, row2,..]), ...]
         """
         result = defaultdict(list)
-        for row in self.rows:
+        for row in self.iter_rows():
             for column, value in zip(self.column_headers, row):
                 result[column].append(value)
         return result.items()
@@ -195,20 +256,17 @@ class TableData:
                     .......
                 },
         """
-        for row in self.rows:
-            data = OrderedDict()
-            for i, col_header in enumerate(self.column_headers):
-                if col_header not in data:
-                    data[col_header] = row[i]
-                else:
-                    # if they are two columns with the same header we store it with with a appended _i
-                    count = 1
-                    key = col_header + '_' + str(count)
-                    while key in data:
-                        count += 1
-                        key = col_header + '_' + str(count)
-                    data[key] = row[i]
-            yield data
+        # if they are two columns with the same header we store it with with a appended _i
+        keys = []
+        for col_header in self.column_headers:
+            key = col_header
+            count = 0
+            while key in keys:
+                count += 1
+                key = col_header + '_' + str(count)
+            keys.append(key)
+        for row in self.iter_rows():
+            yield OrderedDict(zip(keys, row))
 
     def rows_by_col_letter_it(self):
         """
@@ -219,7 +277,7 @@ class TableData:
           .....
         }
         """
-        for row in self.rows:
+        for row in self.iter_rows():
             data = {}
             for i, value in enumerate(row):
                 data[get_column_letter(i + 1)] = value
@@ -227,40 +285,43 @@ class TableData:
 
     def _parse_column_headers(self):
         headers = []
-        cell = self.top_left_cell
-        while not is_cell_blank(cell):
-            headers.append(strip(cell.value))
-            direction = 'down' if self.transpose else 'right'
-            cell = get_cell_neighbour(cell, direction)
+        if self.transpose:
+            # the first column
+            values = (row[0] for row in iter_row_values(self.worksheet, min_row=self.top_left_row,
+                                                        min_col=self.top_left_column,
+                                                        max_col=self.top_left_column))
+        else:
+            # the first row
+            values = next(iter_row_values(self.worksheet, min_row=self.top_left_row, min_col=self.top_left_column,
+                                          max_row=self.top_left_row), ())
+        for value in values:
+            if is_blank_value(value):
+                break
+            headers.append(strip(value))
         return headers
 
     def _parse_rows(self):
-        rows = []
-        start_row = self.top_left_row if self.transpose else self.top_left_row + 1
-        start_col = self.top_left_column + 1 if self.transpose else self.top_left_column
-        blank_row = False
-        row_index = start_row
-        col_index = start_col
-        while not blank_row:
-            row_cells = []
-            for i in range(0, len(self.column_headers)):
-                cell = self.worksheet.cell(row=row_index, column=col_index)
-                row_cells.append(cell)
-                if self.transpose:
-                    row_index += 1
-                else:
-                    col_index += 1
-            if is_all_blanks(row_cells):
-                blank_row = True
-            else:
-                rows.append([strip(c.value) for c in row_cells])
-                if self.transpose:
-                    col_index += 1
-                    row_index = start_row
-                else:
-                    row_index += 1
-                    col_index = start_col
-        return rows
+        nb_cols = len(self.column_headers)
+        if nb_cols == 0:
+            return
+        if self.transpose:
+            # the rows of the table are the columns of the worksheet, they can only be read once all the worksheet
+            # rows of the table are read.
+            worksheet_rows = [list(values) for values in
+                              iter_row_values(self.worksheet, min_row=self.top_left_row,
+                                              max_row=self.top_left_row + nb_cols - 1,
+                                              min_col=self.top_left_column + 1)]
+            worksheet_rows += [[]] * (nb_cols - len(worksheet_rows))
+            length = max(len(values) for values in worksheet_rows)
+            rows = (tuple(values[i] if i < len(values) else None for values in worksheet_rows)
+                    for i in range(length))
+        else:
+            rows = iter_row_values(self.worksheet, min_row=self.top_left_row + 1, min_col=self.top_left_column,
+                                   max_col=self.top_left_column + nb_cols - 1)
+        for row in rows:
+            if all(is_blank_value(value) for value in row):
+                break
+            yield [strip(value) for value in row]
 
     def _get_row_cells(self, row_index):
         start = self.top_left_column - 1
@@ -269,21 +330,38 @@ class TableData:
         return self.worksheet.rows[row_index][start:end]
 
 
-class ExcelFileResponse(HttpResponse):
-    def __init__(self, content, file_name=None):
-        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        content_disposition = 'attachment;'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-        if file_name is not None:
-            if not file_name.lower().endswith('.xlsx'):
-                file_name += '.xlsx'
-            content_disposition += ' filename=' + file_name
 
-        super(ExcelFileResponse, self).__init__(content, content_type=content_type)
-        self['Content-Disposition'] = content_disposition
+def _get_xlsx_content_disposition(file_name):
+    content_disposition = 'attachment;'
+    if file_name is not None:
+        if not file_name.lower().endswith('.xlsx'):
+            file_name += '.xlsx'
+        content_disposition += ' filename=' + file_name
+    return content_disposition
+
+
+class ExcelFileResponse(HttpResponse):
+    def __init__(self, content, file_name=None):
+        super(ExcelFileResponse, self).__init__(content, content_type=XLSX_CONTENT_TYPE)
+        self['Content-Disposition'] = _get_xlsx_content_disposition(file_name)
 
 
 class WorkbookResponse(ExcelFileResponse):
     def __init__(self, wb, file_name=None):
         super(WorkbookResponse, self).__init__([], file_name=file_name)
         wb.save(self)
+
+
+class StreamingWorkbookResponse(FileResponse):
+    """
+    Save the workbook in a temporary file and stream it. With a write-only workbook the whole file is never held in
+    memory, whatever its size.
+    """
+    def __init__(self, wb, file_name=None):
+        tmp_file = tempfile.TemporaryFile()
+        wb.save(tmp_file)
+        tmp_file.seek(0)
+        super(StreamingWorkbookResponse, self).__init__(tmp_file, content_type=XLSX_CONTENT_TYPE)
+        self['Content-Disposition'] = _get_xlsx_content_disposition(file_name)
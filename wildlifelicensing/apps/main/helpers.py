@@ -2,6 +2,35 @@ from __future__ import unicode_literals
 from ledger.accounts.models import EmailUser
 
 
+# attribute of the user instance where its group names are memoized (see get_user_group_names)
+USER_GROUP_NAMES_ATTR = '_wl_group_names'
+
+
+def get_user_group_names(user):
+    """
+    The names of the groups of the user, loaded in one query and memoized on the user instance. As request.user is
+    loaded for every request, the groups are queried at most once per request whatever the number of role checks.
+    The memoized names are cleared when the groups are changed through the user instance (user.groups, see
+    main.signals). After a change through the group (group.user_set), call clear_user_group_names on the loaded user
+    instances that must see it.
+    :param user:
+    :return: a frozenset of group names
+    """
+    group_names = getattr(user, USER_GROUP_NAMES_ATTR, None)
+    if group_names is None:
+        if user.is_authenticated():
+            group_names = frozenset(user.groups.values_list('name', flat=True))
+        else:
+            group_names = frozenset()
+        setattr(user, USER_GROUP_NAMES_ATTR, group_names)
+    return group_names
+
+
+def clear_user_group_names(user):
+    if USER_GROUP_NAMES_ATTR in user.__dict__:
+        delattr(user, USER_GROUP_NAMES_ATTR)
+
+
 def belongs_to(user, group_name):
     """
     Check if the user belongs to the given group.
@@ -9,7 +38,7 @@ def belongs_to(user, group_name):
     :param group_name:
     :return:
     """
-    return user.groups.filter(name=group_name).exists()
+    return group_name in get_user_group_names(user)
 
 
 def is_customer(user):
@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from wildlifelicensing.apps.main.operations import create_trigram_indexes, drop_trigram_indexes
+
+# the ledger columns searched by the dashboard tables (user names, licence numbers and types)
+LEDGER_TRIGRAM_INDEXES = [
+    ('accounts', 'EmailUser', ['first_name', 'last_name', 'email']),
+    ('accounts', 'Profile', ['name', 'email']),
+    ('licence', 'Licence', ['licence_number']),
+    ('licence', 'LicenceType', ['short_name', 'name']),
+]
+
+
+class Command(BaseCommand):
+    help = 'Create (or drop) the trigram indexes of the ledger columns searched by the dashboard tables. ' \
+           'The ledger tables are not changed by the wildlife licensing migrations, this command is optional.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', default=False, help='drop the indexes')
+
+    def handle(self, *args, **options):
+        with connection.schema_editor() as schema_editor:
+            for app_label, model_name, fields in LEDGER_TRIGRAM_INDEXES:
+                model = apps.get_model(app_label, model_name)
+                if options['drop']:
+                    drop_trigram_indexes(schema_editor, model, fields)
+                else:
+                    create_trigram_indexes(schema_editor, model, fields)
+                self.stdout.write('{} trigram indexes of {} ({})'.format(
+                    'Dropped' if options['drop'] else 'Created', model._meta.db_table, ', '.join(fields)))
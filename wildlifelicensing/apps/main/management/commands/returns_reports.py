@@ -20,7 +20,7 @@ class Command(BaseCommand):
             f.write(hdr)
             for ret in Return.objects.filter(returntable__name__in=['regulation-17'], lodgement_date__gt=dt):
                 for return_table in ret.returntable_set.all():
-                    for return_row in return_table.returnrow_set.all():
+                    for return_row in return_table.returnrow_set.order_by('position', 'id'):
                         data = "|*|".join(str(val) for val in return_row.data.values())
                         line = f'{ret.lodgement_number}|*|{ret.licence.reference}|*|{ret.lodgement_date}|*|{ret.status}|*|{return_table.name}|*|{data}\n'
                         #print(ret.lodgement_number, ret.lodgement_date, ret.status, return_table.name, data)
@@ -34,7 +34,7 @@ class Command(BaseCommand):
             f.write(hdr)
             for ret in Return.objects.filter(returntable__name__in=['regulation-15'], lodgement_date__gt=dt):
                 for return_table in ret.returntable_set.all():
-                    for return_row in return_table.returnrow_set.all():
+                    for return_row in return_table.returnrow_set.order_by('position', 'id'):
                         data = "|*|".join(str(val) for val in return_row.data.values())
                         line = f'{ret.lodgement_number}|*|{ret.licence.reference}|*|{ret.lodgement_date}|*|{ret.status}|*|{return_table.name}|*|{data}\n'
                         #print(ret.lodgement_number, ret.lodgement_date, ret.status, return_table.name, data)
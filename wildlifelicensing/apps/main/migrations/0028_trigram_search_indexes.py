@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    The pg_trgm extension for the trigram indexes of the searched columns (see main.operations.AddTrigramIndexes).
+    The indexes of the ledger columns are created by the create_ledger_trigram_indexes command.
+    """
+
+    dependencies = [
+        ('wl_main', '0027_auto_20251104_1207'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+    ]
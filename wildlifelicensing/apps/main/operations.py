@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+
+from django.db.migrations.operations.base import Operation
+
+
+def get_trigram_indexes(model, fields):
+    """
+    :return: the (table, column, index name) of the trigram indexes of the fields of a model
+    """
+    table = model._meta.db_table
+    for field_name in fields:
+        column = model._meta.get_field(field_name).column
+        yield table, column, '{}_{}_trgm'.format(table, column)[:63]
+
+
+def create_trigram_indexes(schema_editor, model, fields):
+    quote_name = schema_editor.quote_name
+    for table, column, index_name in get_trigram_indexes(model, fields):
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS {index} ON {table} USING gin '
+                              '(UPPER({column}::text) gin_trgm_ops)'.format(index=quote_name(index_name),
+                                                                            table=quote_name(table),
+                                                                            column=quote_name(column)))
+
+
+def drop_trigram_indexes(schema_editor, model, fields):
+    for table, column, index_name in get_trigram_indexes(model, fields):
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(schema_editor.quote_name(index_name)))
+
+
+class AddTrigramIndexes(Operation):
+    """
+    Create pg_trgm GIN indexes on text columns of a model (requires the pg_trgm extension, see TrigramExtension).
+    The indexes are on UPPER(column) which is what Django uses for the __icontains lookups, so the existing
+    'icontains' searches can use them.
+    Only for the models of this project: the indexes of the ledger tables are created by the
+    create_ledger_trigram_indexes command.
+    """
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(self, app_label, model_name, fields):
+        self.app_label = app_label
+        self.model_name = model_name
+        self.fields = fields
+
+    def state_forwards(self, app_label, state):
+        # no change in the models
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(self.app_label, self.model_name)
+        create_trigram_indexes(schema_editor, model, self.fields)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(self.app_label, self.model_name)
+        drop_trigram_indexes(schema_editor, model, self.fields)
+
+    def describe(self):
+        return 'Create trigram indexes on {}.{} ({})'.format(self.app_label, self.model_name, ', '.join(self.fields))
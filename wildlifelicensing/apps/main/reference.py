@@ -0,0 +1,51 @@
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from ledger.accounts.models import EmailUser
+from ledger.licence.models import LicenceType
+
+from wildlifelicensing.apps.main.cache import get_generations_key
+from wildlifelicensing.apps.main.helpers import get_all_officers, render_user_name
+from wildlifelicensing.apps.main.models import AssessorGroup, WildlifeLicenceType
+
+# The reference lists change rarely, they are invalidated through the generation of their models (see main.signals)
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+OFFICERS_MODELS = [Group, EmailUser]
+LICENCE_TYPES_MODELS = [LicenceType, WildlifeLicenceType]
+ASSESSOR_GROUPS_MODELS = [AssessorGroup]
+
+
+def _get_cached(name, models, func):
+    key = 'wl_reference_{}_{}'.format(name, get_generations_key(models))
+    result = cache.get(key)
+    if result is None:
+        result = func()
+        cache.set(key, result, REFERENCE_CACHE_TIMEOUT)
+    return result
+
+
+def get_officers():
+    """
+    :return: [(pk, name), ...] of all the officers
+    """
+    return _get_cached('officers', OFFICERS_MODELS,
+                       lambda: [(user.pk, render_user_name(user)) for user in get_all_officers()])
+
+
+def get_licence_types():
+    """
+    :return: [(pk, display_name), ...] of all the licence types
+    """
+    return _get_cached('licence_types', LICENCE_TYPES_MODELS,
+                       lambda: [(lt.pk, lt.display_name) for lt in LicenceType.objects.all()])
+
+
+def get_assessor_groups():
+    """
+    :return: [(pk, name), ...] of all the assessor groups ordered by name
+    """
+    return _get_cached('assessor_groups', ASSESSOR_GROUPS_MODELS,
+                       lambda: [(group.pk, group.name) for group in AssessorGroup.objects.all().order_by('name')])
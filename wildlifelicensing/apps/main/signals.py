@@ -1,5 +1,46 @@
 import django.dispatch
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from ledger.accounts.models import EmailUser
+from ledger.licence.models import LicenceType
+
+from wildlifelicensing.apps.main.cache import bump_generation_on_commit
+from wildlifelicensing.apps.main.helpers import clear_user_group_names
+from wildlifelicensing.apps.main.models import AssessorGroup, WildlifeLicenceType
 
 identification_uploaded = django.dispatch.Signal(providing_args=['request'])
 
 licence_issued = django.dispatch.Signal(providing_args=['wildlice_licence'])
+
+
+@receiver(m2m_changed, sender=EmailUser.groups.through)
+def user_groups_changed(sender, instance, reverse, action, **kwargs):
+    # the role checks of this user instance must see the new groups.
+    # A change from the group side (reverse, ex: group.user_set.add(user)) only gives the pks of the users, their
+    # loaded instances can't be cleared: they see the change from the next request (request.user is loaded for every
+    # request) or after clear_user_group_names.
+    if not reverse:
+        clear_user_group_names(instance)
+    if action.startswith('post_'):
+        # the officers list (see main.reference)
+        bump_generation_on_commit(Group)
+
+
+@receiver(post_save, sender=EmailUser)
+@receiver(post_delete, sender=EmailUser)
+def user_changed(sender, update_fields=None, **kwargs):
+    # the officers list shows the user names, ignore the updates of the last login
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_generation_on_commit(EmailUser)
+
+
+@receiver(post_save, sender=LicenceType)
+@receiver(post_delete, sender=LicenceType)
+@receiver(post_save, sender=WildlifeLicenceType)
+@receiver(post_delete, sender=WildlifeLicenceType)
+@receiver(post_save, sender=AssessorGroup)
+@receiver(post_delete, sender=AssessorGroup)
+def reference_data_changed(sender, **kwargs):
+    bump_generation_on_commit(sender)
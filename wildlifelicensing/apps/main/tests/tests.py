@@ -2,14 +2,23 @@ from __future__ import unicode_literals
 
 import datetime
 import os
+import re
+import tempfile
+import zipfile
+
+from openpyxl import Workbook
 
 from django.core.urlresolvers import reverse
+from django.db import connection, transaction
 from django.test import TestCase
 
 from ledger.accounts.models import Profile
+from wildlifelicensing.apps.main import helpers as main_helpers, reference, excel
+from wildlifelicensing.apps.main.cache import get_generation, bump_generation_on_commit
+from wildlifelicensing.apps.main.models import WildlifeLicence
 from wildlifelicensing.apps.main.tests.helpers import SocialClient, get_or_create_user, add_to_group, \
     get_or_create_default_customer, get_or_create_default_officer, TestData, upload_id, create_default_country, \
-    BasePermissionViewTestCase
+    BasePermissionViewTestCase, create_random_user, get_or_create_licence_type
 
 TEST_ID_PATH = TestData.TEST_ID_PATH
 
@@ -195,3 +204,122 @@ class SearchCustomerTestCase(BasePermissionViewTestCase):
 
         self.assertEqual(json_response[0]['id'], user_1.id)
         self.assertEqual(json_response[0]['text'], user_1.get_full_name_dob())
+
+
+class RolesTestCase(TestCase):
+    def test_groups_queried_once(self):
+        user = create_random_user()
+        add_to_group(user, 'Officers')
+        with self.assertNumQueries(1):
+            self.assertTrue(main_helpers.is_officer(user))
+            self.assertFalse(main_helpers.is_assessor(user))
+            self.assertFalse(main_helpers.is_customer(user))
+            self.assertFalse(main_helpers.is_officer(user) and main_helpers.is_assessor(user))
+
+    def test_groups_changed(self):
+        user = create_random_user()
+        self.assertTrue(main_helpers.is_customer(user))
+        add_to_group(user, 'Assessors')
+        self.assertTrue(main_helpers.is_assessor(user))
+        self.assertFalse(main_helpers.is_customer(user))
+
+
+class ReferenceDataTestCase(TestCase):
+    def test_officers_invalidation(self):
+        officer = get_or_create_default_officer()
+        self.assertIn(officer.pk, [pk for pk, name in reference.get_officers()])
+        with self.assertNumQueries(0):
+            reference.get_officers()
+        user = create_random_user()
+        add_to_group(user, 'Officers')
+        self.assertIn(user.pk, [pk for pk, name in reference.get_officers()])
+
+    def test_licence_types_invalidation(self):
+        licence_type = get_or_create_licence_type()
+        licence_type.name = 'New licence type name'
+        licence_type.save()
+        self.assertIn((licence_type.pk, licence_type.display_name), reference.get_licence_types())
+
+
+class GenerationTestCase(TestCase):
+    def test_bump_on_commit(self):
+        generation = get_generation(WildlifeLicence)
+        with transaction.atomic():
+            bump_generation_on_commit(WildlifeLicence)
+            # bumped straight away for the transaction itself
+            bumped_generation = get_generation(WildlifeLicence)
+            self.assertNotEqual(generation, bumped_generation)
+            # and once committed (the test case transaction is never committed, run the callbacks)
+            callbacks = [func for savepoint_ids, func in connection.run_on_commit]
+        self.assertEqual(1, len(callbacks))
+        callbacks[0]()
+        self.assertNotIn(get_generation(WildlifeLicence), [generation, bumped_generation])
+
+
+class ExcelTableDataTestCase(TestCase):
+    def setUp(self):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Table'
+        for row in [
+            ['Species', 'Count', 'Count', 'Date'],
+            [' Koala ', 2, 3, datetime.datetime(2017, 1, 2)],
+            ['Emu', None, 1, None],
+            [None, None, None, None],
+            ['After the blank row', 1, 1, None],
+        ]:
+            ws.append(row)
+        transposed = wb.create_sheet('Transposed')
+        for row in [
+            ['Species', 'Koala', 'Emu', None, 'After the blank column'],
+            ['Count', 2, None, None, 1],
+        ]:
+            transposed.append(row)
+        self.file = tempfile.NamedTemporaryFile(suffix='.xlsx')
+        wb.save(self.file.name)
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_read_only_same_as_normal(self):
+        expected_rows = [['Koala', 2, 3, datetime.datetime(2017, 1, 2)], ['Emu', None, 1, None]]
+        for read_only in [False, True]:
+            wb = excel.load_workbook_content(self.file.name, read_only=read_only)
+            try:
+                table_data = excel.TableData(excel.get_sheet(wb, 'table'))
+                self.assertEqual(['Species', 'Count', 'Count', 'Date'], table_data.column_headers)
+                self.assertEqual(['Species', 'Count', 'Count_1', 'Date'],
+                                 list(next(table_data.rows_by_col_header_it()).keys()))
+                self.assertEqual(expected_rows, [list(row) for row in table_data.iter_rows()])
+                self.assertEqual(expected_rows, table_data.rows)
+
+                table_data = excel.TableData(excel.get_sheet(wb, 'transposed'), transpose=True)
+                self.assertEqual(['Species', 'Count'], table_data.column_headers)
+                self.assertEqual([['Koala', 2], ['Emu', None]], table_data.rows)
+            finally:
+                excel.close_workbook(wb)
+
+    def test_read_only_wrong_dimension(self):
+        """
+        Some tools write a wrong dimension (ex: 'A1') in the worksheets, the read-only tables must not depend on it.
+        """
+        wrong_dimension_file = tempfile.NamedTemporaryFile(suffix='.xlsx')
+        self.addCleanup(wrong_dimension_file.close)
+        with zipfile.ZipFile(self.file.name) as source, zipfile.ZipFile(wrong_dimension_file.name, 'w') as target:
+            for item in source.infolist():
+                content = source.read(item.filename)
+                if item.filename.startswith('xl/worksheets/'):
+                    content = re.sub(br'<dimension ref="[^"]*"', b'<dimension ref="A1"', content)
+                target.writestr(item, content)
+        wb = excel.load_workbook_content(wrong_dimension_file.name, read_only=True)
+        try:
+            table_data = excel.TableData(excel.get_sheet(wb, 'table'))
+            self.assertEqual(['Species', 'Count', 'Count', 'Date'], table_data.column_headers)
+            self.assertEqual([['Koala', 2, 3, datetime.datetime(2017, 1, 2)], ['Emu', None, 1, None]],
+                             table_data.rows)
+
+            table_data = excel.TableData(excel.get_sheet(wb, 'transposed'), transpose=True)
+            self.assertEqual(['Species', 'Count'], table_data.column_headers)
+            self.assertEqual([['Koala', 2], ['Emu', None]], table_data.rows)
+        finally:
+            excel.close_workbook(wb)
@@ -14,6 +14,7 @@ from ledger.accounts.forms import AddressForm, ProfileForm, EmailUserForm
 from wildlifelicensing.apps.main.models import CommunicationsLogEntry,\
     WildlifeLicence
 from wildlifelicensing.apps.main.forms import IdentificationForm, CommunicationsLogEntryForm, SeniorCardForm
+from wildlifelicensing.apps.main.cache import bump_generation_on_commit
 from wildlifelicensing.apps.main.mixins import CustomerRequiredMixin, OfficerRequiredMixin
 from wildlifelicensing.apps.main.signals import identification_uploaded
 from wildlifelicensing.apps.main.serializers import WildlifeLicensingJSONEncoder
@@ -303,6 +304,8 @@ class BulkLicenceRenewalPDFView(OfficerRequiredMixin, View):
 
         if licences:
             licences.update(renewal_sent=True)
+            # update() doesn't send the signals that invalidate the cached pages and counts
+            bump_generation_on_commit(WildlifeLicence)
 
         return response
 
@@ -1,5 +1,87 @@
+from decimal import Decimal
+
 from django.test import TestCase
+from django_dynamic_fixture import G
+
+from ledger.payments.bpoint.models import BpointTransaction
+from ledger.payments.cash.models import CashTransaction
+from ledger.payments.invoice.models import Invoice
+
+from wildlifelicensing.apps.applications.models import Application
+from wildlifelicensing.apps.applications.tests.helpers import create_application
+from wildlifelicensing.apps.payments.utils import get_payment_statuses, annotate_payment_status, \
+    get_application_payment_status, PAYMENT_STATUS_NOT_REQUIRED, PAYMENT_STATUS_PAID, PAYMENT_STATUS_CC_READY, \
+    PAYMENT_STATUS_AWAITING
 
 
 class PaymentReportTest(TestCase):
     pass
+
+
+class PaymentStatusesTest(TestCase):
+    def test_no_invoice(self):
+        applications = [create_application(invoice_reference=''), create_application(invoice_reference=None)]
+        with self.assertNumQueries(0):
+            result = get_payment_statuses(applications)
+        self.assertEqual(result, {application.pk: PAYMENT_STATUS_NOT_REQUIRED for application in applications})
+
+    def test_annotate_no_invoice(self):
+        application = create_application(invoice_reference='')
+        annotated = annotate_payment_status(Application.objects.filter(pk=application.pk)).get()
+        self.assertEqual(annotated.payment_status, PAYMENT_STATUS_NOT_REQUIRED)
+        self.assertEqual(annotate_payment_status(Application.objects.all()).filter(
+            pk=application.pk, payment_status=PAYMENT_STATUS_NOT_REQUIRED).count(), 1)
+
+    def _create_invoice_application(self, reference, amount, token='', cash=(), bpoint=()):
+        """
+        An application with an invoice and its transactions
+        :param cash: list of (type, amount) cash transactions
+        :param bpoint: list of (action, amount) approved credit card transactions
+        """
+        invoice = G(Invoice, reference=reference, amount=Decimal(amount), token=token, voided=False)
+        for transaction_type, transaction_amount in cash:
+            G(CashTransaction, invoice=invoice, type=transaction_type, source='cash',
+              amount=Decimal(transaction_amount))
+        for action, transaction_amount in bpoint:
+            G(BpointTransaction, crn1=reference, action=action, response_code='0',
+              amount=Decimal(transaction_amount))
+        return create_application(invoice_reference=reference)
+
+    def test_annotate_matches_invoice_status(self):
+        """
+        The payment status computed by the database matches the ledger invoice status
+        """
+        expected_statuses = {
+            self._create_invoice_application('INV-PAID-CASH', '10.00', cash=[('payment', '10.00')]).pk:
+                PAYMENT_STATUS_PAID,
+            self._create_invoice_application('INV-PAID-BPOINT', '10.00', bpoint=[('payment', '10.00')]).pk:
+                PAYMENT_STATUS_PAID,
+            self._create_invoice_application('INV-OVER-PAID', '10.00', cash=[('payment', '6.00')],
+                                             bpoint=[('payment', '6.00')]).pk:
+                PAYMENT_STATUS_PAID,
+            self._create_invoice_application('INV-CC-READY', '10.00', token='0123456789').pk:
+                PAYMENT_STATUS_CC_READY,
+            self._create_invoice_application('INV-PARTIAL-TOKEN', '10.00', token='0123456789',
+                                             cash=[('payment', '5.00')]).pk:
+                PAYMENT_STATUS_CC_READY,
+            self._create_invoice_application('INV-AWAITING', '10.00').pk:
+                PAYMENT_STATUS_AWAITING,
+            self._create_invoice_application('INV-PARTIAL', '10.00', cash=[('payment', '5.00')]).pk:
+                PAYMENT_STATUS_AWAITING,
+            self._create_invoice_application('INV-REFUNDED', '10.00', cash=[('payment', '10.00')],
+                                             bpoint=[('refund', '10.00')]).pk:
+                PAYMENT_STATUS_AWAITING,
+            self._create_invoice_application('INV-FREE', '0.00').pk:
+                PAYMENT_STATUS_NOT_REQUIRED,
+        }
+        applications = Application.objects.filter(pk__in=expected_statuses.keys())
+        annotated_statuses = dict(annotate_payment_status(applications).values_list('pk', 'payment_status'))
+        for application in applications:
+            self.assertEqual(get_application_payment_status(application), expected_statuses[application.pk])
+            self.assertEqual(annotated_statuses[application.pk], expected_statuses[application.pk])
+        self.assertEqual(get_payment_statuses(applications), expected_statuses)
+        # the annotation can filter the applications
+        self.assertEqual(
+            set(annotate_payment_status(applications).filter(payment_status=PAYMENT_STATUS_PAID)
+                .values_list('pk', flat=True)),
+            set(pk for pk, status in expected_statuses.items() if status == PAYMENT_STATUS_PAID))
@@ -1,5 +1,8 @@
 import json
 
+from django.db.models import Q, F, Sum, Case, When, Value, CharField, DecimalField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from oscar.apps.partner.strategy import Selector
@@ -92,6 +95,20 @@ def get_licence_price(product_title):
     return purchase_info.price.effective_price
 
 
+def _get_invoice_payment_status(invoice):
+    if invoice.amount > 0:
+        payment_status = invoice.payment_status
+
+        if payment_status == 'paid' or payment_status == 'over_paid':
+            return PAYMENT_STATUS_PAID
+        elif invoice.token:
+            return PAYMENT_STATUS_CC_READY
+        else:
+            return PAYMENT_STATUS_AWAITING
+    else:
+        return PAYMENT_STATUS_NOT_REQUIRED
+
+
 def get_application_payment_status(application):
     """
     :param application:
@@ -102,17 +119,83 @@ def get_application_payment_status(application):
 
     invoice = get_object_or_404(Invoice, reference=application.invoice_reference)
 
-    if invoice.amount > 0:
-        payment_status = invoice.payment_status
+    return _get_invoice_payment_status(invoice)
 
-        if payment_status == 'paid' or payment_status == 'over_paid':
-            return PAYMENT_STATUS_PAID
-        elif invoice.token:
-            return PAYMENT_STATUS_CC_READY
+
+def get_payment_statuses(applications):
+    """
+    Same as get_application_payment_status for a list of applications but with all the invoices fetched in one query.
+    :param applications:
+    :return: a dict {application.pk: payment status}
+    """
+    references = set(application.invoice_reference for application in applications if application.invoice_reference)
+    invoices = {}
+    if references:
+        invoices = {invoice.reference: invoice for invoice in Invoice.objects.filter(reference__in=references)}
+
+    result = {}
+    for application in applications:
+        if not application.invoice_reference:
+            result[application.pk] = PAYMENT_STATUS_NOT_REQUIRED
+        elif application.invoice_reference in invoices:
+            result[application.pk] = _get_invoice_payment_status(invoices[application.invoice_reference])
         else:
-            return PAYMENT_STATUS_AWAITING
-    else:
-        return PAYMENT_STATUS_NOT_REQUIRED
+            # same behaviour as get_application_payment_status
+            raise Http404('No Invoice matches the reference {}.'.format(application.invoice_reference))
+    return result
+
+
+def _transactions_total(transactions, group_by):
+    """
+    Subquery expression of the sum of the amount of the given transactions (0 if none).
+    """
+    return Coalesce(
+        Subquery(transactions.order_by().values(group_by).annotate(total=Sum('amount')).values('total')[:1],
+                 output_field=DecimalField()),
+        Value(0),
+        output_field=DecimalField()
+    )
+
+
+def annotate_payment_status(applications, reference_field='invoice_reference'):
+    """
+    Annotate a queryset of applications with a 'payment_status' computed by the database, so it can be used to filter
+    or order the applications. This follows the rules of get_application_payment_status, the amount paid being
+    computed like the ledger Invoice.payment_amount (bpoint, bpay and cash payments minus refunds/reversals).
+    :param applications: a queryset of Application
+    :param reference_field: the name of the invoice reference field
+    :return: the annotated queryset. The payment_status is one of the PAYMENT_STATUSES keys
+    """
+    from ledger.payments.models import BpointTransaction, BpayTransaction, CashTransaction
+
+    reference = OuterRef(reference_field)
+    invoices = Invoice.objects.filter(reference=reference)
+    bpoint_transactions = BpointTransaction.objects.filter(crn1=reference, response_code='0')
+    bpay_transactions = BpayTransaction.objects.filter(crn=reference)
+    cash_transactions = CashTransaction.objects.filter(invoice__reference=reference)
+    paid_amount = \
+        _transactions_total(bpoint_transactions.filter(action='payment'), 'crn1') + \
+        _transactions_total(bpay_transactions.filter(p_instruction_code='05', type=399), 'crn') + \
+        _transactions_total(cash_transactions.filter(type__in=['payment', 'move_in']), 'invoice') - \
+        _transactions_total(bpoint_transactions.filter(action='refund'), 'crn1') - \
+        _transactions_total(bpay_transactions.filter(p_instruction_code='25'), 'crn') - \
+        _transactions_total(cash_transactions.filter(type__in=['refund', 'reversal', 'move_out']), 'invoice')
+
+    return applications.annotate(
+        invoice_amount=Subquery(invoices.values('amount')[:1], output_field=DecimalField()),
+        invoice_token=Subquery(invoices.values('token')[:1], output_field=CharField()),
+        invoice_paid_amount=paid_amount,
+    ).annotate(
+        payment_status=Case(
+            When(Q(**{reference_field + '__isnull': True}) | Q(**{reference_field: ''}) |
+                 Q(invoice_amount__isnull=True) | Q(invoice_amount__lte=0),
+                 then=Value(PAYMENT_STATUS_NOT_REQUIRED)),
+            When(invoice_paid_amount__gte=F('invoice_amount'), then=Value(PAYMENT_STATUS_PAID)),
+            When(Q(invoice_token__isnull=False) & ~Q(invoice_token=''), then=Value(PAYMENT_STATUS_CC_READY)),
+            default=Value(PAYMENT_STATUS_AWAITING),
+            output_field=CharField()
+        )
+    )
 
 
 def invoke_credit_card_payment(application):
@@ -11,7 +11,7 @@ from django.utils.encoding import smart_text
 
 from wildlifelicensing.apps.returns.api.mixins import APIUserRequiredMixin
 from wildlifelicensing.apps.returns.models import ReturnType, ReturnRow
-from wildlifelicensing.apps.returns.utils_schema import Schema
+from wildlifelicensing.apps.returns.utils_schema import get_return_type_schema
 
 API_SESSION_TIMEOUT = 100 * 24 * 3600  # 100 days
 
@@ -94,7 +94,7 @@ class ReturnsDataView(APIUserRequiredMixin, View):
 
         resource_name = return_type.get_resources_names()[resource_number]
         qs = ReturnRow.objects.filter(return_table__name=resource_name)
-        schema = Schema(return_type.get_schema_by_name(resource_name))
+        schema = get_return_type_schema(return_type, resource_name)
         response = HttpResponse(content_type='text/csv')
         file_name = 'wl_returns_{}.csv'.format(resource_name)
         response['Content-Disposition'] = 'attachment; filename={}'.format(file_name)
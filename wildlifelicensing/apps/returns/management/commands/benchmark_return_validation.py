@@ -0,0 +1,45 @@
+import itertools
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wildlifelicensing.apps.returns.models import ReturnType, ReturnRow
+from wildlifelicensing.apps.returns.utils_schema import get_return_type_schema
+
+
+class Command(BaseCommand):
+    help = 'Compare the time to validate a return table row by row (rows_validator) and by column (validate_rows)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('return_type', type=int, help='The return type id')
+        parser.add_argument('--resource', help='The resource (table) name. Default: the first resource')
+        parser.add_argument('--rows', type=int, default=10000, help='Number of rows to validate')
+        parser.add_argument('--number', type=int, default=3, help='Number of validations to time')
+
+    def handle(self, *args, **options):
+        try:
+            return_type = ReturnType.objects.get(pk=options['return_type'])
+        except ReturnType.DoesNotExist:
+            raise CommandError('Return type {} does not exist'.format(options['return_type']))
+        resource_name = options['resource'] or return_type.get_resources_names()[0]
+        schema = get_return_type_schema(return_type, resource_name)
+
+        # the stored rows of the resource repeated up to the number of rows, or blank rows if there's none.
+        sample = list(ReturnRow.objects.filter(return_table__ret__return_type=return_type,
+                                               return_table__name=resource_name)
+                      .values_list('data', flat=True)[:options['rows']])
+        sample = [row for row in sample if row and set(row.keys()) <= set(schema.field_names)]
+        if not sample:
+            sample = [dict((name, '') for name in schema.field_names)]
+        rows = list(itertools.islice(itertools.cycle(sample), options['rows']))
+
+        if list(schema.rows_validator(rows)) != schema.validate_rows(rows):
+            raise CommandError('The row and the column validations differ')
+
+        number = options['number']
+        rows_time = timeit.timeit(lambda: list(schema.rows_validator(rows)), number=number) / number
+        columns_time = timeit.timeit(lambda: schema.validate_rows(rows), number=number) / number
+        self.stdout.write('{} rows ({} distinct) x {} fields'.format(len(rows), len(sample), len(schema.fields)))
+        self.stdout.write('rows_validator(): {:.0f} ms'.format(rows_time * 1000))
+        self.stdout.write('validate_rows():  {:.0f} ms'.format(columns_time * 1000))
+        self.stdout.write('speedup: x{:.1f}'.format(rows_time / columns_time if columns_time else 0))
@@ -0,0 +1,45 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from wildlifelicensing.apps.returns.uploads import claim_upload_job, process_upload_job, purge_upload_jobs
+
+
+class Command(BaseCommand):
+    help = 'Validate the uploaded return spreadsheets (upload jobs). Runs until stopped unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Process the pending jobs then exit')
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        once = options['once']
+        workers = max(options['workers'], 1)
+        if workers == 1:
+            self.run(once)
+            return
+        # the worker processes must not share the database connections
+        connections.close_all()
+        processes = [multiprocessing.Process(target=self.run, args=(once,)) for i in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    def run(self, once):
+        poll_interval = getattr(settings, 'WL_RETURN_UPLOAD_POLL_INTERVAL', 2)
+        while True:
+            job = claim_upload_job()
+            if job is None:
+                if once:
+                    break
+                purge_upload_jobs()
+                time.sleep(poll_interval)
+                continue
+            job = process_upload_job(job)
+            self.stdout.write('Upload job {}: {}, {} rows, {} with errors'.format(
+                job.pk, job.status, job.rows_count, job.errors_count))
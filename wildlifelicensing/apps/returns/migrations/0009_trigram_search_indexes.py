@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from wildlifelicensing.apps.main.operations import AddTrigramIndexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wl_returns', '0008_auto_20170601_1822'),
+        ('wl_main', '0028_trigram_search_indexes'),
+    ]
+
+    operations = [
+        AddTrigramIndexes('wl_returns', 'Return', ['lodgement_number']),
+    ]
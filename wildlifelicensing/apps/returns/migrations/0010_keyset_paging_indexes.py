@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wl_returns', '0009_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='return',
+            index=models.Index(fields=['lodgement_number', 'id'], name='wl_return_lodgement_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='return',
+            index=models.Index(fields=['due_date', 'id'], name='wl_return_due_date_idx'),
+        ),
+    ]
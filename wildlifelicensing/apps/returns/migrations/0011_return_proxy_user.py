@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_proxy_user(apps, schema_editor):
+    Application = apps.get_model('wl_applications', 'Application')
+    Return = apps.get_model('wl_returns', 'Return')
+    applications = Application.objects.filter(licence__isnull=False, proxy_applicant__isnull=False).order_by('id')
+    for licence_id, proxy_applicant_id in applications.values_list('licence_id', 'proxy_applicant_id'):
+        Return.objects.filter(licence_id=licence_id).update(proxy_user_id=proxy_applicant_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wl_applications', '0020_keyset_paging_indexes'),
+        ('wl_returns', '0010_keyset_paging_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='return',
+            name='proxy_user',
+            field=models.ForeignKey(blank=True, editable=False, null=True,
+                                    on_delete=django.db.models.deletion.SET_NULL, related_name='proxy_returns',
+                                    to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='return',
+            index=models.Index(fields=['proxy_user', 'status', 'due_date'], name='wl_return_proxy_user_idx'),
+        ),
+        migrations.RunPython(set_proxy_user, migrations.RunPython.noop),
+    ]
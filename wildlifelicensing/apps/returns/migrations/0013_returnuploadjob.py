@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wl_returns', '0012_return_status_due_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReturnUploadJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spreadsheet', models.FileField(blank=True, upload_to='return_uploads/%Y/%m/%d')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'),
+                                                     ('failed', 'Failed')], default='pending', max_length=20)),
+                ('rows_count', models.IntegerField(default=0)),
+                ('rows_total', models.IntegerField(blank=True, null=True)),
+                ('errors_count', models.IntegerField(default=0)),
+                ('warnings', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('ret', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wl_returns.Return')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReturnUploadRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=50)),
+                ('row_number', models.IntegerField()),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('has_error', models.BooleanField(default=False)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows',
+                                          to='wl_returns.ReturnUploadJob')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='returnuploadjob',
+            index=models.Index(fields=['status', 'created'], name='wl_return_upload_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='returnuploadrow',
+            index=models.Index(fields=['job', 'table_name', 'row_number'], name='wl_return_upload_row_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wl_returns', '0013_returnuploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='returnrow',
+            name='position',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='returnrow',
+            name='row_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='returnrow',
+            index=models.Index(fields=['return_table', 'position'], name='wl_returnrow_position_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from __future__ import unicode_literals
 
+import hashlib
+import json
+
 from django.db import models
 from django.contrib.postgres.fields.jsonb import JSONField
 from django.core.exceptions import ValidationError
@@ -97,10 +100,27 @@ class Return(RevisionedMixin):
 
     proxy_customer = models.ForeignKey(EmailUser, blank=True, null=True)
 
+    # copy of the proxy applicant of the licence application, set when the licence is issued (see
+    # returns.signals.licence_issued_callback), for the officers 'on behalf' returns. Deleting the user must not delete
+    # the returns.
+    proxy_user = models.ForeignKey(EmailUser, blank=True, null=True, editable=False, on_delete=models.SET_NULL,
+                                   related_name='proxy_returns')
+
     nil_return = models.BooleanField(default=False)
 
     comments = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # orders of the officer dashboard table, used for keyset paging
+            models.Index(fields=['lodgement_number', 'id'], name='wl_return_lodgement_idx'),
+            models.Index(fields=['due_date', 'id'], name='wl_return_due_date_idx'),
+            # urgency of the returns (see returns.utils.get_urgency_query)
+            models.Index(fields=['status', 'due_date'], name='wl_return_status_due_idx'),
+            # returns of an officer proxy page
+            models.Index(fields=['proxy_user', 'status', 'due_date'], name='wl_return_proxy_user_idx'),
+        ]
+
     @property
     def reference(self):
         return '{}'.format(self.lodgement_number)
@@ -137,6 +157,88 @@ class ReturnRow(RevisionedMixin):
 
     data = JSONField(blank=True, null=True)
 
+    # order of the row in the table and hash of the data, used to save only the changed rows (see
+    # returns.utils.save_return_table_rows)
+    position = models.IntegerField(default=0)
+    row_hash = models.CharField(max_length=32, blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['return_table', 'position'], name='wl_returnrow_position_idx'),
+        ]
+
+    @staticmethod
+    def get_data_hash(data):
+        return hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def save(self, **kwargs):
+        self.row_hash = self.get_data_hash(self.data)
+        super(ReturnRow, self).save(**kwargs)
+
+
+class ReturnUploadJob(models.Model):
+    """
+    A return spreadsheet uploaded by the user and validated by the process_return_uploads worker (see
+    returns.uploads).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    FINISHED_STATUSES = ['done', 'failed']
+
+    ret = models.ForeignKey(Return)
+    user = models.ForeignKey(EmailUser)
+
+    spreadsheet = models.FileField(upload_to='return_uploads/%Y/%m/%d', blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_CHOICES[0][0])
+
+    # progress: number of rows validated so far and estimation of the total (from the worksheets dimensions)
+    rows_count = models.IntegerField(default=0)
+    rows_total = models.IntegerField(blank=True, null=True)
+    errors_count = models.IntegerField(default=0)
+
+    # warnings for the user (ex: missing worksheet) and the reason of a failure
+    warnings = JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    # set by the worker after each batch of rows, a running job without heartbeat for too long is run again
+    heartbeat = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # jobs queue of the worker
+            models.Index(fields=['status', 'created'], name='wl_return_upload_status_idx'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+
+class ReturnUploadRow(models.Model):
+    """
+    A validated row of an upload: {field_name: {'value': value, 'error': None|msg}} (see Schema.validate_row)
+    """
+    job = models.ForeignKey(ReturnUploadJob, related_name='rows')
+
+    table_name = models.CharField(max_length=50)
+    row_number = models.IntegerField()
+
+    data = JSONField()
+    has_error = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'table_name', 'row_number'], name='wl_return_upload_row_idx'),
+        ]
+
 
 class ReturnLogEntry(CommunicationsLogEntry):
     ret = models.ForeignKey(Return)
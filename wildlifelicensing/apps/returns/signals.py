@@ -1,11 +1,13 @@
 from django.dispatch import Signal, receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 
 
+from wildlifelicensing.apps.main.cache import bump_generation_on_commit
 from wildlifelicensing.apps.main.signals import licence_issued
 from wildlifelicensing.apps.main.models import WildlifeLicenceType, WildlifeLicence
-from wildlifelicensing.apps.returns.utils import create_returns_due_dates
+from wildlifelicensing.apps.returns.utils import create_returns_due_dates, get_licence_proxy_user
 from wildlifelicensing.apps.returns.models import ReturnType, Return
+from wildlifelicensing.apps.returns.utils_schema import clear_return_type_schemas
 
 return_submitted = Signal(providing_args=['ret'])
 
@@ -22,8 +24,11 @@ def licence_issued_callback(sender, **kwargs):
 
         due_dates = create_returns_due_dates(licence.start_date, licence.end_date, licence.return_frequency)
 
+        proxy_user = get_licence_proxy_user(licence)
+
         # if this is a reissue, need to consider existing returns for this licence
         existing_returns = Return.objects.filter(licence=licence)
+        existing_returns.update(proxy_user=proxy_user)
 
         if existing_returns.count() > 0:
             # delete existing returns that haven't been edited
@@ -37,7 +42,8 @@ def licence_issued_callback(sender, **kwargs):
 
         returns = []
         for due_date in due_dates:
-            returns.append(Return(licence=licence, return_type=return_type, due_date=due_date))
+            returns.append(Return(licence=licence, return_type=return_type, due_date=due_date,
+                                  proxy_user=proxy_user))
 
         if returns:
             returns[0].status = 'current'
@@ -55,6 +61,16 @@ def licence_issued_callback(sender, **kwargs):
             # delete previous licence returns that haven't been edited
             previous_licence_returns.filter(status__in=['current', 'future']).delete()
 
+        # the bulk create and update don't send the save signals
+        bump_generation_on_commit(Return)
+
+
+@receiver(pre_save, sender=Return)
+def set_return_proxy_user(sender, instance, **kwargs):
+    # returns created outside of the licence issue
+    if instance._state.adding and instance.proxy_user_id is None and instance.licence_id is not None:
+        instance.proxy_user = get_licence_proxy_user(instance.licence_id)
+
 
 @receiver(post_save, sender=WildlifeLicenceType)
 def create_return_type_for_superceding_licence_type(sender, **kwargs):
@@ -81,3 +97,9 @@ def create_return_type_for_superceding_licence_type(sender, **kwargs):
         new_return_type.save()
     except ReturnType.DoesNotExist:
         pass
+
+
+@receiver(post_save, sender=ReturnType)
+@receiver(post_delete, sender=ReturnType)
+def clear_compiled_schemas(sender, instance, **kwargs):
+    clear_return_type_schemas(instance.pk)
@@ -7,6 +7,8 @@ define([
 ], function ($) {
     "use strict";
 
+    var UPLOAD_JOB_POLL_INTERVAL = 2000;
+
     function querySpecies(speciesType, search, callback) {
         var url = '/wl_taxonomy/species_name',
             params = {},
@@ -73,7 +75,46 @@ define([
         }
     }
 
+    function pollUploadJob($panel) {
+        // poll the status of the spreadsheet upload job until it's finished then reload the page with the validated
+        // rows.
+        var url = $panel.attr('data-status-url'),
+            $text = $panel.find('.upload-job-progress'),
+            $bar = $panel.find('.progress-bar');
+
+        function poll() {
+            $.get(url).then(function (status) {
+                var text;
+                if (status.finished) {
+                    window.location.reload();
+                    return;
+                }
+                if (status.status === 'running') {
+                    text = 'Validating your spreadsheet: ' + status.rowsCount + ' rows';
+                    if (status.errorsCount) {
+                        text += ' (' + status.errorsCount + ' with errors)';
+                    }
+                    $text.text(text);
+                    if (status.rowsTotal) {
+                        $bar.css('width', Math.min(100, Math.round(100 * status.rowsCount / status.rowsTotal)) + '%');
+                    }
+                }
+                window.setTimeout(poll, UPLOAD_JOB_POLL_INTERVAL);
+            }, function () {
+                window.setTimeout(poll, UPLOAD_JOB_POLL_INTERVAL * 5);
+            });
+        }
+
+        poll();
+    }
+
     return {
+        pollUploadJob: function (selector) {
+            var $panel = $(selector);
+            if ($panel.length) {
+                pollUploadJob($panel);
+            }
+        },
         initTables: function () {
             var $tables = $('.return-table'),
                 $curationForm = $('#curationForm');
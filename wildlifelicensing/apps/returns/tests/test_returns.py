@@ -3,16 +3,21 @@ from datetime import date, timedelta
 
 from dateutil.relativedelta import relativedelta
 from django.core import mail
+from django.core.files import File
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils import six, timezone
 
 from wildlifelicensing.apps.applications.tests import helpers as app_helpers
 from wildlifelicensing.apps.main.tests.helpers import SocialClient, get_or_create_default_customer, \
     get_or_create_default_officer, create_licence, create_random_customer, get_or_create_default_assessor, \
     get_or_create_licence_type, clear_mailbox
-from wildlifelicensing.apps.returns.models import Return
+from wildlifelicensing.apps.returns.models import Return, ReturnUploadJob, ReturnTable
 from wildlifelicensing.apps.returns.tests.helpers import create_return, get_or_create_return_type
-from wildlifelicensing.apps.returns.utils import create_returns_due_dates
+from wildlifelicensing.apps.returns.uploads import create_upload_job, claim_upload_job, process_upload_job
+from wildlifelicensing.apps.returns.utils import create_returns_due_dates, annotate_urgency, get_return_urgency, \
+    get_urgency_query, URGENCY_OVERDUE, URGENCY_DUE_SOON, save_return_table_rows
 
 TEST_SPREADSHEET_PATH = os.path.join('wildlifelicensing', 'apps', 'returns', 'test_data', 'regulation17.xlsx')
 
@@ -86,12 +91,63 @@ class ReturnsTestCase(TestCase):
             response = self.client.post(reverse('wl_returns:enter_return', args=(self.ret.pk,)),
                                         post_params)
 
+        # the spreadsheet is validated in background
+        job = ReturnUploadJob.objects.get(ret=self.ret)
+        self.assertEqual('pending', job.status)
+        url = '{}?upload={}'.format(reverse('wl_returns:enter_return', args=(self.ret.pk,)), job.pk)
+        self.assertRedirects(response, url, status_code=302, target_status_code=200, fetch_redirect_response=False)
+
+        status_url = reverse('wl_returns:upload_status', args=(self.ret.pk, job.pk))
+        status = self.client.get(status_url).json()
+        self.assertEqual('pending', status['status'])
+        self.assertFalse(status['finished'])
+
+        call_command('process_return_uploads', once=True, stdout=six.StringIO())
+
+        status = self.client.get(status_url).json()
+        self.assertEqual('done', status['status'])
+        self.assertTrue(status['finished'])
+        self.assertEqual(1, status['rowsCount'])
+
+        response = self.client.get(url)
         self.assertEqual(200, response.status_code)
 
         # assert values in the response context match those in the spreadsheet
         for key, value in response.context['tables'][0]['data'][0].items():
             self.assertEqual(value['value'], TEST_VALUES[key])
 
+    def test_upload_job_claimed_again(self):
+        """
+        A job claimed again by another worker (after WL_RETURN_UPLOAD_JOB_TIMEOUT without heartbeat) is not written by
+        the first worker.
+        """
+        with open(TEST_SPREADSHEET_PATH, 'rb') as fp:
+            create_upload_job(self.ret, self.customer, File(fp, name='regulation17.xlsx'))
+        job = claim_upload_job()
+        self.assertIsNotNone(job)
+        self.assertIsNone(claim_upload_job())
+        # the worker is considered dead and the job claimed by another one.
+        ReturnUploadJob.objects.filter(pk=job.pk).update(heartbeat=timezone.now() - timedelta(days=1))
+        other_job = claim_upload_job()
+        self.assertEqual(job.pk, other_job.pk)
+        self.assertNotEqual(job.started, other_job.started)
+
+        process_upload_job(job)
+        self.assertEqual(0, job.rows.count())
+        self.assertEqual('running', ReturnUploadJob.objects.get(pk=job.pk).status)
+
+        process_upload_job(other_job)
+        self.assertEqual(1, other_job.rows.count())
+        self.assertEqual('done', ReturnUploadJob.objects.get(pk=job.pk).status)
+
+    def test_upload_job_permission(self):
+        """Testing that a customer can't see the upload jobs of another customer's return"""
+        job = ReturnUploadJob.objects.create(ret=self.ret, user=self.customer)
+        other_customer = create_random_customer()
+        self.client.login(other_customer.email)
+        response = self.client.get(reverse('wl_returns:upload_status', args=(self.ret.pk, job.pk)))
+        self.assertEqual(403, response.status_code)
+
     def test_lodge_return(self):
         """Testing that a user can lodge a return"""
         self.client.login(self.customer.email)
@@ -408,6 +464,30 @@ class TestLifeCycle(TestCase):
         expected_due_date = end_date
         self.assertEqual(current.due_date, expected_due_date)
 
+    def test_proxy_user(self):
+        """
+        Test that the returns of a licence applied by an officer on behalf of the customer keep the officer
+        """
+        application = app_helpers.create_and_lodge_application(self.customer, **{
+            'applicant': self.customer,
+            'licence_type': self.licence_type,
+            'proxy_applicant': self.officer
+        })
+        start_date = date.today()
+        licence_data = {
+            'return_frequency': 1,
+            'start_date': str(start_date),
+            'end_date': str(start_date + relativedelta(months=3))
+        }
+        licence = app_helpers.issue_licence(application, self.officer, licence_data=licence_data)
+        rets = Return.objects.filter(licence=licence)
+        self.assertTrue(rets.exists())
+        self.assertEqual(rets.count(), Return.objects.filter(proxy_user=self.officer).count())
+
+        # no proxy user for a customer application
+        licence = self._issue_licence(licence_data)
+        self.assertFalse(Return.objects.filter(licence=licence).exclude(proxy_user=None).exists())
+
     def test_enter_return_happy_path(self):
         start_date = date.today()
         end_date = start_date + relativedelta(months=2)  # 2 months licence
@@ -684,3 +764,77 @@ class TestUtils(TestCase):
             end_date
         ]
         self.assertEqual(due_dates, expected_due_dates)
+
+
+class TestUrgency(TestCase):
+    fixtures = ['licences.json', 'countries.json', 'catalogue.json', 'partner.json', 'returns.json']
+
+    def test_annotate_urgency(self):
+        customer = get_or_create_default_customer(include_default_profile=True)
+        licence = create_licence(customer, get_or_create_default_officer(), product_title='regulation-17')
+        today = date.today()
+        for days, status in [(-1, 'current'), (0, 'current'), (5, 'current'), (13, 'draft'), (14, 'current'),
+                             (30, 'current'), (-10, 'submitted'), (-10, 'amendment_required'), (5, 'future')]:
+            ret = create_return(licence)
+            ret.due_date = today + timedelta(days=days)
+            ret.status = status
+            ret.save()
+        annotated = annotate_urgency(Return.objects.all())
+        for ret in annotated:
+            self.assertEqual(ret.urgency, get_return_urgency(Return.objects.get(pk=ret.pk)))
+        self.assertEqual(annotated.filter(urgency=URGENCY_OVERDUE).count(), 3)
+        self.assertEqual(annotated.filter(urgency=URGENCY_DUE_SOON).count(), 2)
+        self.assertEqual(Return.objects.filter(get_urgency_query(URGENCY_DUE_SOON)).count(), 5)
+        # ordered by urgency
+        self.assertEqual(annotated.order_by('-urgency').first().urgency, URGENCY_OVERDUE)
+
+
+class TestSaveReturnTableRows(TestCase):
+    fixtures = ['licences.json', 'countries.json', 'catalogue.json', 'partner.json', 'returns.json']
+
+    def setUp(self):
+        customer = get_or_create_default_customer(include_default_profile=True)
+        licence = create_licence(customer, get_or_create_default_officer(), product_title='regulation-17')
+        self.return_table = ReturnTable.objects.create(ret=create_return(licence), name='regulation-17')
+
+    def _get_rows(self):
+        return [row.data for row in self.return_table.returnrow_set.order_by('position', 'id')]
+
+    def _save(self, rows):
+        result = save_return_table_rows(self.return_table, rows)
+        self.assertEqual(rows, self._get_rows())
+        return result
+
+    def test_only_changed_rows(self):
+        rows = [{'COUNT': str(i)} for i in range(3)]
+        self.assertEqual({'inserted': 3, 'updated': 0, 'deleted': 0, 'moved': 0}, self._save(rows))
+        pks = list(self.return_table.returnrow_set.order_by('position').values_list('pk', flat=True))
+
+        # nothing changed: nothing written
+        with self.assertNumQueries(3):
+            # savepoint, select, release savepoint
+            result = save_return_table_rows(self.return_table, rows)
+        self.assertEqual({'inserted': 0, 'updated': 0, 'deleted': 0, 'moved': 0}, result)
+
+        # one row changed
+        rows[1] = {'COUNT': '10'}
+        self.assertEqual({'inserted': 0, 'updated': 1, 'deleted': 0, 'moved': 0}, self._save(rows))
+        self.assertEqual(pks, list(self.return_table.returnrow_set.order_by('position').values_list('pk', flat=True)))
+
+        # a row inserted at the top
+        rows.insert(0, {'COUNT': '20'})
+        self.assertEqual({'inserted': 1, 'updated': 0, 'deleted': 0, 'moved': 3}, self._save(rows))
+
+        # a row removed
+        del rows[2]
+        self.assertEqual({'inserted': 0, 'updated': 0, 'deleted': 1, 'moved': 1}, self._save(rows))
+
+    def test_rows_without_hash(self):
+        """
+        Rows saved before the hashes existed
+        """
+        rows = [{'COUNT': str(i)} for i in range(3)]
+        save_return_table_rows(self.return_table, rows)
+        self.return_table.returnrow_set.update(row_hash=None, position=0)
+        self.assertEqual({'inserted': 0, 'updated': 0, 'deleted': 0, 'moved': 2}, self._save(rows))
+        self.assertEqual(0, self.return_table.returnrow_set.filter(row_hash__isnull=True).count())
@@ -6,7 +6,9 @@ from django.test import TestCase
 
 from wildlifelicensing.apps.returns.tests import helpers
 from wildlifelicensing.apps.returns.tests.helpers import BASE_CONSTRAINTS, clone, BASE_FIELD, REQUIRED_CONSTRAINTS
-from wildlifelicensing.apps.returns.utils_schema import SchemaConstraints, FieldSchemaError, SchemaField, Schema
+from wildlifelicensing.apps.returns.models import ReturnType
+from wildlifelicensing.apps.returns.utils_schema import SchemaConstraints, FieldSchemaError, SchemaField, Schema, \
+    get_return_type_schema
 
 
 class TestSchemaConstraints(TestCase):
@@ -529,3 +531,77 @@ class TestLatLongEastingNorthingCase(TestCase):
         self.assertFalse('EASTING' in error_fields)
         self.assertTrue('LONGITUDE' in error_fields)
         self.assertTrue('NORTHING' in error_fields)
+
+    def test_validate_rows(self):
+        """
+        The column validation must give the same result than the row by row validation
+        """
+        rows = [
+            {"DATUM": "WGS84", "LATITUDE": -32, "LONGITUDE": 115, "EASTING": None, "NORTHING": None, "ZONE": None},
+            {"DATUM": "WGS84", "LATITUDE": None, "LONGITUDE": None, "EASTING": 123456, "NORTHING": 645321,
+             "ZONE": 50},
+            {"DATUM": "WGS84", "LATITUDE": -32, "LONGITUDE": None, "EASTING": 12345, "NORTHING": None, "ZONE": 50},
+            {"DATUM": "XXX", "LATITUDE": None, "LONGITUDE": None, "EASTING": None, "NORTHING": None, "ZONE": 50},
+            {"DATUM": "WGS84", "LATITUDE": -32, "LONGITUDE": 115, "EASTING": None, "NORTHING": None, "ZONE": None},
+            # a row without zone
+            {"DATUM": "WGS84", "LATITUDE": -32, "LONGITUDE": 115, "EASTING": None, "NORTHING": None},
+        ]
+        self.assertEqual(list(self.schema.rows_validator(rows)), self.schema.validate_rows(rows))
+        self.assertEqual([], self.schema.validate_rows([]))
+        self.assertFalse(self.schema.is_all_valid(rows))
+        self.assertTrue(self.schema.is_all_valid(rows[:2]))
+
+
+class TestColumnValidation(TestCase):
+    def test_same_as_validation_error(self):
+        field = SchemaField({
+            "name": "Count",
+            "type": "integer",
+            "constraints": {
+                "required": True
+            }
+        })
+        values = [1, '1', 1.0, 1.2, '1.2', True, None, '', 'x', 1, None]
+        self.assertEqual([field.validation_error(v) for v in values], field.column_validation_errors(values))
+
+    def test_unknown_column(self):
+        schema = Schema(helpers.LAT_LONG_OBSERVATION_SCHEMA)
+        with self.assertRaises(Exception):
+            schema.validate_columns({'Unknown': ['value']})
+
+
+class TestCompiledSchema(TestCase):
+    fixtures = [
+        'countries',
+        'groups',
+        'licences',
+        'conditions',
+        'default-conditions',
+        'returns'
+    ]
+
+    def setUp(self):
+        self.return_type = ReturnType.objects.first()
+        self.assertIsNotNone(self.return_type)
+        self.resource_name = self.return_type.get_resources_names()[0]
+
+    def test_cached_per_process(self):
+        schema = get_return_type_schema(self.return_type, self.resource_name)
+        self.assertIs(schema, get_return_type_schema(ReturnType.objects.get(pk=self.return_type.pk),
+                                                     self.resource_name))
+        self.assertEqual(schema.field_names, Schema(self.return_type.get_schema_by_name(self.resource_name)).field_names)
+
+    def test_invalidated_on_change(self):
+        schema = get_return_type_schema(self.return_type, self.resource_name)
+        descriptor = self.return_type.get_schema_by_name(self.resource_name)
+        descriptor['fields'].append({'name': 'Extra Field', 'type': 'string'})
+        self.return_type.save()
+        changed = get_return_type_schema(self.return_type, self.resource_name)
+        self.assertIsNot(schema, changed)
+        self.assertIsNotNone(changed.get_field_by_mame('extra field', icase=True))
+
+    def test_field_lookup(self):
+        schema = Schema(helpers.LAT_LONG_OBSERVATION_SCHEMA)
+        self.assertEqual(schema.get_field_by_mame('latitude', icase=True).name, 'Latitude')
+        self.assertIsNone(schema.get_field_by_mame('latitude'))
+        self.assertIsNone(schema.get_field_by_mame('unknown', icase=True))
@@ -0,0 +1,245 @@
+from __future__ import unicode_literals
+
+import datetime
+import itertools
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from wildlifelicensing.apps.main import excel
+from wildlifelicensing.apps.returns.models import ReturnUploadJob, ReturnUploadRow
+from wildlifelicensing.apps.returns.utils_schema import get_return_type_schema
+
+logger = logging.getLogger(__name__)
+
+# number of rows validated and saved at once. The progress of a job is saved after each batch.
+BATCH_SIZE = 1000
+
+# number of rows with errors given by the job status
+STATUS_MAX_ERRORS = 10
+
+DATE_FORMAT = '%d/%m/%Y'
+
+FAILED_MESSAGE = 'The spreadsheet could not be read. Please check that it is a valid Excel (xlsx) file.'
+
+
+def create_upload_job(ret, user, spreadsheet_file):
+    """
+    Store the uploaded spreadsheet and queue its validation. The job is processed by the process_return_uploads
+    command.
+    """
+    return ReturnUploadJob.objects.create(ret=ret, user=user, spreadsheet=spreadsheet_file)
+
+
+class UploadJobLost(Exception):
+    """
+    The job has been claimed again by another worker (see claim_upload_job)
+    """
+    pass
+
+
+def claim_upload_job():
+    """
+    Take the oldest pending job, or a running job whose worker stopped sending heartbeats (see
+    settings.WL_RETURN_UPLOAD_JOB_TIMEOUT), and mark it as running. Several workers can claim jobs at the same time, a
+    job locked by a worker is skipped by the others.
+    :return: the job or None if there's nothing to do
+    """
+    timeout = getattr(settings, 'WL_RETURN_UPLOAD_JOB_TIMEOUT', 1800)
+    stale = timezone.now() - datetime.timedelta(seconds=timeout)
+    with transaction.atomic():
+        job = ReturnUploadJob.objects.select_for_update(skip_locked=True) \
+            .filter(Q(status='pending') | Q(status='running', heartbeat__lt=stale)) \
+            .order_by('created').first()
+        if job is not None:
+            job.status = 'running'
+            job.started = job.heartbeat = timezone.now()
+            job.save(update_fields=['status', 'started', 'heartbeat'])
+    return job
+
+
+def _update_claimed_job(job, **values):
+    """
+    Update a job only if it is still claimed by this worker, i.e. it has not been claimed again since (which changes
+    its started date). The updated job row stays locked until the end of the transaction so it can't be claimed while
+    the worker writes.
+    :raise UploadJobLost: if the job has been claimed by another worker.
+    """
+    updated = ReturnUploadJob.objects.filter(pk=job.pk, status='running', started=job.started) \
+        .update(heartbeat=timezone.now(), **values)
+    if not updated:
+        raise UploadJobLost('Return upload job {} has been claimed by another worker'.format(job.pk))
+
+
+def _iter_batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(itertools.islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, size))
+
+
+def _format_value(value):
+    # the excel parser can create datetime/date/time, they are stringified like in the entry form.
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    return value
+
+
+def _get_worksheets(workbook, return_type):
+    worksheets = []
+    warnings = []
+    for resource in return_type.resources:
+        name = resource.get('name')
+        worksheet = excel.get_sheet(workbook, resource.get('title', name)) or excel.get_sheet(workbook, name)
+        if worksheet is not None:
+            worksheets.append((name, worksheet))
+        else:
+            warnings.append('Missing worksheet ' + name)
+    return worksheets, warnings
+
+
+def _validate_worksheets(job, workbook):
+    return_type = job.ret.return_type
+    worksheets, warnings = _get_worksheets(workbook, return_type)
+    # the dimensions of the worksheets are only an estimation of the number of rows (the tables stop at the first
+    # blank row). They are read from the file before the tables reset them (see excel.reset_read_only_dimensions) and
+    # can be wrong: no estimate (None) if they give no row.
+    rows_total = sum(max((worksheet.max_row or 1) - 1, 0) for name, worksheet in worksheets) or None
+    _update_claimed_job(job, rows_total=rows_total, warnings=warnings)
+    job.rows_total = rows_total
+    job.warnings = warnings
+
+    for table_name, worksheet in worksheets:
+        schema = get_return_type_schema(return_type, table_name)
+        rows = excel.TableData(worksheet).rows_by_col_header_it()
+        row_number = 0
+        for batch in _iter_batches(rows, BATCH_SIZE):
+            upload_rows = []
+            for validated_row in schema.validate_rows(batch):
+                for validation in validated_row.values():
+                    validation['value'] = _format_value(validation.get('value'))
+                upload_rows.append(ReturnUploadRow(
+                    job=job,
+                    table_name=table_name,
+                    row_number=row_number,
+                    data=validated_row,
+                    has_error=any(validation.get('error') for validation in validated_row.values())
+                ))
+                row_number += 1
+            job.rows_count += len(upload_rows)
+            job.errors_count += len([upload_row for upload_row in upload_rows if upload_row.has_error])
+            with transaction.atomic():
+                # the job is checked (and locked) before the rows are written
+                _update_claimed_job(job, rows_count=job.rows_count, errors_count=job.errors_count)
+                ReturnUploadRow.objects.bulk_create(upload_rows)
+
+
+def process_upload_job(job):
+    """
+    Validate the spreadsheet of a claimed job (see claim_upload_job) and save its validated rows.
+    The spreadsheet is streamed (read-only workbook) and validated by batches of rows. The progress is saved after
+    each batch so it can be polled (see get_upload_job_status).
+    The spreadsheet file is deleted once processed.
+    If the job is claimed again by another worker meanwhile, it is left to the other worker.
+    """
+    try:
+        with transaction.atomic():
+            # a job can be run again after a worker failure
+            _update_claimed_job(job, rows_count=0, errors_count=0)
+            job.rows.all().delete()
+        job.rows_count = job.errors_count = 0
+        try:
+            job.spreadsheet.open('rb')
+            try:
+                workbook = excel.load_workbook_content(job.spreadsheet, read_only=True)
+                try:
+                    _validate_worksheets(job, workbook)
+                finally:
+                    excel.close_workbook(workbook)
+            finally:
+                job.spreadsheet.close()
+        except UploadJobLost:
+            raise
+        except Exception as e:
+            logger.exception('Return upload job {} failed: {}'.format(job.pk, e))
+            with transaction.atomic():
+                _update_claimed_job(job, rows_count=0, errors_count=0)
+                job.rows.all().delete()
+            job.status = 'failed'
+            job.error = FAILED_MESSAGE
+            job.rows_count = job.errors_count = 0
+        else:
+            job.status = 'done'
+        job.finished = timezone.now()
+        _update_claimed_job(job, status=job.status, error=job.error, finished=job.finished,
+                            rows_count=job.rows_count, errors_count=job.errors_count)
+    except UploadJobLost as e:
+        logger.warning(str(e))
+        job.refresh_from_db()
+        return job
+    if job.spreadsheet:
+        job.spreadsheet.delete(save=False)
+        ReturnUploadJob.objects.filter(pk=job.pk).update(spreadsheet='')
+    return job
+
+
+def purge_upload_jobs():
+    """
+    Delete the finished jobs older than settings.WL_RETURN_UPLOAD_JOB_RETENTION_DAYS
+    """
+    days = getattr(settings, 'WL_RETURN_UPLOAD_JOB_RETENTION_DAYS', 7)
+    limit = timezone.now() - datetime.timedelta(days=days)
+    return ReturnUploadJob.objects.filter(status__in=ReturnUploadJob.FINISHED_STATUSES, finished__lt=limit).delete()
+
+
+def get_upload_job_status(job):
+    """
+    :return: the progress of the job and, once finished, the first rows with errors:
+    {
+        'status': 'pending'|'running'|'done'|'failed',
+        'finished': bool,
+        'rowsCount': number of rows validated,
+        'rowsTotal': estimation of the number of rows or null,
+        'errorsCount': number of rows with errors,
+        'warnings': ['Missing worksheet ...'],
+        'error': failure message,
+        'errors': [{'table': table_name, 'row': row_number (from 1), 'errors': {field_name: msg}}]
+    }
+    """
+    errors = []
+    if job.status == 'done' and job.errors_count:
+        error_rows = job.rows.filter(has_error=True).order_by('table_name', 'row_number')[:STATUS_MAX_ERRORS]
+        for table_name, row_number, data in error_rows.values_list('table_name', 'row_number', 'data'):
+            errors.append({
+                'table': table_name,
+                'row': row_number + 1,
+                'errors': dict((field_name, validation.get('error')) for field_name, validation in data.items()
+                               if validation.get('error'))
+            })
+    return {
+        'status': job.status,
+        'finished': job.is_finished,
+        'rowsCount': job.rows_count,
+        'rowsTotal': job.rows_total,
+        'errorsCount': job.errors_count,
+        'warnings': job.warnings,
+        'error': job.error,
+        'errors': errors
+    }
+
+
+def get_upload_job_tables(job):
+    """
+    :return: the validated rows of a processed job by table: {table_name: [validated_row, ...]}
+    """
+    tables = {}
+    rows = job.rows.order_by('table_name', 'row_number').values_list('table_name', 'data')
+    for table_name, data in rows.iterator():
+        tables.setdefault(table_name, []).append(data)
+    return tables
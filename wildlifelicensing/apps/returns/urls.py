@@ -3,10 +3,12 @@ from django.conf.urls import url, include
 from wildlifelicensing.apps.returns.api.urls import urlpatterns as api_urlpatterns
 
 from wildlifelicensing.apps.returns.views import EnterReturnView, CurateReturnView, ViewReturnReadonlyView, \
-    AddReturnLogEntryView, ReturnLogListView, DownloadReturnTemplate, AmendmentRequestView
+    AddReturnLogEntryView, ReturnLogListView, DownloadReturnTemplate, AmendmentRequestView, ReturnUploadJobStatusView
 
 urlpatterns = [
     url('^enter-return/([0-9]+)/$', EnterReturnView.as_view(), name='enter_return'),
+    url('^enter-return/([0-9]+)/upload-status/([0-9]+)/$', ReturnUploadJobStatusView.as_view(),
+        name='upload_status'),
     url('^curate-return/([0-9]+)/$', CurateReturnView.as_view(), name='curate_return'),
     url('^view-return/([0-9]+)/$', ViewReturnReadonlyView.as_view(), name='view_return'),
     url('^download-template/([0-9]+)/?$', DownloadReturnTemplate.as_view(), name='download_return_template'),
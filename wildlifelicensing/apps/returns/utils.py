@@ -1,9 +1,22 @@
-from datetime import date
-from wildlifelicensing.apps.returns.models import Return
+from collections import defaultdict, deque
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Q, Case, When, Value, IntegerField, CharField, F
+
+from wildlifelicensing.apps.applications.models import Application
+from wildlifelicensing.apps.returns.models import Return, ReturnRow
 from dateutil.relativedelta import relativedelta
 
 RETURN_STATUSES = dict(Return.STATUS_CHOICES)
 
+DUE_SOON_DAYS = 14
+
+# urgency of a return, in increasing order so the returns can be sorted on it
+URGENCY_NONE = 0
+URGENCY_DUE_SOON = 1
+URGENCY_OVERDUE = 2
+
 
 def create_returns_due_dates(start_date, end_date, monthly_frequency):
     due_dates = []
@@ -27,18 +40,159 @@ def create_returns_due_dates(start_date, end_date, monthly_frequency):
     return due_dates
 
 
+def get_licence_proxy_user(licence):
+    """
+    :return: the proxy applicant (officer) of the application the licence has been issued for or None
+    """
+    application = Application.objects.filter(licence=licence, proxy_applicant__isnull=False).order_by('id').last()
+    return application.proxy_applicant if application is not None else None
+
+
 def is_return_overdue(ret):
     status = ret.status
     return status in Return.CUSTOMER_EDITABLE_STATE and ret.due_date <= date.today()
 
 
 def is_return_due_soon(ret):
-    days_soon = 14
+    days_soon = DUE_SOON_DAYS
     status = ret.status
     return status in Return.CUSTOMER_EDITABLE_STATE and (ret.due_date - date.today()).days < days_soon or is_return_overdue(ret)
 
 
+def get_urgency_query(urgency, today=None):
+    """
+    The database version of is_return_overdue and is_return_due_soon. The query is on (status, due_date) so it can use
+    the index of the returns.
+    :param urgency: URGENCY_OVERDUE or URGENCY_DUE_SOON (that includes the overdue returns, like is_return_due_soon)
+    :param today: the date of the comparison, default to today.
+    :return: a Q instance
+    """
+    today = today or date.today()
+    if urgency == URGENCY_OVERDUE:
+        due_date_query = Q(due_date__lte=today)
+    else:
+        due_date_query = Q(due_date__lt=today + timedelta(days=DUE_SOON_DAYS))
+    return Q(status__in=Return.CUSTOMER_EDITABLE_STATE) & due_date_query
+
+
+def annotate_urgency(qs, today=None):
+    """
+    Annotate the returns with their 'urgency' (URGENCY_OVERDUE, URGENCY_DUE_SOON or URGENCY_NONE) computed by the
+    database, so the returns can be ordered by urgency.
+    :param qs: a Return queryset
+    :param today: the date of the comparison, default to today.
+    :return: the annotated queryset
+    """
+    return qs.annotate(urgency=Case(
+        When(get_urgency_query(URGENCY_OVERDUE, today), then=Value(URGENCY_OVERDUE)),
+        When(get_urgency_query(URGENCY_DUE_SOON, today), then=Value(URGENCY_DUE_SOON)),
+        default=Value(URGENCY_NONE),
+        output_field=IntegerField()
+    ))
+
+
+def get_return_urgency(ret):
+    """
+    :return: the urgency annotated by annotate_urgency or computed from the return if not annotated
+    """
+    urgency = getattr(ret, 'urgency', None)
+    if urgency is not None:
+        return urgency
+    if is_return_overdue(ret):
+        return URGENCY_OVERDUE
+    elif is_return_due_soon(ret):
+        return URGENCY_DUE_SOON
+    return URGENCY_NONE
+
+
 def format_return(instance, attrs):
     attrs['status'] = RETURN_STATUSES[attrs['status']]
 
     return attrs
+
+
+# above this number of changed rows, the changed rows are deleted and inserted again instead of being updated one by
+# one (ex: a new spreadsheet uploaded).
+MAX_ROW_UPDATES = 100
+
+# number of rows per statement
+ROWS_BATCH_SIZE = 500
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def save_return_table_rows(return_table, rows):
+    """
+    Save the rows of a return table, writing only the rows that changed. The rows are compared with the existing
+    ones by their content hash (ReturnRow.row_hash):
+    - the existing rows with the same content are kept, only their position is updated if they moved.
+    - the other existing rows are updated with the other new rows (or deleted and inserted again if there are more
+    than MAX_ROW_UPDATES of them).
+    - the extra existing rows are deleted, the extra new rows are inserted.
+    Everything is done in one transaction with batched statements.
+    :param return_table: a ReturnTable
+    :param rows: list of row data (dict) in the table order
+    :return: {'inserted': n, 'updated': n, 'deleted': n, 'moved': n}
+    """
+    hashes = [ReturnRow.get_data_hash(row) for row in rows]
+    with transaction.atomic():
+        existing = list(return_table.returnrow_set.order_by('position', 'id')
+                        .values_list('pk', 'position', 'row_hash'))
+        # rows saved before the hashes existed
+        missing_hashes = {}
+        no_hash_pks = [pk for pk, position, row_hash in existing if row_hash is None]
+        if no_hash_pks:
+            for pk, data in ReturnRow.objects.filter(pk__in=no_hash_pks).values_list('pk', 'data'):
+                missing_hashes[pk] = ReturnRow.get_data_hash(data)
+            existing = [(pk, position, row_hash or missing_hashes[pk]) for pk, position, row_hash in existing]
+
+        existing_by_hash = defaultdict(deque)
+        for pk, position, row_hash in existing:
+            existing_by_hash[row_hash].append((pk, position))
+        # new row index -> (pk, position) of the same existing row
+        kept = {}
+        for index, row_hash in enumerate(hashes):
+            if existing_by_hash.get(row_hash):
+                kept[index] = existing_by_hash[row_hash].popleft()
+        # the other existing rows in the table order
+        free_rows = [row for rows_by_hash in existing_by_hash.values() for row in rows_by_hash]
+        free_pks = [pk for pk, position in sorted(free_rows, key=lambda row: (row[1], row[0]))]
+        new_indexes = [index for index in range(len(rows)) if index not in kept]
+
+        if len(free_pks) and len(new_indexes) > MAX_ROW_UPDATES:
+            to_update = []
+            to_delete = free_pks
+            to_insert = new_indexes
+        else:
+            to_update = list(zip(free_pks, new_indexes))
+            to_delete = free_pks[len(new_indexes):]
+            to_insert = new_indexes[len(free_pks):]
+
+        for chunk in _chunks(to_delete, ROWS_BATCH_SIZE):
+            ReturnRow.objects.filter(pk__in=chunk).delete()
+        for pk, index in to_update:
+            ReturnRow.objects.filter(pk=pk).update(data=rows[index], row_hash=hashes[index], position=index)
+        ReturnRow.objects.bulk_create([
+            ReturnRow(return_table=return_table, data=rows[index], row_hash=hashes[index], position=index)
+            for index in to_insert
+        ], batch_size=ROWS_BATCH_SIZE)
+
+        # the kept rows that moved and the hashes of the legacy rows
+        moved = dict((pk, index) for index, (pk, position) in kept.items() if position != index)
+        fixes = sorted(set(moved.keys()) | set(pk for index, (pk, position) in kept.items() if pk in missing_hashes))
+        for chunk in _chunks(fixes, ROWS_BATCH_SIZE):
+            ReturnRow.objects.filter(pk__in=chunk).update(
+                position=Case(*[When(pk=pk, then=Value(moved[pk])) for pk in chunk if pk in moved],
+                              default=F('position'), output_field=IntegerField()),
+                row_hash=Case(*[When(pk=pk, then=Value(missing_hashes[pk])) for pk in chunk if pk in missing_hashes],
+                              default=F('row_hash'), output_field=CharField())
+            )
+    return {
+        'inserted': len(to_insert),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+        'moved': len(moved),
+    }
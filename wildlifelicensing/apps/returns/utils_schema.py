@@ -1,8 +1,11 @@
 from __future__ import absolute_import, unicode_literals, print_function, division
 from future.utils import raise_with_traceback
 
+import copy
+import hashlib
 import json
 import re
+import threading
 
 from dateutil.parser import parse as date_parse
 
@@ -237,6 +240,30 @@ class SchemaField:
                 error = "The value must be one the following: {}".format(values)
         return error
 
+    def column_validation_errors(self, values):
+        """
+        Validate a column of values.
+        Same as [self.validation_error(value) for value in values] but every distinct value is cast only once. The
+        columns of a return are full of repeated values (species, dates, datum, zone...).
+        :param values: list of values
+        :return: list of None or error message
+        """
+        validation_error = self.validation_error
+        errors_by_value = {}
+        errors = []
+        for value in values:
+            # the type is part of the key: 1, 1.0 and True are equal but don't validate the same way.
+            key = (type(value), value)
+            try:
+                error = errors_by_value[key]
+            except KeyError:
+                error = errors_by_value[key] = validation_error(value)
+            except TypeError:
+                # not hashable
+                error = validation_error(value)
+            errors.append(error)
+        return errors
+
     def __str__(self):
         return '{}'.format(self.name)
 
@@ -277,6 +304,18 @@ class Schema:
         self.schema_model = SchemaModel(schema)
         self.fields = [SchemaField(f) for f in self.schema_model.fields]
         self.species_fields = self.find_species_fields(self)
+        # lookups used for every validated row
+        self._field_names = [f.name for f in self.fields]
+        self._fields_by_name = {}
+        self._fields_by_lower_name = {}
+        for f in self.fields:
+            # the first field wins, like a search through the fields
+            self._fields_by_name.setdefault(f.name, f)
+            self._fields_by_lower_name.setdefault(f.name.lower(), f)
+        lower_names = set(self._fields_by_lower_name.keys())
+        self._lat_long_easting_northing = all(
+            name in lower_names for name in ['latitude', 'longitude', 'easting', 'northing', 'zone']
+        )
 
     # implement some dict like methods
     def __getitem__(self, item):
@@ -303,16 +342,12 @@ class Schema:
 
     @property
     def field_names(self):
-        return [f.name for f in self.fields]
+        return list(self._field_names)
 
     def get_field_by_mame(self, name, icase=False):
         if icase and name:
-            name = name.lower()
-        for f in self.fields:
-            field_name = f.name.lower() if icase else f.name
-            if field_name == name:
-                return f
-        return None
+            return self._fields_by_lower_name.get(name.lower())
+        return self._fields_by_name.get(name)
 
     def field_validation_error(self, field_name, value):
         field = self.get_field_by_mame(field_name)
@@ -330,14 +365,7 @@ class Schema:
         True if there is a latitude, longitude, easting, northing, and zone field
         :return:
         """
-        field_names = [name.lower() for name in self.field_names]
-        return all([
-            'latitude' in field_names,
-            'longitude' in field_names,
-            'easting' in field_names,
-            'northing' in field_names,
-            'zone' in field_names
-        ])
+        return self._lat_long_easting_northing
 
     def post_validate_lat_long_easting_northing(self, field_validation):
         """
@@ -375,6 +403,88 @@ class Schema:
                 long_validation['error'] = None
         return field_validation
 
+    def post_validate_lat_long_easting_northing_columns(self, columns, errors):
+        """
+        Same rules as post_validate_lat_long_easting_northing but applied on a whole table in columnar form.
+        :param columns: {field_name: [value, ...]}
+        :param errors: {field_name: [None|msg, ...]} the result of the field validation of the columns (see
+        validate_columns()). The errors are updated in place.
+        :return: errors
+        """
+        if not self.is_lat_long_easting_northing_schema():
+            return errors
+        num_rows = len(next(iter(columns.values()))) if columns else 0
+        blank_column = [None] * num_rows
+        lat_name, north_name, long_name, east_name, zone_name = [
+            self.get_field_by_mame(name, icase=True).name
+            for name in ['latitude', 'northing', 'longitude', 'easting', 'zone']
+        ]
+
+        def clear_error(field_name, index):
+            if field_name in errors:
+                errors[field_name][index] = None
+
+        lat_values, north_values, long_values, east_values = [
+            columns.get(name, blank_column) for name in [lat_name, north_name, long_name, east_name]
+        ]
+        for index, (lat, north, lng, east) in enumerate(zip(lat_values, north_values, long_values, east_values)):
+            if lat and lng:
+                if not north:
+                    clear_error(north_name, index)
+                    clear_error(zone_name, index)
+                if not east:
+                    clear_error(east_name, index)
+                    clear_error(zone_name, index)
+            if east and north:
+                if not lat:
+                    clear_error(lat_name, index)
+                if not lng:
+                    clear_error(long_name, index)
+        return errors
+
+    def validate_columns(self, columns):
+        """
+        Validate a table in columnar form. Each column is validated in one pass by its field (see
+        SchemaField.column_validation_errors) then the lat/long easting/northing rules are applied over the columns.
+        :param columns: {field_name: [value, ...]} all the columns must have the same length.
+        :return: {field_name: [None|msg, ...]}
+        """
+        errors = {}
+        for field_name, values in columns.items():
+            field = self.get_field_by_mame(field_name)
+            if field is None:
+                raise Exception("The field '{}' doesn't exists in the schema. Should be one of {}"
+                                .format(field_name, self.field_names))
+            errors[field_name] = field.column_validation_errors(values)
+        return self.post_validate_lat_long_easting_northing_columns(columns, errors)
+
+    def validate_rows(self, rows):
+        """
+        Validate a table in one go. The result is the same as list(rows_validator(rows)) but the validation is done
+        by column (see validate_columns).
+        :param rows: list of dictionaries or lists of key value
+        :return: list of validated rows (see validate_row())
+        """
+        rows = [dict(row) for row in rows]
+        if not rows:
+            return []
+        # rows with the same fields as the first one are validated by column, the others (if any) one by one.
+        field_names = list(rows[0].keys())
+        field_names_set = set(field_names)
+        table_indexes = [index for index, row in enumerate(rows) if six.viewkeys(row) == field_names_set]
+        columns = dict((name, [rows[index][name] for index in table_indexes]) for name in field_names)
+        errors = self.validate_columns(columns)
+        result = [None] * len(rows)
+        for position, index in enumerate(table_indexes):
+            result[index] = dict((name, {
+                'value': columns[name][position],
+                'error': errors[name][position]
+            }) for name in field_names)
+        for index, row in enumerate(rows):
+            if result[index] is None:
+                result[index] = self.validate_row(row)
+        return result
+
     def validate_row(self, row):
         """
         The row must be a dictionary or a list of key value
@@ -421,16 +531,59 @@ class Schema:
         return len(self.get_error_fields(row)) == 0
 
     def is_all_valid(self, rows):
-        for row in rows:
-            if not self.is_row_valid(row):
-                return False
+        for validated_row in self.validate_rows(rows):
+            for data in validated_row.values():
+                if data.get('error'):
+                    return False
         return True
 
 
+# compiled schemas: {(return_type.pk, resource_name): (descriptor hash, Schema)}, see get_return_type_schema
+_COMPILED_SCHEMAS = {}
+_COMPILED_SCHEMAS_LOCK = threading.Lock()
+
+
+def _get_descriptor_hash(descriptor):
+    return hashlib.md5(json.dumps(descriptor, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_return_type_schema(return_type, resource_name):
+    """
+    Same as Schema(return_type.get_schema_by_name(resource_name)) but the Schema is compiled once per process and
+    reused until the descriptor of the resource changes. The Schema must be used read-only.
+    :param return_type: a ReturnType
+    :param resource_name:
+    :return: a Schema
+    """
+    descriptor = return_type.get_schema_by_name(resource_name)
+    if return_type.pk is None:
+        return Schema(descriptor)
+    key = (return_type.pk, resource_name)
+    descriptor_hash = _get_descriptor_hash(descriptor)
+    cached = _COMPILED_SCHEMAS.get(key)
+    if cached is not None and cached[0] == descriptor_hash:
+        return cached[1]
+    # a copy so the cached schema doesn't share the descriptor of the return type instance
+    schema = Schema(copy.deepcopy(descriptor))
+    with _COMPILED_SCHEMAS_LOCK:
+        _COMPILED_SCHEMAS[key] = (descriptor_hash, schema)
+    return schema
+
+
+def clear_return_type_schemas(return_type_pk=None):
+    """
+    Remove the compiled schemas of a return type or all of them if return_type_pk is None.
+    """
+    with _COMPILED_SCHEMAS_LOCK:
+        for key in list(_COMPILED_SCHEMAS.keys()):
+            if return_type_pk is None or key[0] == return_type_pk:
+                del _COMPILED_SCHEMAS[key]
+
+
 def create_return_template_workbook(return_type):
     wb = Workbook(write_only=True)
     for resource in return_type.resources:
-        schema = Schema(resource.get('schema'))
+        schema = get_return_type_schema(return_type, resource.get('name'))
         ws = wb.create_sheet()
         ws.title = resource.get('title', resource.get('name'))
         headers = []
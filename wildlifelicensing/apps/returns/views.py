@@ -1,27 +1,25 @@
 import os
-import shutil
-import tempfile
 import datetime
 
 from django.views.generic.base import TemplateView, View
 from django.shortcuts import render, get_object_or_404, redirect
-from django.conf import settings
+from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.db import transaction
 from django.http.response import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 from preserialize.serialize import serialize
 
 from ledger.accounts.models import Document
-from wildlifelicensing.apps.returns.models import Return, ReturnTable, ReturnRow, ReturnLogEntry, ReturnType, \
-    ReturnAmendmentRequest
+from wildlifelicensing.apps.returns.models import Return, ReturnTable, ReturnLogEntry, ReturnType, \
+    ReturnAmendmentRequest, ReturnUploadJob
 from wildlifelicensing.apps.main import excel
 from wildlifelicensing.apps.returns.forms import UploadSpreadsheetForm, NilReturnForm, ReturnsLogEntryForm,\
     ReturnAmendmentRequestForm
-from wildlifelicensing.apps.returns.utils_schema import Schema, create_return_template_workbook
-from wildlifelicensing.apps.returns.utils import format_return
+from wildlifelicensing.apps.returns.utils_schema import get_return_type_schema, create_return_template_workbook
+from wildlifelicensing.apps.returns.utils import format_return, save_return_table_rows
+from wildlifelicensing.apps.returns.uploads import create_upload_job, get_upload_job_status, get_upload_job_tables
 from wildlifelicensing.apps.returns.signals import return_submitted
 from wildlifelicensing.apps.main.helpers import is_officer
 from wildlifelicensing.apps.main.serializers import WildlifeLicensingJSONEncoder
@@ -38,13 +36,16 @@ RETURNS_APP_PATH = os.path.join(os.path.dirname(__file__), 'excel_templates')
 
 DATE_FORMAT = '%d/%m/%Y'
 
+# query parameter of the enter return page with the upload job to show
+UPLOAD_JOB_PARAM = 'upload'
+
 
 def _is_post_data_valid(ret, tables_info, post_data):
     for table in tables_info:
         table_rows = _get_table_rows_from_post(table.get('name'), post_data)
         if len(table_rows) == 0:
             return False
-        schema = Schema(ret.return_type.get_schema_by_name(table.get('name')))
+        schema = get_return_type_schema(ret.return_type, table.get('name'))
         if not schema.is_all_valid(table_rows):
             return False
     return True
@@ -52,8 +53,8 @@ def _is_post_data_valid(ret, tables_info, post_data):
 
 def _get_validated_rows_from_post(ret, table_name, post_data):
     rows = _get_table_rows_from_post(table_name, post_data)
-    schema = Schema(ret.return_type.get_schema_by_name(table_name))
-    return list(schema.rows_validator(rows))
+    schema = get_return_type_schema(ret.return_type, table_name)
+    return schema.validate_rows(rows)
 
 
 def _get_table_rows_from_post(table_name, post_data):
@@ -79,14 +80,13 @@ def _get_table_rows_from_post(table_name, post_data):
 
 
 def _create_return_data_from_post_data(ret, tables_info, post_data):
-    for table in tables_info:
-        rows = _get_table_rows_from_post(table.get('name'), post_data)
-        if rows:
-            return_table = ReturnTable.objects.get_or_create(name=table.get('name'), ret=ret)[0]
-            # delete any existing rows as they will all be recreated
-            return_table.returnrow_set.all().delete()
-            return_rows = [ReturnRow(return_table=return_table, data=row) for row in rows]
-            ReturnRow.objects.bulk_create(return_rows)
+    with transaction.atomic():
+        for table in tables_info:
+            rows = _get_table_rows_from_post(table.get('name'), post_data)
+            if rows:
+                return_table = ReturnTable.objects.get_or_create(name=table.get('name'), ret=ret)[0]
+                # only the changed rows are written
+                save_return_table_rows(return_table, rows)
 
 
 class EnterReturnView(UserCanEditReturnMixin, TemplateView):
@@ -127,6 +127,30 @@ class EnterReturnView(UserCanEditReturnMixin, TemplateView):
 
         messages.success(self.request, message)
 
+    def _set_upload_job_context(self, ret, context):
+        """
+        The page of an upload job: the progress is polled while the job is running, the tables are filled with the
+        validated rows once done.
+        """
+        job_id = self.request.GET.get(UPLOAD_JOB_PARAM, '')
+        if not job_id.isdigit():
+            return
+        job = ReturnUploadJob.objects.filter(pk=job_id, ret=ret).first()
+        if job is None:
+            return
+        context['upload_job'] = job
+        if job.status == 'failed':
+            messages.error(self.request, job.error)
+        elif job.status == 'done':
+            if job.errors_count:
+                messages.error(self.request, "Your return contains some errors. See below.")
+            for warning in job.warnings:
+                messages.warning(self.request, warning)
+            job_tables = get_upload_job_tables(job)
+            for table in context['tables']:
+                if table.get('name') in job_tables:
+                    table['data'] = job_tables[table.get('name')]
+
     def get_context_data(self, **kwargs):
         ret = get_object_or_404(Return, pk=self.args[0])
 
@@ -136,7 +160,7 @@ class EnterReturnView(UserCanEditReturnMixin, TemplateView):
 
         for resource in ret.return_type.resources:
             resource_name = resource.get('name')
-            schema = Schema(resource.get('schema'))
+            schema = get_return_type_schema(ret.return_type, resource_name)
             headers = []
             for f in schema.fields:
                 header = {
@@ -153,14 +177,17 @@ class EnterReturnView(UserCanEditReturnMixin, TemplateView):
             }
             try:
                 return_table = ret.returntable_set.get(name=resource_name)
-                rows = [return_row.data for return_row in return_table.returnrow_set.all()]
-                validated_rows = list(schema.rows_validator(rows))
+                rows = [return_row.data for return_row in return_table.returnrow_set.order_by('position', 'id')]
+                validated_rows = schema.validate_rows(rows)
                 table['data'] = validated_rows
             except ReturnTable.DoesNotExist:
                 pass
 
             kwargs['tables'].append(table)
 
+        if self.request.method == 'GET':
+            self._set_upload_job_context(ret, kwargs)
+
         if 'upload_spreadsheet_form' not in kwargs:
             kwargs['upload_spreadsheet_form'] = UploadSpreadsheetForm()
         kwargs['nil_return_form'] = NilReturnForm()
@@ -179,35 +206,10 @@ class EnterReturnView(UserCanEditReturnMixin, TemplateView):
             form = UploadSpreadsheetForm(request.POST, request.FILES)
 
             if form.is_valid():
-                temp_file_dir = tempfile.mkdtemp(dir=settings.MEDIA_ROOT)
-                try:
-                    data = form.cleaned_data.get('spreadsheet_file')
-                    path = default_storage.save(os.path.join(temp_file_dir, str(data)), ContentFile(data.read()))
-
-                    workbook = excel.load_workbook_content(path)
-
-                    for table in context['tables']:
-                        worksheet = excel.get_sheet(workbook, table.get('title')) \
-                            or excel.get_sheet(workbook, table.get('name'))
-                        if worksheet is not None:
-                            table_data = excel.TableData(worksheet)
-                            schema = Schema(ret.return_type.get_schema_by_name(table.get('name')))
-                            excel_rows = list(table_data.rows_by_col_header_it())
-                            has_errors = not schema.is_all_valid(excel_rows)
-                            if has_errors:
-                                messages.error(request, "Your return contains some errors. See below.")
-                            validated_rows = list(schema.rows_validator(excel_rows))
-                            # We want to stringify the datetime/date that might have been created by the excel parser
-                            for vr in validated_rows:
-                                for col, validation in vr.items():
-                                    value = validation.get('value')
-                                    if isinstance(value, datetime.datetime) or isinstance(value, datetime.date):
-                                        validation['value'] = value.strftime(DATE_FORMAT)
-                            table['data'] = validated_rows
-                        else:
-                            messages.warning(request, 'Missing worksheet ' + table.get('name'))
-                finally:
-                    shutil.rmtree(temp_file_dir)
+                # the spreadsheet is validated by the process_return_uploads worker, the page polls the job status.
+                job = create_upload_job(ret, request.user, form.cleaned_data.get('spreadsheet_file'))
+                return redirect('{}?{}={}'.format(reverse('wl_returns:enter_return', args=[ret.pk]),
+                                                  UPLOAD_JOB_PARAM, job.pk))
             else:
                 context['upload_spreadsheet_form'] = form
 
@@ -256,6 +258,16 @@ class EnterReturnView(UserCanEditReturnMixin, TemplateView):
         return render(request, self.template_name, context)
 
 
+class ReturnUploadJobStatusView(UserCanEditReturnMixin, View):
+    """
+    The progress of a spreadsheet upload (see returns.uploads.get_upload_job_status), polled by the enter return page.
+    """
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(ReturnUploadJob, pk=args[1], ret__pk=args[0])
+        return JsonResponse(get_upload_job_status(job))
+
+
 class CurateReturnView(UserCanCurateReturnMixin, EnterReturnView):
     template_name = 'wl/curate_return.html'
     login_url = '/'
@@ -331,12 +343,12 @@ class ViewReturnReadonlyView(UserCanViewReturnMixin, TemplateView):
 
         for resource in ret.return_type.resources:
             resource_name = resource.get('name')
-            schema = Schema(resource.get('schema'))
+            schema = get_return_type_schema(ret.return_type, resource_name)
             table = {'name': resource_name, 'title': resource.get('title', resource.get('name')),
                      'headers': schema.headers}
             try:
                 return_table = ret.returntable_set.get(name=resource_name)
-                table['data'] = [return_row.data for return_row in return_table.returnrow_set.all()]
+                table['data'] = [return_row.data for return_row in return_table.returnrow_set.order_by('position', 'id')]
             except ReturnTable.DoesNotExist:
                 pass
 
@@ -78,4 +78,16 @@ CACHES = {
 NOMOS_BLOB_URL = env("NOMOS_BLOB_URL")
 NOMOS_KINGDOM_IDS_LIST = env("NOMOS_KINGDOM_IDS_LIST", default=[1,2,5,6])
 NOMOS_MAXIMUM_SEARCH_RESULTS = env("NOMOS_MAXIMUM_SEARCH_RESULTS", default=30)
-NOMOS_FETCH_FAUNA_CRON_TIME_OF_DAY = env("NOMOS_FETCH_FAUNA_CRON_TIME_OF_DAY", default="00:00")
\ No newline at end of file
+NOMOS_FETCH_FAUNA_CRON_TIME_OF_DAY = env("NOMOS_FETCH_FAUNA_CRON_TIME_OF_DAY", default="00:00")
+# time in seconds the dashboard tree counts are cached (0 to disable). The cache is also invalidated on data changes.
+WL_DASHBOARD_CACHE_TTL = env('WL_DASHBOARD_CACHE_TTL', 300)
+# time in seconds a page of the dashboard datatables can be cached (0 to disable). See DataTableBaseView.PAGE_CACHE
+WL_DATATABLE_CACHE_TTL = env('WL_DATATABLE_CACHE_TTL', 60)
+# where the dashboard datatables state (order, search, filters) is saved: 'session' or 'user' (TablePreferences)
+WL_DATATABLE_PREFERENCES_STORE = env('WL_DATATABLE_PREFERENCES_STORE', 'session')
+# return spreadsheet uploads are validated by the process_return_uploads worker command (see returns.uploads):
+# seconds between two polls of the worker, seconds after which a running job is considered dead and run again, and
+# days the finished jobs (and their validated rows) are kept.
+WL_RETURN_UPLOAD_POLL_INTERVAL = env('WL_RETURN_UPLOAD_POLL_INTERVAL', 2)
+WL_RETURN_UPLOAD_JOB_TIMEOUT = env('WL_RETURN_UPLOAD_JOB_TIMEOUT', 1800)
+WL_RETURN_UPLOAD_JOB_RETENTION_DAYS = env('WL_RETURN_UPLOAD_JOB_RETENTION_DAYS', 7)
@@ -3,9 +3,10 @@ define(
         'jQuery',
         'datatables.net',
         'datatables.bootstrap',
-        'datatables.datetime'
+        'datatables.datetime',
+        'moment'
     ],
-    function ($) {
+    function ($, dataTables, bootstrap, datetime, moment) {
         'use strict';
 
         var defaultOptions = {
@@ -18,6 +19,74 @@ define(
             autowidth: true
         };
 
+        // the actions of the returns tables: [url name, text], same as RETURN_ACTIONS of the dashboard views.
+        var returnActions = {
+            enter: ['enter_return', 'Enter Return'],
+            edit: ['enter_return', 'Edit Return'],
+            amend: ['enter_return', 'Amend Return'],
+            curate: ['curate_return', 'Curate Return'],
+            view: ['view_return', 'View Return (read-only)']
+        };
+
+        // The renderers of the compact values sent by the server (see the compact mode of DataTableBaseView).
+        // A column uses one with the name in its 'compact' option. A renderer is called with the value of the cell, the
+        // column options and the url templates of the response ('{0}' in place of the pk) and returns the html.
+        var compactRenderers = {
+            date: function (value) {
+                return value ? moment(value, 'YYYY-MM-DD').format('DD/MM/YYYY') : '';
+            },
+            returnStatus: function (value, column) {
+                var status = value[0],
+                    urgency = value[1],
+                    nilReturn = value[2];
+                if (status === 'current') {
+                    if (urgency === 2) {
+                        return '<span class="label label-danger">Overdue</span>';
+                    } else if (urgency === 1) {
+                        return '<span class="label label-warning">Due soon</span>';
+                    }
+                    return 'Current';
+                }
+                return ((column.compactLabels || {})[status] || status) +
+                    (status === 'submitted' && nilReturn ? ' (Nil)' : '');
+            },
+            returnAction: function (value, column, urls) {
+                var action = returnActions[value[1]];
+                return '<a href="' + urls[action[0]].replace('{0}', value[0]) + '">' + action[1] + '</a>';
+            }
+        };
+
+        function initCompactColumns(selector, columnsOptions) {
+            // ask the server for the compact values if some columns can render them.
+            var response = {},
+                hasCompact = false,
+                columns;
+            if (!columnsOptions) {
+                return columnsOptions;
+            }
+            columns = $.map(columnsOptions, function (column) {
+                var renderer = column.compact && compactRenderers[column.compact];
+                if (!renderer) {
+                    return column;
+                }
+                hasCompact = true;
+                return $.extend({}, column, {
+                    render: function (data) {
+                        // the response can still be html (ex: error)
+                        return response.compact ? renderer(data, column, response.urls || {}) : data;
+                    }
+                });
+            });
+            if (hasCompact) {
+                $(selector).on('preXhr.dt', function (e, settings, data) {
+                    data.compact = true;
+                }).on('xhr.dt', function (e, settings, json) {
+                    response = json || {};
+                });
+            }
+            return columns;
+        }
+
         function decorateTable(table) {
             table.populate = function (data, append) {
                 if (data) {
@@ -54,7 +123,9 @@ define(
                 var options = {},
                     table;
                 $.fn.DataTable.ext.errMode = "throws";  // will throw a console error instead of an alert
-                $.extend(options, defaultOptions, tableOptions, {columns: columnsOptions});
+                $.extend(options, defaultOptions, tableOptions, {
+                    columns: initCompactColumns(selector, columnsOptions)
+                });
                 table = $(selector).DataTable(options);
                 // add some methods
                 return decorateTable(table);